@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2016, French National Center for Scientific Research (CNRS)
+# Distributed under the (new) BSD License. See LICENSE for more info.
+"""
+Compare compression methods on recorded data or on synthetic int16 signals.
+
+Usage::
+
+    python compression_benchmark.py [recording_dir [stream_name]]
+
+where *recording_dir* was written by RawRecorder.
+"""
+import os
+import sys
+import json
+import numpy as np
+
+from pyacq.core.stream.compression import benchmark_compression
+
+
+def load_raw_recording(dirname, stream_name=None):
+    with open(os.path.join(dirname, 'stream_properties.json')) as f:
+        props = json.load(f)
+    if stream_name is None:
+        stream_name = [k for k, v in props.items() if isinstance(v, dict)][0]
+    p = props[stream_name]
+    shape = (-1,) + tuple(p['shape'][1:])
+    return np.memmap(os.path.join(dirname, stream_name + '.raw'), dtype=p['dtype'],
+                     mode='r').reshape(shape)
+
+
+def synthetic_data(nb_frames=200000, nb_channels=16):
+    # slow random walk + noise, similar to amplified electrophysiology
+    walk = np.cumsum(np.random.normal(scale=4, size=(nb_frames, nb_channels)), axis=0)
+    noise = np.random.normal(scale=10, size=(nb_frames, nb_channels))
+    return np.clip(walk + noise, -2**15, 2**15-1).astype('int16')
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        data = load_raw_recording(*sys.argv[1:3])
+    else:
+        data = synthetic_data()
+    print('data: %s %s' % (data.dtype, data.shape))
+    benchmark_compression(data)
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2016, French National Center for Scientific Research (CNRS)
+# Distributed under the (new) BSD License. See LICENSE for more info.
+"""
+Compare the wake-up latency of transfer modes: time between OutputStream.send()
+in one thread and the return of InputStream.poll() + recv() in another.
+"""
+import time
+import threading
+import numpy as np
+
+from pyacq.core.stream import OutputStream, InputStream, all_transfermodes
+
+
+def benchmark_latency(transfermode, protocol='tcp', chunksize=16, nb_channels=16,
+                      nloop=2000, interval=0.0005):
+    stream_spec = dict(protocol=protocol, transfermode=transfermode,
+                       dtype='float64', shape=(-1, nb_channels),
+                       buffer_size=chunksize*nloop, double=True)
+    outstream = OutputStream()
+    outstream.configure(**stream_spec)
+    instream = InputStream()
+    instream.connect(outstream)
+    time.sleep(.5)
+
+    send_times = np.zeros(nloop)
+    def sender():
+        arr = np.zeros((chunksize, nb_channels), dtype='float64')
+        for i in range(nloop):
+            time.sleep(interval)
+            send_times[i] = time.perf_counter()
+            outstream.send(arr)
+
+    thread = threading.Thread(target=sender)
+    thread.start()
+    latencies = []
+    last_index = 0
+    while last_index < chunksize * nloop:
+        if not instream.poll(timeout=1000):
+            break
+        index, _ = instream.recv()
+        now = time.perf_counter()
+        # latency of the last chunk included in this packet
+        latencies.append(now - send_times[index // chunksize - 1])
+        last_index = index
+    thread.join()
+
+    outstream.close()
+    instream.close()
+
+    latencies = np.array(latencies) * 1e6
+    print('%s %s  median = %0.1f us   p99 = %0.1f us   max = %0.1f us' % (
+          transfermode.ljust(16), protocol.ljust(6), np.median(latencies),
+          np.percentile(latencies, 99), latencies.max()))
+    return latencies
+
+
+if __name__ == '__main__':
+    for transfermode in ['plaindata', 'sharedmem', 'sharedmem_futex']:
+        if transfermode not in all_transfermodes:
+            print('%s not available' % transfermode)
+            continue
+        for protocol in ['tcp', 'inproc']:
+            benchmark_latency(transfermode, protocol=protocol)
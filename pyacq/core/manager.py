@@ -181,6 +181,15 @@ class Manager(object):
         for ng in self.nodegroups.values():
             ng.stop_all_nodes()
 
+    def get_stream_stats(self):
+        """Return the stream statistics of all nodes, as a dict of
+        `NodeGroup.get_stream_stats()` keyed by nodegroup name.
+        
+        Only streams configured with ``stats=True`` report counters.
+        """
+        return {name: ng.get_stream_stats() for name, ng in self.nodegroups.items()
+                if ng not in self._closed_nodegroups}
+
     def close_all_nodegroups(self):
         for ng in self.nodegroups.values():
             if ng in self._closed_nodegroups:
@@ -7,6 +7,7 @@ from pyqtgraph.util.mutex import Mutex
 
 from .nodelist import register_node_type
 from .stream import OutputStream, InputStream
+from .rpc import RPCServer, thread_safe
 from logging import info
 
 
@@ -56,6 +57,13 @@ class Node(object):
     * `Node.running()`
     * `Node.configured()`
     * `Node.initialized()`
+    
+    An RPCServer with a worker pool runs these without waiting for the other
+    calls to the node (see :func:`thread_safe`).
+
+    Each change of state (and each configuration or connection of its streams)
+    is reported to the RPC clients that cache attributes of the node (see
+    :func:`RPCServer.object_changed`).
     """
     _input_specs = {}
     _output_specs = {}
@@ -90,6 +98,7 @@ class Node(object):
         assert len(self.outputs)==1, 'Node.output is a shortcut when Node have only 1 output ({} here)'.format(len(self.outputs))
         return list(self.outputs.values())[0]
     
+    @thread_safe
     def running(self):
         """Return True if the Node is running.
         
@@ -98,6 +107,7 @@ class Node(object):
         with self.lock:
             return self._running
     
+    @thread_safe
     def configured(self):
         """Return True if the Node has already been configured.
         
@@ -106,6 +116,7 @@ class Node(object):
         with self.lock:
             return self._configured
 
+    @thread_safe
     def initialized(self):
         """Return True if the Node has already been initialized.
         
@@ -114,6 +125,7 @@ class Node(object):
         with self.lock:
             return self._initialized
     
+    @thread_safe
     def closed(self):
         """Return True if the Node has already been closed.
         
@@ -134,6 +146,7 @@ class Node(object):
         self._configure(**kargs)
         with self.lock:
             self._configured = True
+        RPCServer.object_changed(self)
     
     def initialize(self):
         """Initialize the Node.
@@ -148,6 +161,7 @@ class Node(object):
         self._initialize()
         with self.lock:
             self._initialized = True
+        RPCServer.object_changed(self)
 
     def start(self):
         """Start the Node.
@@ -173,6 +187,7 @@ class Node(object):
         self._start()
         with self.lock:
             self._running = True
+        RPCServer.object_changed(self)
 
     def stop(self):
         """Stop the Node (see `start()`).
@@ -183,6 +198,7 @@ class Node(object):
         self._stop()
         with self.lock:
             self._running = False
+        RPCServer.object_changed(self)
 
     def close(self):
         """Close the Node.
@@ -204,6 +220,24 @@ class Node(object):
             self._configured = False
             self._initialized = False
             self._closed = True
+        RPCServer.object_changed(self)
+    
+    def get_stream_stats(self):
+        """Return the statistics of all connected inputs and configured outputs
+        of this Node.
+        
+        The returned dict has keys 'inputs' and 'outputs', each mapping stream
+        names to the result of `get_stats()` (None for streams not configured
+        with ``stats=True``).
+        """
+        stats = {'inputs': {}, 'outputs': {}}
+        for name, input in self.inputs.items():
+            if getattr(input, 'connected', False):
+                stats['inputs'][name] = input.get_stats()
+        for name, output in self.outputs.items():
+            if output.configured:
+                stats['outputs'][name] = output.get_stats()
+        return stats
     
     def _configure(self, **kargs):
         """This method is called during `Node.configure()` and must be
@@ -71,6 +71,12 @@ class NodeGroup(object):
             if node.running():
                 node.stop()
 
+    def get_stream_stats(self):
+        """Return a dict of `Node.get_stream_stats()` for all Nodes in this
+        group, keyed by node name.
+        """
+        return {node.name: node.get_stream_stats() for node in self.nodes}
+
     def any_node_running(self):
         """Return True if any of the Nodes in this group are running.
         """
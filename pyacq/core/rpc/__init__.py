@@ -3,6 +3,7 @@
 # Distributed under the (new) BSD License. See LICENSE for more info.
 
 from .client import RPCClient, RemoteCallException, Future
-from .server import RPCServer, QtRPCServer
+from .asyncclient import AsyncRPCClient
+from .server import RPCServer, QtRPCServer, thread_safe
 from .proxy import ObjectProxy
 from .processspawner import ProcessSpawner
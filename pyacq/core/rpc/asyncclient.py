@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2016, French National Center for Scientific Research (CNRS)
+# Distributed under the (new) BSD License. See LICENSE for more info.
+
+import time
+import asyncio
+import zmq
+import zmq.asyncio
+
+from .client import RPCClient
+
+
+class AsyncRPCClient(RPCClient):
+    """RPCClient for use from an asyncio event loop.
+
+    Requests return awaitables instead of blocking until the reply arrives.
+    This applies to all proxies obtained through this client, so a single
+    thread can drive many servers concurrently::
+
+        client = AsyncRPCClient.get_client(address)
+        nodegroup = await client['nodegroup']
+        node = await nodegroup.create_node('MyNode')
+        await node.configure(sample_rate=1000.)
+
+        # start nodes of several servers in parallel
+        await asyncio.gather(*[node.start() for node in nodes])
+
+    With ``sync='sync'`` (the default) a request returns a coroutine that
+    raises TimeoutError if the reply does not arrive within the timeout. With
+    ``sync='async'`` it returns an `asyncio.Future`, and with ``sync='off'``
+    it returns None. A :class:`Batch` is sent with
+    ``await batch.send(sync='async')``.
+
+    Replies are read through a ``zmq.asyncio`` shadow of the client socket, so
+    waiting does not block the event loop. Unlike RPCClient, the client does
+    not process requests for a server running in the same thread while
+    waiting.
+
+    An AsyncRPCClient can exist alongside the RPCClient of the same thread and
+    server; proxies are bound to the client that received them. Proxies with
+    *auto_delete* cannot release their remote object when they are collected.
+    """
+
+    clients_by_thread = {}  # (thread_id, rpc_addr): client
+    _name_suffix = '.asyncio'
+
+    def __init__(self, address, **kwds):
+        RPCClient.__init__(self, address, **kwds)
+        self._async_socket = zmq.asyncio.Socket.shadow(self._socket.underlying)
+        self._reader = None
+
+    def send(self, action, opts=None, return_type='auto', sync='sync', timeout=10.0):
+        """Send a request to the remote process.
+
+        See :func:`RPCClient.send`; the request returns an awaitable unless
+        *sync* is 'off'.
+        """
+        if sync == 'off':
+            return RPCClient.send(self, action, opts=opts, return_type=return_type, sync='off')
+        if sync not in ('sync', 'async'):
+            raise ValueError('Invalid sync value: %s' % sync)
+
+        fut = RPCClient.send(self, action, opts=opts, return_type=return_type, sync='async')
+        afut = asyncio.wrap_future(fut)
+        if self._reader is None or self._reader.done():
+            self._reader = asyncio.ensure_future(self._read_replies())
+        if sync == 'async':
+            return afut
+        return asyncio.wait_for(afut, timeout)
+
+    def get_obj(self, obj, cache=False, cache_ttl=None, **kwds):
+        """Return a copy of a remote object (awaitable).
+
+        See :func:`RPCClient.get_obj`.
+        """
+        if not cache or kwds.get('sync', 'sync') != 'sync':
+            return self.send('get_obj', opts={'obj': obj}, **kwds)
+        return self._get_cached_obj(obj, cache_ttl, kwds)
+
+    async def _get_cached_obj(self, obj, cache_ttl, kwds):
+        key = (obj._attributes, kwds.get('return_type', 'auto'))
+        entry = self._cached_obj(obj, key, cache_ttl)
+        if entry is not None:
+            return entry[0]
+        now = time.perf_counter()
+        value = await self.send('get_obj', opts={'obj': obj, 'cache_id': obj._obj_id}, **kwds)
+        self._attr_cache.setdefault(obj._obj_id, {})[key] = (value, now)
+        return value
+
+    async def _read_replies(self):
+        # Read and process messages until no more replies are expected.
+        while len(self.futures) > 0:
+            # blocking reads of RPCClient set a receive timeout on the socket
+            self._socket.setsockopt(zmq.RCVTIMEO, -1)
+            parts = await self._async_socket.recv_multipart(copy=False)
+            msg = self.serializer.loads(parts[0].bytes, parts[1:])
+            self.process_msg(msg)
+
+    def close(self):
+        """Close this client's socket (but leave the server running).
+        """
+        if self._reader is not None:
+            self._reader.cancel()
+            self._reader = None
+        # the shadow socket does not own the zmq socket
+        self._async_socket = None
+        RPCClient.close(self)
@@ -47,8 +47,12 @@ class RPCClient(object):
     clients_by_thread = {}  # (thread_id, rpc_addr): client
     clients_by_thread_lock = threading.Lock()
     
-    @staticmethod
-    def get_client(address):
+    # appended to the socket identity of clients of a subclass that can exist
+    # alongside the default client of a thread (see AsyncRPCClient)
+    _name_suffix = ''
+    
+    @classmethod
+    def get_client(cls, address):
         """Return the RPC client for this thread and a given server address.
         
         If no client exists already, then a new one will be created. If the 
@@ -65,15 +69,15 @@ class RPCClient(object):
         
         # Return an existing client if there is one
         with RPCClient.clients_by_thread_lock:
-            if key in RPCClient.clients_by_thread:
-                return RPCClient.clients_by_thread[key]
+            if key in cls.clients_by_thread:
+                return cls.clients_by_thread[key]
         
-        return RPCClient(address)
+        return cls(address)
     
     def __init__(self, address, reentrant=True, serializer='msgpack'):
         # pick a unique name: host.pid.tid:rpc_addr
         self.name = ("%s.%s.%s:%s" % (log.get_host_name(), log.get_process_name(),
-                                      log.get_thread_name(), address.decode())).encode()
+                                      log.get_thread_name(), address.decode()) + self._name_suffix).encode()
 
         if sys.platform == 'win32' and '0.0.0.0' in str(address):
             logger.warn("RPC server address is likely to cause trouble on windows: %r" % address)
@@ -81,7 +85,7 @@ class RPCClient(object):
         
         key = (threading.current_thread().ident, address)
         with RPCClient.clients_by_thread_lock:
-            if key in RPCClient.clients_by_thread:
+            if key in self.clients_by_thread:
                 raise KeyError("An RPCClient instance already exists for this address."
                     " Use RPCClient.get_client(address) instead.")
         
@@ -107,11 +111,14 @@ class RPCClient(object):
         self.futures = weakref.WeakValueDictionary()
         
         with RPCClient.clients_by_thread_lock:
-            RPCClient.clients_by_thread[key] = self
+            self.clients_by_thread[key] = self
         
         # proxies generated by this client will be assigned these default options
         self.default_proxy_options = {}
         
+        # attribute values cached by proxies (see get_obj)
+        self._attr_cache = {}  # obj_id: {(attributes, return_type): (value, request time)}
+        
         self.connect_established = False
         self.establishing_connect = False
         self._disconnected = False
@@ -135,7 +142,9 @@ class RPCClient(object):
             return None
         
         if self._poller is None:
-            server = RPCServer.get_server()
+            # only the thread of the server may read its socket (not its
+            # worker threads)
+            server = RPCServer._thread_server()
             if server is None:
                 return None
             if isinstance(server, QtRPCServer):
@@ -208,6 +217,8 @@ class RPCClient(object):
         delete   Delete a proxy reference                | obj_id: proxy object ID
                                                          | ref_id: proxy reference ID
         import   Import and return a proxy to a module   | module: name of module to import
+        batch    Invoke a list of calls and return a     | calls: a list of dicts, one per call (see
+                 list of (rval, error), one per call     | :class:`Batch`)
         ping     Return 'pong'                           | 
         ======== ======================================= ==========================================
         
@@ -226,14 +237,18 @@ class RPCClient(object):
                     self.address.decode(), req_id)
         logger.debug("    => sync=%s return=%s opts=%s", sync, return_type, opts)
         
+        # large arrays in opts are sent as extra frames. They are copied: zmq
+        # may send them after this method returns (also when a sync request
+        # times out), and the caller may then modify the arrays.
+        frames = []
         if opts is None:
             opts_str = b''
         else:
-            opts_str = self.serializer.dumps(opts)
+            opts_str = self.serializer.dumps(opts, frames)
         ser_type = self.serializer.type.encode()
         
         msg = [str(req_id).encode(), action.encode(), return_type.encode(), ser_type, opts_str]
-        self._socket.send_multipart(msg)
+        self._socket.send_multipart(msg + frames)
         
         if sync == 'off':
             return
@@ -268,7 +283,7 @@ class RPCClient(object):
         opts = {'obj': obj, 'args': args, 'kwargs': kwargs} 
         return self.send('call_obj', opts=opts, **kwds)
 
-    def get_obj(self, obj, **kwds):
+    def get_obj(self, obj, cache=False, cache_ttl=None, **kwds):
         """Return a copy of a remote object.
         
         Parameters
@@ -277,10 +292,42 @@ class RPCClient(object):
             A proxy that references an object owned by the connected RPCServer.
             The object will be serialized and returned if possible, otherwise
             a new proxy is returned.
+        cache : bool
+            If True, then return the value cached by an earlier request for the
+            same object, attributes and return type, if it is still valid.
+            Otherwise the value is requested and cached, and the server informs
+            this client when the object changes (see
+            :func:`RPCServer.object_changed`). Only used with sync='sync'.
+        cache_ttl : float or None
+            Maximum age (s) of the cached value. If None, the value is used
+            until the server reports a change.
         kwds :
             All extra keyword arguments are passed to :func:`send() <RPCClient.send>`.
         """
-        return self.send('get_obj', opts={'obj': obj}, **kwds)
+        if not cache or kwds.get('sync', 'sync') != 'sync':
+            return self.send('get_obj', opts={'obj': obj}, **kwds)
+        
+        key = (obj._attributes, kwds.get('return_type', 'auto'))
+        entry = self._cached_obj(obj, key, cache_ttl)
+        if entry is not None:
+            return entry[0]
+        now = time.perf_counter()
+        value = self.send('get_obj', opts={'obj': obj, 'cache_id': obj._obj_id}, **kwds)
+        self._attr_cache.setdefault(obj._obj_id, {})[key] = (value, now)
+        return value
+
+    def _cached_obj(self, obj, key, cache_ttl):
+        # Return the (value, request time) cached for obj and key if it is not
+        # older than cache_ttl, or None.
+        if obj._obj_id not in self._attr_cache:
+            return None
+        # Read the 'invalidate' messages that are already here: a client that
+        # only reads cached values would not read its socket otherwise.
+        self._read_and_process_all()
+        entry = self._attr_cache.get(obj._obj_id, {}).get(key, None)
+        if entry is not None and (cache_ttl is None or time.perf_counter() - entry[1] < cache_ttl):
+            return entry
+        return None
 
     def transfer(self, obj, **kwds):
         """Send an object to the remote process and return a proxy to it.
@@ -358,6 +405,25 @@ class RPCClient(object):
         # the transaction is complete.
         return self.send('set_item', opts={'name': name, 'obj': obj}, sync='sync')
 
+    def batch(self, **kwds):
+        """Return a :class:`Batch` that collects calls to send to the server in
+        a single request.
+        
+        Use it as a context manager; the calls are sent when the block exits::
+        
+            with client.batch() as batch:
+                node = batch.call(nodegroup.create_node, 'MyNode')
+                batch.call(node.configure, sample_rate=1000.)
+                batch.call(node.initialize)
+            node = node.result()
+        
+        Parameters
+        ----------
+        kwds :
+            All keyword arguments are passed to :class:`Batch`.
+        """
+        return Batch(self, **kwds)
+
     def ensure_connection(self, timeout=1.0):
         """Make sure RPC server is connected and available.
         """
@@ -367,7 +433,8 @@ class RPCClient(object):
         try:
             start = time.time()
             while time.time() < start + timeout:
-                fut = self.ping(sync='async')
+                # blocking request, also in subclasses (see AsyncRPCClient)
+                fut = RPCClient.send(self, 'ping', sync='async')
                 try:
                     result = fut.result(timeout=0.1)
                     self.connect_established = True
@@ -424,7 +491,7 @@ class RPCClient(object):
                 if self._socket in socks:
                     self._read_and_process_one(timeout=0)
                 elif len(socks) > 0: 
-                    server = RPCServer.get_server()
+                    server = RPCServer._thread_server()
                     if server is None:
                         # this can happen after server has unregistered itself 
                         # at exit
@@ -452,8 +519,8 @@ class RPCClient(object):
             # NOTE: docs say timeout can only be set before bind, but this
             # seems to work for now.
             self._socket.setsockopt(zmq.RCVTIMEO, timeout)
-            msg = self._socket.recv()
-            msg = self.serializer.loads(msg)
+            parts = self._socket.recv_multipart(copy=False)
+            msg = self.serializer.loads(parts[0].bytes, parts[1:])
         except zmq.error.Again:
             raise TimeoutError("Timeout waiting for Future result.")
         
@@ -486,6 +553,8 @@ class RPCClient(object):
                 fut.set_exception(exc)
             else:
                 fut.set_result(msg['rval'])
+        elif msg['action'] == 'invalidate':
+            self._attr_cache.pop(msg['obj_id'], None)
         elif msg['action'] == 'disconnect':
             self._server_disconnected()
         else:
@@ -606,3 +675,172 @@ class Future(concurrent.futures.Future):
         """
         self.client.process_until_future(self, timeout=timeout)
         return concurrent.futures.Future.result(self)
+
+
+class Batch(object):
+    """Calls collected to be sent to an :class:`RPCServer` in a single request.
+    
+    Each remote call made through an :class:`ObjectProxy` waits for its own
+    reply. A batch instead sends all of its calls in one message; the server
+    invokes them in order and returns all results in one reply.
+    
+    `call()` returns a :class:`BatchResult` for each call. Until the batch is
+    sent, attributes of a BatchResult are references to attributes of the
+    remote result; these can be called and passed as (positional or keyword)
+    arguments to later calls of the same batch::
+    
+        batch = client.batch()
+        dev = batch.call(nodegroup.create_node, 'NumpyDeviceBuffer')
+        viewer = batch.call(nodegroup.create_node, 'QOscilloscope')
+        batch.call(dev.configure, nb_channel=4)
+        batch.call(dev.output.configure, protocol='tcp')
+        batch.call(dev.initialize)
+        batch.call(viewer.configure)
+        batch.call(viewer.input.connect, dev.output)
+        batch.send()
+    
+    Errors are reported per call: the BatchResult of a failed call raises
+    :class:`RemoteCallException` from `result()`. A failed call does not
+    prevent the following calls from being invoked, except those that use its
+    result. When used as a context manager, the batch is sent when the block
+    exits and the exception of the first failed call (if any) is raised.
+    
+    Parameters
+    ----------
+    client : RPCClient
+        The client used to send the batch.
+    timeout : float
+        The amount of time to wait for the reply when the batch is sent
+        synchronously.
+    """
+    def __init__(self, client, timeout=10.0):
+        self.client = client
+        self.timeout = timeout
+        self.calls = []
+        self.results = []
+        self.future = None
+
+    def call(self, obj, *args, **kwargs):
+        """Add a call of *obj* with *args* and *kwargs* to the batch and return
+        a :class:`BatchResult`.
+        
+        *obj* is an :class:`ObjectProxy` to a callable owned by the server, or a
+        reference to (an attribute of) the result of an earlier call of this
+        batch. Arguments that are such references are replaced by the
+        referenced object on the server.
+        
+        A ``_return_type`` keyword argument sets the return type of the call
+        (see :func:`ObjectProxy.__call__`).
+        """
+        if self.future is not None:
+            raise RuntimeError("Batch has already been sent.")
+        call = {
+            'obj': None,
+            'target': None,
+            'args': list(args),
+            'kwargs': {},
+            'refs': [],
+            'return_type': kwargs.pop('_return_type', 'auto'),
+        }
+        if isinstance(obj, BatchRef):
+            call['target'] = self._ref(obj)
+        else:
+            call['obj'] = obj
+        for i, arg in enumerate(args):
+            if isinstance(arg, BatchRef):
+                call['args'][i] = None
+                call['refs'].append([i] + self._ref(arg))
+        for k, arg in kwargs.items():
+            if isinstance(arg, BatchRef):
+                call['refs'].append([k] + self._ref(arg))
+            else:
+                call['kwargs'][k] = arg
+        
+        result = BatchResult(self, len(self.calls))
+        self.calls.append(call)
+        self.results.append(result)
+        return result
+
+    def _ref(self, ref):
+        if ref._batch is not self:
+            raise ValueError("Cannot use the result of a call from another batch.")
+        return [ref._index, list(ref._attributes)]
+
+    def send(self, sync='sync', timeout=None):
+        """Send all calls to the server.
+        
+        If *sync* is 'sync', then block until the reply has arrived (or
+        *timeout* has elapsed) and return the list of :class:`BatchResult`.
+        If 'async', then return a :class:`Future` for the whole batch
+        immediately.
+        """
+        if self.future is not None:
+            raise RuntimeError("Batch has already been sent.")
+        if timeout is None:
+            timeout = self.timeout
+        self.future = self.client.send('batch', opts={'calls': self.calls}, sync='async')
+        self.future.add_done_callback(self._batch_returned)
+        if sync == 'async':
+            return self.future
+        elif sync == 'sync':
+            self.future.result(timeout=timeout)
+            return self.results
+        else:
+            raise ValueError('Invalid sync value: %s' % sync)
+
+    def _batch_returned(self, fut):
+        exc = fut.exception()
+        if exc is not None:
+            for result in self.results:
+                result.set_exception(exc)
+            return
+        for result, (rval, error) in zip(self.results, fut.result()):
+            if error is None:
+                result.set_result(rval)
+            else:
+                result.set_exception(RemoteCallException(*error))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None or len(self.calls) == 0:
+            return
+        for result in self.send():
+            exc = result.exception()
+            if exc is not None:
+                raise exc
+
+
+class BatchRef(object):
+    """Reference to (an attribute of) the result of a call in a :class:`Batch`.
+    
+    Getting an attribute returns a new reference; references can only be used
+    as the object or arguments of later calls of the same batch.
+    """
+    def __init__(self, batch, index, attributes=()):
+        self._batch = batch
+        self._index = index
+        self._attributes = attributes
+
+    def __getattr__(self, attr):
+        if attr.startswith('_'):
+            raise AttributeError(attr)
+        return BatchRef(self._batch, self._index, self._attributes + (attr,))
+
+
+class BatchResult(Future, BatchRef):
+    """The result of a call in a :class:`Batch`.
+    
+    This is a :class:`Future` that is resolved when the reply to the batch
+    arrives. Before that, it can also be used as a :class:`BatchRef` to the
+    result, except for the names of Future methods (`result`, `done`, ...).
+    """
+    def __init__(self, batch, index):
+        Future.__init__(self, batch.client, None)
+        BatchRef.__init__(self, batch, index)
+
+    def result(self, timeout=None):
+        if self._batch.future is None:
+            raise RuntimeError("Batch has not been sent yet.")
+        return Future.result(self, timeout=timeout)
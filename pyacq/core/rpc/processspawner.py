@@ -48,6 +48,9 @@ class ProcessSpawner(object):
         process.
     executable : str | None
         Optional python executable to invoke. The default value is `sys.executable`.
+    max_workers : int
+        Number of worker threads used by the :class:`RPCServer` to invoke object
+        calls (see :class:`RPCServer`). Not supported with *qt*.
         
     Examples
     --------
@@ -66,9 +69,10 @@ class ProcessSpawner(object):
         proc.wait()
     """
     def __init__(self, name=None, address="tcp://127.0.0.1:*", qt=False, log_addr=None, 
-                 log_level=None, executable=None):
+                 log_level=None, executable=None, max_workers=0):
         #logger.warn("Spawning process: %s %s %s", name, log_addr, log_level)
         assert qt in (True, False)
+        assert max_workers == 0 or not qt, "QtRPCServer does not support max_workers"
         assert isinstance(address, (str, bytes))
         assert name is None or isinstance(name, str)
         assert log_addr is None or isinstance(log_addr, (str, bytes)), "log_addr must be str or None; got %r" % log_addr
@@ -92,6 +96,8 @@ class ProcessSpawner(object):
         # Spawn new process
         class_name = 'QtRPCServer' if qt else 'RPCServer'
         args = {'address': address}
+        if max_workers > 0:
+            args['max_workers'] = max_workers
         bootstrap_conf = dict(
             class_name=class_name, 
             args=args,
@@ -110,6 +110,7 @@ class ObjectProxy(object):
             'defer_getattr': True,   ## True, False
             'no_proxy_types': [type(None), str, int, float, tuple, list, dict, ObjectProxy],
             'auto_delete': False,
+            'cache_attrs': None,
         }
         
         self._set_proxy_options(**kwds)
@@ -193,12 +194,44 @@ class ObjectProxy(object):
         auto_delete : bool
             If True, then the proxy will automatically call
             `self._delete()` when it is collected by Python.
+        cache_attrs : list, dict, or None
+            Attributes of the remote object whose values are cached by the
+            client, given as names (or dotted paths such as 'output.params')
+            relative to this proxy. A dict maps each name to the lifetime (s) of
+            its cached value; with a list, or a lifetime of None, the value is
+            kept until the remote object reports a change of state (see
+            :func:`RPCServer.object_changed`). Only the lookups made by
+            :func:`_get_value` and :func:`_undefer` (thus also attribute
+            access with defer_getattr=False) are cached. Cached values are
+            shared by all proxies to the same object in the thread.
         """
         for k in kwds:
             if k not in self._proxy_options:
                 raise KeyError("Unrecognized proxy option '%s'" % k)
+        if kwds.get('cache_attrs', None) is not None:
+            kwds['cache_attrs'] = self._cache_keys(kwds['cache_attrs'])
         self._proxy_options.update(kwds)
 
+    def _cache_keys(self, cache_attrs):
+        # Return {attributes: lifetime} for the cache_attrs option. Names are
+        # relative to this proxy; tuples are already complete attribute paths
+        # (as passed on to deferred attributes of this proxy).
+        if not isinstance(cache_attrs, dict):
+            cache_attrs = {name: None for name in cache_attrs}
+        keys = {}
+        for name, ttl in cache_attrs.items():
+            if isinstance(name, str):
+                name = self._attributes + tuple(name.split('.'))
+            keys[tuple(name)] = ttl
+        return keys
+
+    def _cache_ttl(self):
+        # Return (cached, lifetime) for the lookup of this proxy's attributes.
+        cache_attrs = self._proxy_options['cache_attrs']
+        if cache_attrs is None or self._attributes not in cache_attrs:
+            return False, None
+        return True, cache_attrs[self._attributes]
+
     def _save(self):
         """Convert this proxy to a serializable structure.
         """
@@ -226,7 +259,8 @@ class ObjectProxy(object):
         if self._client() is None:
             return self._server().unwrap_proxy(self)
         else:
-            return self._client().get_obj(self, return_type='value')
+            cached, ttl = self._cache_ttl()
+            return self._client().get_obj(self, return_type='value', cache=cached, cache_ttl=ttl)
         
     def __repr__(self):
         orep = '.'.join((self._type_str,) + self._attributes)
@@ -240,7 +274,9 @@ class ObjectProxy(object):
             return self
         # Transfer sends this object to the remote process and returns a new proxy.
         # In the process, this invokes any deferred attributes.
-        return self._client().get_obj(self, sync=sync, return_type=return_type, **kwds)
+        cached, ttl = self._cache_ttl()
+        return self._client().get_obj(self, sync=sync, return_type=return_type,
+                                      cache=cached, cache_ttl=ttl, **kwds)
         
     def _delete(self, sync='sync', **kwds):
         """Ask the RPC server to release the reference held by this proxy.
@@ -284,6 +320,7 @@ class ObjectProxy(object):
         # Keep a reference to the parent proxy so that the remote object cannot be
         # released as long as this proxy is alive.
         proxy.__dict__['_parent_proxy'] = self
+        proxy.__dict__['_client_'] = self._client_
         return proxy
     
     def __call__(self, *args, **kwargs):
@@ -24,6 +24,16 @@ all_serializers = {}  # type_str: class
 encode_key = '___type_name___'
 
 
+def _make_dtype(dt):
+    # structured dtypes are serialized as the string of their list description
+    if isinstance(dt, str) and dt.startswith('['):
+        #small hack to have a list
+        d = {}
+        exec('dtype='+dt, None, d)
+        dt = d['dtype']
+    return np.dtype(dt)
+
+
 class Serializer:
     """Base serializer class on which msgpack and json serializers 
     (and potentially others) are built.
@@ -37,7 +47,20 @@ class Serializer:
     
     Note that tuples are converted to lists in transit. See:
     https://github.com/msgpack/msgpack-python/issues/98
+    
+    Arrays of at least `out_of_band_size` bytes may be sent out-of-band: when
+    `dumps()` is given a *frames* list, the array buffer is appended to it
+    (without copy) and the serialized message only holds the index of the
+    frame. The frames must be sent along with the message (RPCClient and
+    RPCServer send them as extra ZMQ frames) and given to `loads()`, which
+    returns read-only arrays that point into the received frames.
     """
+    # minimum size (bytes) of arrays sent out-of-band
+    out_of_band_size = 65536
+    # if False, loads() leaves proxies to objects of the server as proxies
+    # (RPCServer then resolves them when the request runs)
+    unwrap_proxies = True
+    
     def __init__(self, server=None, client=None):
         self._server = server
         self.client = client
@@ -50,26 +73,63 @@ class Serializer:
             self._server = RPCServer.get_server()
         return self._server
     
-    def dumps(self, obj):
+    def dumps(self, obj, frames=None):
         """Convert obj to serialized string.
+        
+        If *frames* is a list, large arrays are appended to it instead of
+        being copied into the string.
         """
         raise NotImplementedError()
 
-    def loads(self, msg):
+    def loads(self, msg, frames=None):
         """Convert from serialized string to python object.
         
         Proxies that reference objects owned by the server are converted back
         into the local object. All other proxies are left as-is.
+        
+        *frames* is the list of out-of-band frames received with the message.
         """
         raise NotImplementedError()
+    
+    def encode_frame(self, obj, frames):
+        """Append the buffer of array *obj* to *frames* and return its
+        serializable description, or return None if *obj* must be sent in-band.
+        
+        C- and Fortran-ordered arrays are sent without copy, with their strides.
+        """
+        if frames is None or obj.nbytes < self.out_of_band_size or obj.dtype.hasobject:
+            return None
+        if obj.flags['C_CONTIGUOUS']:
+            buf = obj
+        elif obj.flags['F_CONTIGUOUS']:
+            buf = obj.T
+        else:
+            obj = buf = np.ascontiguousarray(obj)
+        frames.append(buf.reshape(-1).view('uint8'))
+        return {encode_key: 'ndarray',
+                'frame': len(frames) - 1,
+                'dtype': str(obj.dtype),
+                'shape': obj.shape,
+                'strides': obj.strides}
+    
+    def decode_frame(self, dct, frames):
+        """Return the array described by *dct* from the out-of-band *frames*.
+        """
+        frame = frames[dct['frame']]
+        buf = getattr(frame, 'buffer', frame)
+        return np.ndarray(buffer=buf, dtype=_make_dtype(dct['dtype']), shape=dct['shape'],
+                          strides=dct['strides'])
 
-    def encode(self, obj):
+    def encode(self, obj, frames=None):
         """Convert various types to serializable objects.
         
         Provides support for ndarray, datetime, date, and None. Other types
         are converted to proxies.
         """
         if isinstance(obj, np.ndarray):
+            ser = self.encode_frame(obj, frames)
+            if ser is not None:
+                return ser
             if not obj.flags['C_CONTIGUOUS']:
                 obj = np.ascontiguousarray(obj)
             assert(obj.flags['C_CONTIGUOUS'])
@@ -101,7 +161,7 @@ class Serializer:
             ser.update(obj._save())
             return ser
 
-    def decode(self, dct):
+    def decode(self, dct, frames=None):
         """Convert from serializable objects back to original types.
         """
         if isinstance(dct, dict):
@@ -109,12 +169,9 @@ class Serializer:
             if type_name is None:
                 return dct
             if type_name == 'ndarray':
-                dt = dct['dtype']
-                if dt.startswith('['):
-                    #small hack to have a list
-                    d = {}
-                    exec('dtype='+dt, None, d)
-                    dt = d['dtype']
+                if 'frame' in dct:
+                    return self.decode_frame(dct, frames)
+                dt = _make_dtype(dct['dtype'])
                 return np.fromstring(dct['data'], dtype=dt).reshape(dct['shape'])
             elif type_name == 'datetime':
                 return datetime.datetime.strptime(dct['data'], '%Y-%m-%dT%H:%M:%S.%f')
@@ -128,7 +185,11 @@ class Serializer:
                 proxy = ObjectProxy(**dct)
                 if self.client is not None:
                     proxy._set_proxy_options(**self.client.default_proxy_options)
-                if self.server is not None and proxy._rpc_addr == self.server.address:
+                    if proxy._rpc_addr == self.client.address:
+                        # requests made with the proxy go through the client
+                        # that received it (see AsyncRPCClient)
+                        proxy.__dict__['_client_'] = self.client
+                if self.unwrap_proxies and self.server is not None and proxy._rpc_addr == self.server.address:
                     return self.server.unwrap_proxy(proxy)
                 else:
                     return proxy
@@ -154,12 +215,12 @@ class MsgpackSerializer(Serializer):
         assert HAVE_MSGPACK
         Serializer.__init__(self, server, client)
     
-    def dumps(self, obj):
+    def dumps(self, obj, frames=None):
         """Convert obj to msgpack string.
         """
-        return msgpack.dumps(obj, use_bin_type=True, default=self.encode)
+        return msgpack.dumps(obj, use_bin_type=True, default=lambda o: self.encode(o, frames))
 
-    def loads(self, msg):
+    def loads(self, msg, frames=None):
         """Convert from msgpack string to python object.
         
         Proxies that reference objects owned by the server are converted back
@@ -170,7 +231,7 @@ class MsgpackSerializer(Serializer):
         #return msgpack.loads(msg, encoding='utf8', use_list=False, object_hook=self.decode)
 
         #Return lists/tuples as lists because json can't be configured otherwise
-        return msgpack.loads(msg, encoding='utf8', object_hook=self.decode)
+        return msgpack.loads(msg, encoding='utf8', object_hook=lambda dct: self.decode(dct, frames))
 
 
 class JsonSerializer(Serializer):
@@ -183,22 +244,29 @@ class JsonSerializer(Serializer):
         
         # We require a custom class to overrode json encode behavior.
         class EnhancedJSONEncoder(json.JSONEncoder):
+            def __init__(self2, *args, frames=None, **kwds):
+                json.JSONEncoder.__init__(self2, *args, **kwds)
+                self2.frames = frames
+            
             def default(self2, obj):
-                obj2 = self.encode(obj)
+                obj2 = self.encode(obj, self2.frames)
                 if obj is obj2:
                     return json.JSONEncoder.default(self, obj)
                 else:
                     return obj2
         self.EnhancedJSONEncoder = EnhancedJSONEncoder
     
-    def dumps(self, obj):
-        return json.dumps(obj, cls=self.EnhancedJSONEncoder).encode()
+    def dumps(self, obj, frames=None):
+        return json.dumps(obj, cls=self.EnhancedJSONEncoder, frames=frames).encode()
     
-    def loads(self, msg):
-        return json.loads(msg.decode(), object_hook=self.decode)
+    def loads(self, msg, frames=None):
+        return json.loads(msg.decode(), object_hook=lambda dct: self.decode(dct, frames))
 
-    def encode(self, obj):
+    def encode(self, obj, frames=None):
         if isinstance(obj, np.ndarray):
+            ser = self.encode_frame(obj, frames)
+            if ser is not None:
+                return ser
             # JSON doesn't support bytes, so we use base64 encoding instead:
             if not obj.flags['C_CONTIGUOUS']:
                 obj = np.ascontiguousarray(obj)
@@ -213,18 +281,20 @@ class JsonSerializer(Serializer):
         elif obj is None:
             # JSON does support None/null:
             return None
-        return Serializer.encode(self, obj)
+        return Serializer.encode(self, obj, frames)
 
-    def decode(self, dct):
+    def decode(self, dct, frames=None):
         if isinstance(dct, dict):
             type_name = dct.get(encode_key, None)
             if type_name == 'ndarray':
+                if 'frame' in dct:
+                    return self.decode_frame(dct, frames)
                 data = base64.b64decode(dct['data'])
-                return np.frombuffer(data, dct['dtype']).reshape(dct['shape'])
+                return np.frombuffer(data, _make_dtype(dct['dtype'])).reshape(dct['shape'])
             elif type_name == 'bytes':
                 return base64.b64decode(dct['data'])
             
-            return Serializer.decode(self, dct)
+            return Serializer.decode(self, dct, frames)
         return dct
 
 
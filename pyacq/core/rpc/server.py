@@ -13,6 +13,8 @@ import zmq
 import logging
 import numpy as np
 import atexit
+import collections
+import concurrent.futures
 from pyqtgraph.Qt import QtCore, QtGui
 
 from .serializer import all_serializers
@@ -24,6 +26,31 @@ from . import log
 logger = logging.getLogger(__name__)
 
 
+# server of the request being processed by a worker thread (see RPCServer)
+_worker_context = threading.local()
+
+
+def thread_safe(obj):
+    """Decorator marking a function, method or class as safe to invoke
+    concurrently from several threads.
+    
+    An :class:`RPCServer` with a worker pool runs calls to such methods (or to
+    any method of such classes) without waiting for the other calls to the
+    same object.
+    """
+    obj._rpc_thread_safe = True
+    return obj
+
+
+def _is_thread_safe(obj):
+    if isinstance(obj, ObjectProxy):
+        return False
+    try:
+        return getattr(obj, '_rpc_thread_safe', False) is True
+    except Exception:
+        return False
+
+
 class RPCServer(object):
     """Remote procedure call server for invoking requests on proxied objects.
     
@@ -43,6 +70,15 @@ class RPCServer(object):
       a separate thread, but then sent to the Qt event loop by signal and
       processed there. The server is registered as running in the Qt thread.
 
+    With *max_workers* > 0, `run_forever()` runs object calls ('call_obj' and
+    'batch' requests) in a pool of worker threads, so that a slow call does not
+    delay the requests of other clients. Requests that use the same object
+    (calls, including those of a batch, and 'get_obj', 'set_item' and
+    'delete' requests) are still processed one at a time, in order, unless
+    the method or the class of the object is marked with :func:`thread_safe`.
+    Other requests (ping, imports, ...) are processed in the server thread.
+    Replies of the workers are sent back to the server thread through an
+    inproc socket.
     
       
     Parameters
@@ -54,6 +90,9 @@ class RPCServer(object):
         
         **Note:** binding RPCServer to a public IP address is a potential
         security hazard.
+    max_workers : int
+        Number of worker threads used by `run_forever()` to invoke object calls.
+        If 0 (default), all requests are processed in the server thread.
 
     Notes
     -----
@@ -100,10 +139,24 @@ class RPCServer(object):
     servers_by_thread = {}
     servers_by_thread_lock = threading.Lock()
     
+    # requests that are queued per object when running with a worker pool
+    _queued_actions = ('call_obj', 'batch', 'get_obj', 'set_item', 'delete')
+    
     @staticmethod
     def get_server():
         """Return the server running in this thread, or None if there is no server.
+        
+        In the worker threads of a server (see *max_workers*), this is the
+        server whose request is being processed.
         """
+        srv = RPCServer._thread_server()
+        if srv is None:
+            srv = getattr(_worker_context, 'server', None)
+        return srv
+    
+    @staticmethod
+    def _thread_server():
+        # Return the server registered for this thread, ignoring worker threads.
         with RPCServer.servers_by_thread_lock:
             return RPCServer.servers_by_thread.get(threading.current_thread().ident, None)
     
@@ -142,7 +195,7 @@ class RPCServer(object):
         srv = RPCServer.get_server()
         return RPCClient.get_client(srv.address)
 
-    def __init__(self, address="tcp://127.0.0.1:*"):
+    def __init__(self, address="tcp://127.0.0.1:*", max_workers=0):
         self._socket = zmq.Context.instance().socket(zmq.ROUTER)
         
         # socket will continue attempting to deliver messages up to 5 sec after
@@ -158,8 +211,12 @@ class RPCServer(object):
         # Clients may make requests using any supported serializer, so we should
         # have one of each ready.
         self._serializers = {}
+        # used with a worker pool: proxies are resolved when the request runs
+        self._raw_serializers = {}
         for ser in all_serializers.values():
             self._serializers[ser.type] = ser(server=self)
+            self._raw_serializers[ser.type] = ser(server=self)
+            self._raw_serializers[ser.type].unwrap_proxies = False
         
         # keep track of all clients we have seen so that we can inform them 
         # when the server exits.
@@ -189,6 +246,20 @@ class RPCServer(object):
         self._proxy_refs = {}  # obj_id: [object, set(refs)]
         self._proxy_id_map = {}  # id(obj): obj_id
         
+        # Clients that cache attributes of proxied objects; they are informed
+        # when these objects change (see object_changed).
+        self._cache_clients = {}  # obj_id: set(clients)
+        
+        # protects the proxy and cache bookkeeping, used by worker threads
+        self._lock = threading.RLock()
+        
+        # Worker pool, created by run_forever()
+        self.max_workers = max_workers
+        self._pool = None
+        self._return_socket = None
+        self._worker_sockets = threading.local()
+        self._pending = {}  # id(obj): deque of requests waiting for the one in progress
+        
         # Make sure we inform clients of closure
         atexit.register(self._atexit)
 
@@ -197,13 +268,14 @@ class RPCServer(object):
         
         This proxy can be sent via RPC to any other node.
         """
-        rid = self._next_ref_id
-        self._next_ref_id += 1
-        oid = self._get_object_id(obj)
+        with self._lock:
+            rid = self._next_ref_id
+            self._next_ref_id += 1
+            oid = self._get_object_id(obj)
+            proxy_ref = self._proxy_refs.setdefault(oid, [obj, set()])
+            proxy_ref[1].add(rid)
         type_str = str(type(obj))
         proxy = ObjectProxy(self.address, oid, rid, type_str, attributes=(), **kwds)
-        proxy_ref = self._proxy_refs.setdefault(oid, [obj, set()])
-        proxy_ref[1].add(rid)
         #logging.debug("server %s add proxy %d: %s", self.address, oid, obj)
         return proxy
 
@@ -220,7 +292,8 @@ class RPCServer(object):
         """
         try:
             oid = proxy._obj_id
-            obj = self._proxy_refs[oid][0]
+            with self._lock:
+                obj = self._proxy_refs[oid][0]
         except KeyError:
             raise KeyError("Invalid proxy object ID %r. The object may have "
                            "been released already." % proxy.obj_id)
@@ -239,13 +312,16 @@ class RPCServer(object):
         
     @staticmethod
     def _read_one(socket):
-        name, req_id, action, return_type, ser_type, opts = socket.recv_multipart()
+        # frames after opts hold the arrays sent out-of-band (see Serializer)
+        parts = socket.recv_multipart(copy=False)
+        name, req_id, action, return_type, ser_type, opts = [part.bytes for part in parts[:6]]
         msg = {
             'req_id': int(req_id), 
             'action': action.decode(), 
             'return_type': return_type.decode(),
             'ser_type': ser_type.decode(),
             'opts': opts,
+            'frames': parts[6:],
         }
         return name, msg
         
@@ -281,20 +357,151 @@ class RPCServer(object):
             except KeyError:
                 raise ValueError("Unsupported serializer '%s'" % ser_type)
             opts = msg.pop('opts', None)
+            frames = msg.pop('frames', [])
             
             logging.debug("RPC recv '%s' from %s [req_id=%s]", action, caller.decode(), req_id)
             logging.debug("    => %s", msg)
+            queued = self._pool is not None and action in self._queued_actions
             if opts == b'':
                 opts = None
+            elif queued:
+                opts = self._raw_serializers[ser_type].loads(opts, frames)
             else:
-                opts = serializer.loads(opts)
+                opts = serializer.loads(opts, frames)
             logging.debug("    => opts: %s", opts)
             
+            if queued:
+                self._dispatch(caller, req_id, action, opts, return_type)
+                return
             result = self.process_action(action, opts, return_type, caller)
             exc = None
         except:
             exc = sys.exc_info()
+            result = None
 
+        self._reply(caller, req_id, return_type, result, exc)
+            
+        if action == 'close':
+            self._final_close()
+    
+    def _dispatch(self, caller, req_id, action, opts, return_type):
+        # Queue a request behind the earlier requests that use the same
+        # objects. Object calls run in the worker pool; other requests run in
+        # the server thread, or in a worker if they had to wait. Proxies in
+        # opts are resolved only when the request runs.
+        call = {'caller': caller, 'req_id': req_id, 'action': action, 'opts': opts,
+                'return_type': return_type, 'keys': self._request_keys(action, opts), 'waits': 0}
+        with self._lock:
+            for key in call['keys']:
+                if key in self._pending:
+                    self._pending[key].append(call)
+                    call['waits'] += 1
+                else:
+                    self._pending[key] = collections.deque()
+        if call['waits'] > 0:
+            return
+        if action in ('call_obj', 'batch'):
+            self._pool.submit(self._run_worker, call)
+        else:
+            self._run_call(call)
+            self._release(call)
+    
+    def _run_worker(self, call):
+        # Run a request in a worker thread, then the queued requests that it
+        # was the last to wait for.
+        _worker_context.server = self
+        try:
+            while call is not None:
+                self._run_call(call)
+                ready = self._release(call)
+                call = ready.pop(0) if len(ready) > 0 else None
+                for other in ready:
+                    self._pool.submit(self._run_worker, other)
+        finally:
+            _worker_context.server = None
+    
+    def _run_call(self, call):
+        try:
+            opts = self._unwrap_opts(call['opts'])
+            result = self.process_action(call['action'], opts, call['return_type'], call['caller'])
+            exc = None
+        except:
+            exc = sys.exc_info()
+            result = None
+        self._reply(call['caller'], call['req_id'], call['return_type'], result, exc)
+    
+    def _release(self, call):
+        # Hand the objects of a finished request to the next requests queued
+        # for them, and return those that do not wait for anything else.
+        ready = []
+        with self._lock:
+            for key in call['keys']:
+                queue = self._pending[key]
+                if len(queue) == 0:
+                    del self._pending[key]
+                    continue
+                nxt = queue.popleft()
+                nxt['waits'] -= 1
+                if nxt['waits'] == 0:
+                    ready.append(nxt)
+        return ready
+    
+    def _request_keys(self, action, opts):
+        # Return the keys of the objects used by a request.
+        if action == 'call_obj':
+            objs = [(opts['obj'], True)]
+        elif action == 'batch':
+            # calls of results of earlier calls in the batch are not known yet
+            objs = [(c['obj'], True) for c in opts['calls'] if c.get('target') is None]
+        elif action == 'delete':
+            with self._lock:
+                ref = self._proxy_refs.get(opts['obj_id'], None)
+            if ref is None or _is_thread_safe(ref[0]):
+                return []
+            return [id(ref[0])]
+        else:
+            objs = [(opts['obj'], False)]
+        keys = []
+        for obj, is_call in objs:
+            key = self._object_key(obj, is_call)
+            if key is not None and key not in keys:
+                keys.append(key)
+        return keys
+    
+    def _object_key(self, proxy, is_call):
+        # Requests that use a local object are queued under the id of the
+        # object that the proxy refers to, unless the object (or the called
+        # method) is thread-safe.
+        if not isinstance(proxy, ObjectProxy) or proxy._rpc_addr != self.address:
+            return None
+        with self._lock:
+            ref = self._proxy_refs.get(proxy._obj_id, None)
+        if ref is None or _is_thread_safe(ref[0]):
+            # an invalid proxy raises an error when the request runs
+            return None
+        if is_call:
+            try:
+                method = self.unwrap_proxy(proxy)
+            except Exception:
+                return None
+            if _is_thread_safe(method) or _is_thread_safe(getattr(method, '__self__', None)):
+                return None
+        return id(ref[0])
+    
+    def _unwrap_opts(self, obj):
+        # Replace the proxies to local objects in the options of a request
+        # decoded by a raw serializer.
+        if isinstance(obj, ObjectProxy):
+            if obj._rpc_addr == self.address:
+                return self.unwrap_proxy(obj)
+            return obj
+        elif isinstance(obj, dict):
+            return {k: self._unwrap_opts(v) for k, v in obj.items()}
+        elif isinstance(obj, list):
+            return [self._unwrap_opts(v) for v in obj]
+        return obj
+    
+    def _reply(self, caller, req_id, return_type, result, exc):
         # Send result or error back to client
         if req_id >= 0:
             if exc is None:
@@ -318,16 +525,19 @@ class RPCServer(object):
             # An exception occurred, but client did not request a response.
             # Instead we will dump the exception here.
             sys.excepthook(*exc)
-            
-        if action == 'close':
-            self._final_close()
     
     def _send_error(self, caller, req_id, exc):
-        exc_str = ["Error while processing request %s [%d]: " % (caller.decode(), req_id)]
+        header = "Error while processing request %s [%d]: " % (caller.decode(), req_id)
+        self._send_result(caller, req_id, error=self._format_error(header, exc))
+    
+    @staticmethod
+    def _format_error(header, exc):
+        # Return (exception type name, traceback lines) to send to the client
+        exc_str = [header]
         exc_str += traceback.format_stack()
         exc_str += [" < exception caught here >\n"]
         exc_str += traceback.format_exception(*exc)
-        self._send_result(caller, req_id, error=(exc[0].__name__, exc_str))
+        return (exc[0].__name__, exc_str)
     
     def _send_result(self, caller, req_id, rval=None, error=None):
         result = {'action': 'return', 'req_id': req_id,
@@ -338,9 +548,26 @@ class RPCServer(object):
         # Select the correct serializer for this client
         serializer = self._serializers[self._clients[caller]]
         
-        # Serialize and return the result
-        data = serializer.dumps(result)
-        self._socket.send_multipart([caller, data])
+        # Serialize and return the result; large arrays are sent as extra
+        # frames. These are copied once, since zmq may send them after the
+        # server has moved on to requests that modify the returned arrays.
+        frames = []
+        data = serializer.dumps(result, frames)
+        self._send_multipart([caller, data] + frames, copy=len(frames) > 0)
+    
+    def _send_multipart(self, parts, copy=True):
+        # Only the server thread may use the server socket; worker threads
+        # send their messages to be forwarded by the server thread.
+        if self._pool is None or threading.current_thread().ident == self._thread:
+            self._socket.send_multipart(parts, copy=copy)
+            return
+        sock = getattr(self._worker_sockets, 'socket', None)
+        if sock is None:
+            sock = zmq.Context.instance().socket(zmq.PUSH)
+            sock.linger = 1000
+            sock.connect(self._return_addr)
+            self._worker_sockets.socket = sock
+        sock.send_multipart(parts, copy=copy)
 
     def process_action(self, action, opts, return_type, caller):
         """Invoke a single action and return the result.
@@ -361,12 +588,17 @@ class RPCServer(object):
             #logging.debug("    => call_obj result: %r", result)
         elif action == 'get_obj':
             result = opts['obj']
+            if 'cache_id' in opts:
+                with self._lock:
+                    self._cache_clients.setdefault(opts['cache_id'], set()).add(caller)
         elif action == 'delete':
-            proxy_ref = self._proxy_refs[opts['obj_id']]
-            proxy_ref[1].remove(opts['ref_id'])
-            if len(proxy_ref[1]) == 0:
-                del self._proxy_refs[opts['obj_id']]
-                del self._proxy_id_map[id(proxy_ref[0])]
+            with self._lock:
+                proxy_ref = self._proxy_refs[opts['obj_id']]
+                proxy_ref[1].remove(opts['ref_id'])
+                if len(proxy_ref[1]) == 0:
+                    del self._proxy_refs[opts['obj_id']]
+                    del self._proxy_id_map[id(proxy_ref[0])]
+                    self._cache_clients.pop(opts['obj_id'], None)
             result = None
         elif action =='get_item':
             result = self[opts['name']]
@@ -385,6 +617,8 @@ class RPCServer(object):
                     result = getattr(result, part)
             else:
                 result = map(mod.__getattr__, fromlist)
+        elif action == 'batch':
+            result = self._process_batch(opts['calls'], caller)
         elif action == 'ping':
             result = 'pong'
         elif action == 'close':
@@ -406,7 +640,7 @@ class RPCServer(object):
                 
                 # Send disconnect message.
                 logger.debug("RPC server sending disconnect message to %r", client)
-                self._socket.send_multipart([client, data_str])
+                self._send_multipart([client, data_str])
             RPCServer.unregister_server(self)
             result = True
         else:
@@ -414,6 +648,98 @@ class RPCServer(object):
         
         return result
 
+    @staticmethod
+    def object_changed(*objs):
+        """Inform the clients that cache attributes of *objs* that the state of
+        these objects has changed.
+        
+        Clients drop the cached attribute values of these objects (see the
+        *cache_attrs* option of :func:`ObjectProxy._set_proxy_options`). This
+        must be called from the thread of the server that owns the objects
+        (or one of its worker threads). Objects that were never proxied by
+        this server are ignored, and so are calls from threads without a
+        server (for example a method called by a local thread of the
+        process): clients then keep their cached values until they expire, if
+        a lifetime was given.
+        """
+        srv = RPCServer.get_server()
+        if srv is None or srv._closed:
+            logger.debug("RPCServer.object_changed() called outside of a running server; ignored")
+            return
+        for obj in objs:
+            srv._invalidate(obj)
+    
+    def _invalidate(self, obj):
+        with self._lock:
+            oid = self._proxy_id_map.get(id(obj), None)
+            if oid is None:
+                return
+            clients = self._cache_clients.pop(oid, ())
+        data = {}
+        for client in clients:
+            ser_type = self._clients[client]
+            if ser_type not in data:
+                data[ser_type] = self._serializers[ser_type].dumps({'action': 'invalidate', 'obj_id': oid})
+            logger.debug("RPC server sending invalidate message for %d to %r", oid, client)
+            self._send_multipart([client, data[ser_type]])
+
+    def _process_batch(self, calls, caller):
+        """Invoke a list of calls in order and return a list of (rval, error)
+        with one entry per call.
+        
+        Each call may use the result of an earlier call of the batch as the
+        object to call (*target*) or as an argument (*refs*); see
+        :class:`Batch <pyacq.core.rpc.client.Batch>`. A call that fails does
+        not prevent the following ones from being invoked, but calls that
+        refer to its result fail as well.
+        """
+        values = []  # local result of each call
+        failed = set()
+        replies = []
+        for i, call in enumerate(calls):
+            try:
+                if call.get('target') is None:
+                    obj = call['obj']
+                else:
+                    obj = self._batch_value(values, failed, *call['target'])
+                args = list(call.get('args') or ())
+                kwargs = dict(call.get('kwargs') or {})
+                for key, index, attributes in call.get('refs', []):
+                    value = self._batch_value(values, failed, index, attributes)
+                    if isinstance(key, int):
+                        args[key] = value
+                    else:
+                        kwargs[key] = value
+                rval = self.process_action('call_obj', {'obj': obj, 'args': args, 'kwargs': kwargs},
+                                           call.get('return_type', 'auto'), caller)
+            except:
+                failed.add(i)
+                values.append(None)
+                header = "Error while processing call %d of batch request from %s: " % (i, caller.decode())
+                replies.append((None, self._format_error(header, sys.exc_info())))
+                continue
+            
+            values.append(rval)
+            return_type = call.get('return_type', 'auto')
+            if return_type == 'auto':
+                rval = self.auto_proxy(rval, self.no_proxy_types)
+            elif return_type == 'proxy':
+                rval = self.get_proxy(rval)
+            replies.append((rval, None))
+        return replies
+    
+    @staticmethod
+    def _batch_value(values, failed, index, attributes):
+        # Return (an attribute of) the result of an earlier call in a batch.
+        if not 0 <= index < len(values):
+            raise ValueError("Batch call %d has no result yet." % index)
+        if index in failed:
+            raise RuntimeError("Batch call %d failed; its result cannot be used." % index)
+        value = values[index]
+        for attr in attributes:
+            value = getattr(value, attr)
+        return value
+
     def _atexit(self):
         # Process is exiting; do any last-minute cleanup if necessary.
         if self._closed is not True:
@@ -435,6 +761,10 @@ class RPCServer(object):
     def _final_close(self):
         # Called after the server has closed and sent its disconnect messages.
         self._socket.close()
+        if self._pool is not None:
+            # replies of calls still running in workers are dropped
+            self._pool.shutdown(wait=False)
+            self._return_socket.close()
 
     def running(self):
         """Boolean indicating whether the server is still running.
@@ -449,9 +779,30 @@ class RPCServer(object):
 
         logging.info("RPC start server: %s@%s", name, self.address.decode())
         RPCServer.register_server(self)
+        if self.max_workers == 0:
+            while self.running():
+                name, msg = self._read_one(self._socket)
+                self._process_one(name, msg)
+            return
+        
+        # Worker threads send their messages to the return socket, and they are
+        # forwarded to the clients from here.
+        self._return_addr = 'inproc://rpc_return_%x' % id(self)
+        self._return_socket = zmq.Context.instance().socket(zmq.PULL)
+        self._return_socket.linger = 1000
+        self._return_socket.bind(self._return_addr)
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers)
+        poller = zmq.Poller()
+        poller.register(self._socket, zmq.POLLIN)
+        poller.register(self._return_socket, zmq.POLLIN)
         while self.running():
-            name, msg = self._read_one(self._socket)
-            self._process_one(name, msg)
+            socks = dict(poller.poll())
+            if self._return_socket in socks:
+                parts = self._return_socket.recv_multipart(copy=False)
+                self._socket.send_multipart(parts, copy=False)
+            if self._socket in socks:
+                name, msg = self._read_one(self._socket)
+                self._process_one(name, msg)
             
     def run_lazy(self):
         """Register this server as being active for the current thread, but do
@@ -501,6 +852,9 @@ class QtRPCServer(RPCServer):
     in a Qt GUI thread without using a timer to poll the RPC socket. Responses
     are sent back to the poller thread by a secondary socket.
     
+    All requests are processed in the Qt thread; QtRPCServer does not use a
+    pool of worker threads (see :class:`RPCServer`).
+    
     QtRPCServer may be started in newly spawned processes using
     :class:`ProcessSpawner`.
     
@@ -612,11 +966,12 @@ class QtPollThread(QtCore.QThread):
             socks = dict(poller.poll(timeout=100))
             
             if self.return_socket in socks:
-                name, data = self.return_socket.recv_multipart()
-                #logger.debug("poller return %s %s", name, data)
+                parts = self.return_socket.recv_multipart(copy=False)
+                name = parts[0].bytes
+                #logger.debug("poller return %s %s", name, parts[1:])
                 if name == 'STOP':
                     break
-                self.rpc_socket.send_multipart([name, data])
+                self.rpc_socket.send_multipart(parts, copy=False)
                 
             if self.rpc_socket in socks:
                 name, msg = RPCServer._read_one(self.rpc_socket)
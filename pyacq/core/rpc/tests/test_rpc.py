@@ -2,8 +2,8 @@
 # Copyright (c) 2016, French National Center for Scientific Research (CNRS)
 # Distributed under the (new) BSD License. See LICENSE for more info.
 
-import threading, atexit, time, logging
-from pyacq.core.rpc import RPCClient, RemoteCallException, RPCServer, QtRPCServer, ObjectProxy, ProcessSpawner
+import threading, atexit, time, logging, asyncio
+from pyacq.core.rpc import RPCClient, AsyncRPCClient, RemoteCallException, RPCServer, QtRPCServer, ObjectProxy, ProcessSpawner, thread_safe
 from pyacq.core.rpc.log import RPCLogHandler, set_process_name, set_thread_name, start_log_server
 import zmq.utils.monitor
 import numpy as np
@@ -62,6 +62,24 @@ def test_rpc():
     
         def type(self, x):
             return type(x).__name__
+        
+        def echo(self, x):
+            return x
+        
+        def set_data(self, data, delay=0):
+            self.data = np.array(data)
+            time.sleep(delay)
+        
+        def get_data(self):
+            return self.data[:]
+        
+        def fill_data(self, value):
+            self.data[:] = value
+        
+        def set_name(self, name, notify):
+            self.name = name
+            if notify:
+                RPCServer.object_changed(self)
     
     
     server1 = RPCServer()
@@ -205,6 +223,104 @@ def test_rpc():
     print(arr_prox, arr_prox.shape)
     assert arr_prox.shape._get_value() == [10]
 
+    logger.info("-- Test large arrays --")
+    big = np.random.normal(size=(500, 300))
+    assert np.all(obj.add(big, 1) == big + 1)
+    big_f = obj.echo(np.asfortranarray(big))
+    assert big_f.flags['F_CONTIGUOUS']
+    assert np.all(big_f == big)
+    assert np.all(obj.echo(big[::2, ::3]) == big[::2, ::3])
+    
+    # arrays can be changed as soon as they are sent
+    big = np.random.normal(size=(2000, 1000))
+    big2 = big.copy()
+    fut = obj.echo(big2, _sync='async')
+    big2[:] = -1
+    assert np.all(fut.result() == big)
+    big2[:] = big
+    obj.set_data(big2, _sync='off')
+    big2[:] = -1
+    fut = obj.get_data(_sync='async')
+    obj.fill_data(-1, _sync='off')
+    assert np.all(fut.result() == big)
+    # also after a sync request timed out (before the array was sent)
+    big = np.random.normal(size=(2000, 2000))
+    big2 = big.copy()
+    try:
+        obj.set_data(big2, 0.5, _timeout=0.001)
+        assert False, "Should have raised TimeoutError."
+    except TimeoutError:
+        pass
+    big2[:] = -1
+    assert np.all(obj.get_data() == big)
+
+
+    logger.info("-- Test batch calls --")
+    class_proxy = client['test_class']
+    with client.batch() as batch:
+        r1 = batch.call(obj.add, 3, 4)
+        obj4 = batch.call(class_proxy, 'obj4')
+        r2 = batch.call(obj4.add, 5, y=6)
+        r3 = batch.call(obj.test, obj4)
+        r4 = batch.call(obj4.get_list, _return_type='proxy')
+    assert r1.result() == 7
+    assert isinstance(obj4.result(), ObjectProxy)
+    assert r2.result() == 11
+    assert list(r3.result()[:3]) == ['obj1', 'obj4', 12]
+    assert isinstance(r4.result(), ObjectProxy)
+
+    # errors are attributed to each call
+    batch = client.batch()
+    r1 = batch.call(obj.add, 7, 'x')
+    r2 = batch.call(r1.real)
+    r3 = batch.call(obj.add, 1, 2)
+    try:
+        with batch:
+            pass
+    except RemoteCallException as err:
+        assert err.type_str == 'TypeError'
+    else:
+        raise AssertionError('should have raised TypeError')
+    assert r3.result() == 3
+    for r in (r1, r2):
+        try:
+            r.result()
+        except RemoteCallException:
+            pass
+        else:
+            raise AssertionError('should have raised RemoteCallException')
+    del obj4, r4
+
+    logger.info("-- Test attribute cache --")
+    obj5 = class_proxy('obj5')
+    obj5._set_proxy_options(cache_attrs=['name'])
+    assert obj5.name._get_value() == 'obj5'
+    obj5.set_name('obj5b', False)
+    assert obj5.name._get_value() == 'obj5'
+    obj5.set_name('obj5c', True)
+    assert obj5.name._get_value() == 'obj5c'
+    # a lifetime can be given per attribute
+    obj5._set_proxy_options(cache_attrs={'name': 0.2})
+    obj5.set_name('obj5d', False)
+    assert obj5.name._get_value() == 'obj5c'
+    time.sleep(0.3)
+    assert obj5.name._get_value() == 'obj5d'
+    del obj5
+    
+    # a client that only reads cached values sees changes made by other clients
+    obj6 = client['my_object']
+    obj6._set_proxy_options(cache_attrs=['name'])
+    assert obj6.name._get_value() == 'obj1'
+    def rename(name):
+        client2 = RPCClient.get_client(server1.address)
+        client2['my_object'].set_name(name, True)
+    thread = threading.Thread(target=rename, args=('obj1b',))
+    thread.start()
+    thread.join()
+    time.sleep(0.1)
+    assert obj6.name._get_value() == 'obj1b'
+    obj6.set_name('obj1', True)
+    del obj6
 
     logger.info("-- Test import --")
     import os.path as osp
@@ -284,6 +400,153 @@ def test_rpc():
     logger.level = previous_level
 
 
+def test_async_rpc():
+    class TestClass(object):
+        name = 'obj'
+        
+        def add(self, x, y):
+            return x + y
+        
+        def sleep(self, t):
+            time.sleep(t)
+            return t
+
+    server = RPCServer()
+    server['my_object'] = TestClass()
+    serve_thread = threading.Thread(target=server.run_forever, daemon=True)
+    serve_thread.start()
+    
+    async def main():
+        client = AsyncRPCClient.get_client(server.address)
+        assert client is AsyncRPCClient.get_client(server.address)
+        assert client is not RPCClient.get_client(server.address)
+        obj = await client['my_object']
+        assert isinstance(obj, ObjectProxy)
+        assert await obj.add(3, 4) == 7
+        
+        # concurrent requests
+        results = await asyncio.gather(*[obj.add(i, 1) for i in range(10)])
+        assert list(results) == list(range(1, 11))
+        fut = obj.sleep(0.1, _sync='async')
+        assert not fut.done()
+        assert await fut == 0.1
+        assert obj.add(1, 2, _sync='off') is None
+        
+        try:
+            await obj.add(7, 'x')
+        except RemoteCallException as err:
+            assert err.type_str == 'TypeError'
+        else:
+            raise AssertionError('should have raised TypeError')
+        
+        try:
+            await obj.sleep(0.2, _timeout=0.01)
+        except asyncio.TimeoutError:
+            pass
+        else:
+            raise AssertionError('should have raised TimeoutError')
+        
+        assert await obj.name._get_value() == 'obj'
+        obj._set_proxy_options(cache_attrs=['name'])
+        assert await obj.name._get_value() == 'obj'
+        assert await obj.name._get_value() == 'obj'
+        client.close()
+    
+    asyncio.run(main())
+    
+    client = RPCClient.get_client(server.address)
+    client.close_server()
+    client.close()
+    serve_thread.join()
+
+
+def test_rpc_workers():
+    class TestClass(object):
+        def __init__(self):
+            self.calls = []
+        
+        def sleep(self, t, tag=None):
+            self.calls.append(('start', tag))
+            time.sleep(t)
+            self.calls.append(('end', tag))
+            return tag
+        
+        @thread_safe
+        def safe_sleep(self, t):
+            time.sleep(t)
+            return t
+        
+        def get_calls(self):
+            return self.calls
+
+    server = RPCServer(max_workers=4)
+    server['obj1'] = TestClass()
+    server['obj2'] = TestClass()
+    serve_thread = threading.Thread(target=server.run_forever, daemon=True)
+    serve_thread.start()
+    
+    client = RPCClient.get_client(server.address)
+    obj1 = client['obj1']
+    obj2 = client['obj2']
+    
+    # a slow call does not block other requests or calls to other objects
+    fut = obj1.sleep(0.5, _sync='async')
+    start = time.perf_counter()
+    assert client.ping() == 'pong'
+    assert obj2.sleep(0, tag='x') == 'x'
+    assert time.perf_counter() - start < 0.4
+    assert not fut.done()
+    assert fut.result() is None
+    
+    # calls to the same object are invoked one at a time, in order
+    futs = [obj1.sleep(0.05, tag=i, _sync='async') for i in range(3)]
+    assert [f.result() for f in futs] == [0, 1, 2]
+    calls = obj1.get_calls()[2:]
+    assert calls == [['start', 0], ['end', 0], ['start', 1], ['end', 1], ['start', 2], ['end', 2]]
+    
+    # batches and calls on the same object do not overlap, in either order
+    fut = obj1.sleep(0.2, tag='a', _sync='async')
+    batch = client.batch()
+    batch.call(obj2.sleep, 0, tag='x')
+    batch.call(obj1.sleep, 0, tag='b')
+    batch_fut = batch.send(sync='async')
+    batch2 = client.batch()
+    batch2.call(obj1.sleep, 0.2, tag='c')
+    batch2_fut = batch2.send(sync='async')
+    fut2 = obj1.sleep(0, tag='d', _sync='async')
+    assert fut.result() == 'a' and fut2.result() == 'd'
+    batch_fut.result()
+    batch2_fut.result()
+    calls = obj1.get_calls()[-8:]
+    assert calls == [['start', 'a'], ['end', 'a'], ['start', 'b'], ['end', 'b'],
+                     ['start', 'c'], ['end', 'c'], ['start', 'd'], ['end', 'd']]
+    
+    # attribute lookups wait for the calls in progress on the object
+    obj1_attr = client['obj1']
+    obj1_attr._set_proxy_options(defer_getattr=True)
+    fut = obj1.sleep(0.2, tag='e', _sync='async')
+    assert obj1_attr.calls._get_value()[-1] == ['end', 'e']
+    assert fut.result() == 'e'
+    
+    # thread-safe methods run concurrently
+    start = time.perf_counter()
+    futs = [obj1.safe_sleep(0.3, _sync='async') for i in range(3)]
+    assert [f.result() for f in futs] == [0.3] * 3
+    assert time.perf_counter() - start < 0.8
+    
+    # errors are returned from workers
+    try:
+        obj1.sleep('x')
+    except RemoteCallException as err:
+        assert err.type_str == 'TypeError'
+    else:
+        raise AssertionError('should have raised TypeError')
+    
+    client.close_server()
+    client.close()
+    serve_thread.join()
+
+
 def test_qt_rpc():
     previous_level = logger.level
     #logger.level = logging.DEBUG
@@ -46,6 +46,32 @@ def check_serializer(serializer):
             assert v1 == v2
 
 
+def test_out_of_band():
+    serializers = [JsonSerializer()]
+    if HAVE_MSGPACK:
+        serializers.append(MsgpackSerializer())
+    big = np.arange(100000, dtype='float32').reshape(1000, 100)
+    data = {'c': big, 'f': np.asfortranarray(big), 'strided': big[::2, ::3],
+            'small': np.arange(4), 'struct': np.zeros(10000, dtype=[('a', 'int64'), ('b', 'float32')])}
+    for serializer in serializers:
+        frames = []
+        s = serializer.dumps(data, frames)
+        # large arrays are not copied in the message
+        assert len(s) < 1000
+        assert len(frames) == 4
+        assert np.shares_memory(frames[0], big)
+        d2 = serializer.loads(s, [bytes(f) for f in frames])
+        for k, v in data.items():
+            assert d2[k].dtype == v.dtype
+            assert np.all(d2[k] == v)
+        assert d2['f'].flags['F_CONTIGUOUS']
+        
+        # without frames, arrays are sent in-band
+        d2 = serializer.loads(serializer.dumps(data))
+        assert np.all(d2['f'] == big)
+
+
 if __name__ == '__main__':
     test_msgpack()
     test_json()
+    test_out_of_band()
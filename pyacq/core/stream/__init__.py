@@ -3,7 +3,9 @@
 # Distributed under the (new) BSD License. See LICENSE for more info.
 
 from .stream import InputStream, OutputStream
+from .asyncstream import AsyncInputStream, AsyncOutputStream
 from .ringbuffer import RingBuffer
+from .pyramid import MinMaxPyramid
 from .sharedarray import SharedArray
 from .streamhelpers import all_transfermodes, register_transfermode
 from .compression import compression_methods
@@ -11,3 +13,4 @@ from .compression import compression_methods
 # import transfer modes so they register their helper classes
 from . import plaindatastream
 from . import sharedmemstream
+from . import futexstream
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2016, French National Center for Scientific Research (CNRS)
+# Distributed under the (new) BSD License. See LICENSE for more info.
+
+import time
+import asyncio
+import functools
+import concurrent.futures
+import zmq
+import zmq.asyncio
+
+from .stream import InputStream, OutputStream
+
+
+# Longest wait (ms) of a poll() running in a worker thread, so that a
+# cancelled poll releases its thread (and the executor can shut down) quickly.
+_executor_poll_ms = 100
+
+
+class AsyncInputStream(InputStream):
+    """InputStream with coroutine `poll()` and `recv()`, for use from an
+    asyncio event loop.
+
+    Usage::
+
+        instream = AsyncInputStream()
+        instream.connect(output)
+        index, data = await instream.recv()
+
+        async for index, data in instream:
+            ...
+
+    Waiting for data does not block the event loop, so a single loop can
+    service many streams. Streams are waited on through a ``zmq.asyncio``
+    shadow of the stream socket. Transfer modes that do not announce chunks
+    on the socket (``transfermode='sharedmem_futex'``) are waited on in a
+    worker thread, in steps of at most 100 ms so that cancelling the wait
+    takes effect.
+
+    All other methods are the same as :class:`InputStream`.
+    """
+    def connect(self, *args, **kargs):
+        InputStream.connect(self, *args, **kargs)
+        self._async_socket = zmq.asyncio.Socket.shadow(self.socket.underlying)
+
+    async def poll(self, timeout=None):
+        """Wait until a new packet is available or *timeout* (ms) has elapsed.
+
+        Return True if a new packet is available.
+        """
+        if InputStream.poll(self, timeout=0):
+            return True
+        if timeout == 0:
+            return False
+        if self.receiver.socket_notifies:
+            events = await self._async_socket.poll(timeout=timeout, flags=zmq.POLLIN)
+            return events != 0
+        loop = asyncio.get_running_loop()
+        if timeout is not None:
+            deadline = time.perf_counter() + timeout / 1000.
+        while True:
+            step = _executor_poll_ms
+            if timeout is not None:
+                remaining = (deadline - time.perf_counter()) * 1000.
+                if remaining <= 0:
+                    return False
+                step = min(step, remaining)
+            if await loop.run_in_executor(None, InputStream.poll, self, step):
+                return True
+
+    async def recv(self, **kargs):
+        """Wait for and receive a chunk of data.
+
+        See :func:`InputStream.recv`.
+        """
+        while not await self.poll():
+            pass
+        return InputStream.recv(self, **kargs)
+
+    async def iter_chunks(self, size=None, step=None, **kargs):
+        """Asynchronous generator of ``(index, data)`` for every received chunk.
+
+        If *size* is given, fixed-size windows of the attached RingBuffer are
+        yielded instead, as with :func:`InputStream.iter_chunks`.
+
+        Other keyword arguments are passed to :func:`recv`.
+        """
+        while True:
+            if size is None:
+                yield await self.recv(**kargs)
+            else:
+                for chunk in InputStream.iter_chunks(self, size, step, receive=False):
+                    yield chunk
+                await self.recv(**kargs)
+
+    def __aiter__(self):
+        return self.iter_chunks()
+
+    def close(self):
+        # the shadow socket does not own the zmq socket
+        self._async_socket = None
+        InputStream.close(self)
+
+
+class AsyncOutputStream(OutputStream):
+    """OutputStream with a coroutine `send()`, for use from an asyncio event
+    loop.
+
+    Sending only blocks with ``hwm_policy='block'`` (plaindata transfer mode
+    only); in that case chunks are sent from a worker thread (in order) so
+    that the event loop keeps running while readers catch up.
+
+    All other methods are the same as :class:`OutputStream`.
+    """
+    def configure(self, **kargs):
+        OutputStream.configure(self, **kargs)
+        if self.params['hwm_policy'] == 'block':
+            self._executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        else:
+            self._executor = None
+
+    async def send(self, data, index=None, **kargs):
+        """Send a data chunk and its frame index.
+
+        See :func:`OutputStream.send`.
+        """
+        if self._executor is None:
+            OutputStream.send(self, data, index=index, **kargs)
+        else:
+            loop = asyncio.get_running_loop()
+            func = functools.partial(OutputStream.send, self, data, index=index, **kargs)
+            await loop.run_in_executor(self._executor, func)
+
+    def close(self):
+        if getattr(self, '_executor', None) is not None:
+            self._executor.shutdown()
+            self._executor = None
+        OutputStream.close(self)
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2016, French National Center for Scientific Research (CNRS)
+# Distributed under the (new) BSD License. See LICENSE for more info.
+
+import time
+import threading
+import logging
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+
+class ChunkCoalescer:
+    """Collect consecutive chunks sent through an OutputStream and send them as
+    a single chunk.
+
+    Pending chunks are sent when the oldest one has waited *max_latency_ms*,
+    when adding a chunk would exceed *max_chunk_frames*, or when a chunk is not
+    contiguous with the pending ones (its index skips data). The index sent
+    with a merged chunk is the index of its last chunk, so the receiver sees
+    the same stream. A chunk sent with extra keyword arguments is not merged:
+    pending chunks are sent first, then the chunk is sent on its own with its
+    arguments.
+
+    Note: this class is usually not instantiated directly; use
+    ``OutputStream.configure(max_latency_ms=...)``.
+
+    Parameters
+    ----------
+    send_func : callable
+        Called as ``send_func(index, data, **kargs)`` to send a chunk. It is
+        called either from the thread that calls `send()` or from the
+        timer thread, but never concurrently.
+    max_latency_ms : float
+        Maximum time (ms) a chunk may be held before it is sent.
+    max_chunk_frames : int or None
+        Maximum number of frames in a merged chunk.
+    """
+    def __init__(self, send_func, max_latency_ms, max_chunk_frames=None):
+        self.send_func = send_func
+        self.max_latency = max_latency_ms / 1000.
+        self.max_chunk_frames = max_chunk_frames
+
+        self.lock = threading.Condition()
+        self.pending = []
+        self.pending_frames = 0
+        self.last_index = None
+        self.deadline = None
+
+        self._running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def send(self, index, data, **kargs):
+        """Queue a chunk for sending.
+        """
+        size = data.shape[0]
+        with self.lock:
+            if len(kargs) > 0:
+                self._flush()
+                self.send_func(index, data, **kargs)
+                return
+            if len(self.pending) > 0 and index - size != self.last_index:
+                # data was skipped; chunks cannot be merged
+                self._flush()
+            if self.max_chunk_frames is not None:
+                if self.pending_frames + size > self.max_chunk_frames:
+                    self._flush()
+                if size >= self.max_chunk_frames:
+                    self.send_func(index, data)
+                    return
+
+            if len(self.pending) == 0:
+                self.deadline = time.perf_counter() + self.max_latency
+                self.lock.notify()
+            # the caller may reuse its array after send()
+            self.pending.append(np.array(data, copy=True))
+            self.pending_frames += size
+            self.last_index = index
+
+            if self.pending_frames == self.max_chunk_frames:
+                self._flush()
+
+    def flush(self):
+        """Send all pending chunks now.
+        """
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        # must be called with self.lock acquired
+        if len(self.pending) == 0:
+            return
+        if len(self.pending) == 1:
+            data = self.pending[0]
+        else:
+            data = np.concatenate(self.pending, axis=0)
+        self.pending = []
+        self.pending_frames = 0
+        self.deadline = None
+        self.send_func(self.last_index, data)
+
+    def _run(self):
+        with self.lock:
+            while self._running:
+                if self.deadline is None:
+                    self.lock.wait()
+                    continue
+                dt = self.deadline - time.perf_counter()
+                if dt <= 0:
+                    try:
+                        self._flush()
+                    except Exception:
+                        logger.exception("ChunkCoalescer failed to send data")
+                else:
+                    self.lock.wait(dt)
+
+    def close(self):
+        """Send pending chunks and stop the timer thread.
+        """
+        with self.lock:
+            self._flush()
+            self._running = False
+            self.lock.notify()
+        self.thread.join()
@@ -1,4 +1,22 @@
-compression_methods = ['']
+import time
+import zlib
+import struct
+import numpy as np
+
+from .arraytools import decompose_array
+
+
+# Compression backends. A compression method is either a backend name or a
+# pipeline of filters followed by an optional backend, joined with '+'
+# (e.g. 'delta+bitshuffle+zstd').
+compression_methods = ['', 'zlib']
+
+# Filters applied before the backend:
+#  * delta: per-channel temporal difference (integer dtypes only; other
+#    dtypes are sent unchanged).
+#  * shuffle: group the n-th byte of every item together.
+#  * bitshuffle: group the n-th bit of every item together.
+compression_filters = ['delta', 'shuffle', 'bitshuffle']
 
 
 _blosc_methods = ['blosc-blosclz', 'blosc-lz4']
@@ -9,35 +27,289 @@ try:
 except ImportError:
     HAVE_BLOSC = False
 
+try:
+    import blosc2
+    HAVE_BLOSC2 = True
+    compression_methods.append('blosc2')
+except ImportError:
+    HAVE_BLOSC2 = False
+
+try:
+    import zstandard
+    HAVE_ZSTD = True
+    compression_methods.append('zstd')
+except ImportError:
+    HAVE_ZSTD = False
+
+try:
+    import lz4.frame
+    HAVE_LZ4 = True
+    compression_methods.append('lz4')
+except ImportError:
+    HAVE_LZ4 = False
+
+_optional_methods = {'blosc-blosclz': 'blosc', 'blosc-lz4': 'blosc', 'blosc2': 'blosc2',
+                     'zstd': 'zstandard', 'lz4': 'lz4'}
+
+
+# Prepended (uncompressed) to the payload when byte filters are used:
+# total number of bytes, item size.
+_filter_header = struct.Struct('!QQ')
+
+_parsed_methods = {}
+
+
+def parse_method(method):
+    """Split a compression method into a list of filters and a backend.
+
+    Raise ValueError if the method is invalid or not available.
+    """
+    if method in _parsed_methods:
+        return _parsed_methods[method]
+
+    parts = method.split('+') if method != '' else []
+    filters = []
+    backend = ''
+    for i, part in enumerate(parts):
+        if part in compression_filters:
+            filters.append(part)
+        elif i == len(parts) - 1:
+            backend = part
+        else:
+            raise ValueError('Invalid compression method "%s"; filters must come before '
+                             'the backend' % method)
+    _check_method(backend)
+
+    _parsed_methods[method] = (filters, backend)
+    return filters, backend
+
 
 def compress(data, method, *args, **kwds):
+    """Compress a buffer.
+
+    *data* is a contiguous array or bytes. The first extra argument is the item
+    size used by shuffle filters and blosc. The delta filter is not applied
+    here; see `delta_encode()`.
+
+    Return the compressed data as bytes (or *data* itself if *method* is '').
+    """
     if method == '':
         return data
-    _check_method(method)
-    
-    if method.startswith('blosc-'):
-        kwds['cname'] = method[6:]
+    filters, backend = parse_method(method)
+    typesize = args[0] if len(args) > 0 else 1
+
+    byte_filters = [f for f in filters if f != 'delta']
+    if len(byte_filters) > 0:
+        buf = _as_bytes_array(data)
+        header = _filter_header.pack(buf.size, typesize)
+        for f in byte_filters:
+            buf = _byte_filters[f][0](buf, typesize)
+        data = buf
+
+    if backend == '':
+        pass
+    elif backend.startswith('blosc-'):
+        kwds['cname'] = backend[6:]
         data = blosc.compress(data, *args, **kwds)
+    elif backend == 'blosc2':
+        data = blosc2.compress(data, typesize=typesize)
+    elif backend == 'zlib':
+        data = zlib.compress(data, 1)
+    elif backend == 'zstd':
+        data = zstandard.ZstdCompressor(level=1).compress(data)
+    elif backend == 'lz4':
+        data = lz4.frame.compress(data)
     else:
         raise ValueError("Unknown compression method '%s'" % method)
-    
+
+    if len(byte_filters) > 0:
+        data = header + bytes(data)
+
     return data
 
 
 def decompress(data, method, *args, **kwds):
     if method == '':
         return data
-    _check_method(method)
-    
-    if method.startswith('blosc-'):
-        return blosc.decompress(data)
+    filters, backend = parse_method(method)
+
+    byte_filters = [f for f in filters if f != 'delta']
+    if len(byte_filters) > 0:
+        data = memoryview(data)
+        nbytes, typesize = _filter_header.unpack_from(data)
+        data = data[_filter_header.size:]
+
+    if backend == '':
+        pass
+    elif backend.startswith('blosc-'):
+        data = blosc.decompress(data)
+    elif backend == 'blosc2':
+        data = blosc2.decompress(data)
+    elif backend == 'zlib':
+        data = zlib.decompress(data)
+    elif backend == 'zstd':
+        data = zstandard.ZstdDecompressor().decompress(data)
+    elif backend == 'lz4':
+        data = lz4.frame.decompress(data)
     else:
         raise ValueError("Unknown compression method '%s'" % method)
 
+    if len(byte_filters) > 0:
+        buf = np.frombuffer(data, dtype='uint8')
+        for f in byte_filters[::-1]:
+            buf = _byte_filters[f][1](buf, typesize, nbytes)
+        data = buf
+
+    return data
+
 
 def _check_method(method):
     if method not in compression_methods:
-        if method in _blosc_methods:
-            raise ValueError("Cannot use %s compression; blosc package is not importable." % method)
+        if method in _optional_methods:
+            raise ValueError("Cannot use %s compression; %s package is not importable." %
+                             (method, _optional_methods[method]))
         else:
             raise ValueError('Unknown compression method "%s"' % method)
+
+
+def use_delta(method):
+    """Return True if *method* includes the delta filter.
+    """
+    return 'delta' in parse_method(method)[0]
+
+
+def delta_encode(data):
+    """Return the difference between consecutive frames of *data* (along axis 0).
+
+    The first frame is kept as is. Only integer arrays are encoded (using
+    wrap-around arithmetic, so that `delta_decode()` is exact); other arrays
+    are returned unchanged.
+    """
+    if data.dtype.kind not in 'iu' or data.shape[0] < 2:
+        return data
+    out = np.empty_like(data)
+    out[0] = data[0]
+    np.subtract(data[1:], data[:-1], out=out[1:])
+    return out
+
+
+def delta_decode(data, out=None):
+    """Inverse of `delta_encode()`.
+    """
+    if data.dtype.kind not in 'iu':
+        if out is not None:
+            out[...] = data
+            return out
+        return data
+    return np.cumsum(data, axis=0, dtype=data.dtype, out=out)
+
+
+def _as_bytes_array(data):
+    if isinstance(data, np.ndarray):
+        return data.reshape(-1).view('uint8')
+    return np.frombuffer(data, dtype='uint8')
+
+
+def _shuffle(buf, typesize):
+    n = buf.size // typesize
+    out = np.empty(buf.size, dtype='uint8')
+    out[:n*typesize] = buf[:n*typesize].reshape(n, typesize).T.reshape(-1)
+    # trailing bytes that do not make a full item are kept as is
+    out[n*typesize:] = buf[n*typesize:]
+    return out
+
+
+def _unshuffle(buf, typesize, nbytes):
+    n = nbytes // typesize
+    out = np.empty(nbytes, dtype='uint8')
+    out[:n*typesize] = buf[:n*typesize].reshape(typesize, n).T.reshape(-1)
+    out[n*typesize:] = buf[n*typesize:nbytes]
+    return out
+
+
+def _bitshuffle(buf, typesize):
+    # bit planes of the byte-shuffled buffer
+    bits = np.unpackbits(_shuffle(buf, typesize).reshape(-1, 1), axis=1)
+    return np.packbits(bits.T.reshape(-1))
+
+
+def _bitunshuffle(buf, typesize, nbytes):
+    bits = np.unpackbits(buf)[:nbytes*8].reshape(8, nbytes).T
+    return _unshuffle(np.packbits(bits.reshape(-1)), typesize, nbytes)
+
+
+_byte_filters = {
+    'shuffle': (_shuffle, _unshuffle),
+    'bitshuffle': (_bitshuffle, _bitunshuffle),
+}
+
+
+def benchmark_compression(data, methods=None, chunksize=1024, verbose=True):
+    """Measure the compression ratio and speed of compression methods on *data*.
+
+    *data* is compressed chunk by chunk along axis 0, as a plaindata stream
+    would do. This can be used on recorded data (for instance a numpy.memmap
+    on a file written by :class:`RawRecorder`) to choose the compression of a
+    stream.
+
+    Parameters
+    ----------
+    data : ndarray
+        The data to compress, with time on axis 0.
+    methods : list or None
+        Compression methods to test. By default, every available backend
+        alone and preceded by 'delta+shuffle' and 'delta+bitshuffle'.
+    chunksize : int
+        Number of frames per chunk.
+    verbose : bool
+        If True, print a table of the results.
+
+    Returns
+    -------
+    results : list of dict
+        One dict per method with keys 'method', 'ratio' (original size /
+        compressed size), 'compress_speed' and 'decompress_speed' (MB/s of
+        original data).
+    """
+    if methods is None:
+        methods = []
+        for backend in compression_methods:
+            methods.append(backend)
+            for filters in ('delta+shuffle', 'delta+bitshuffle'):
+                methods.append(filters + ('+' + backend if backend != '' else ''))
+
+    data = np.asarray(data)
+    chunks = [data[i:i+chunksize] for i in range(0, data.shape[0], chunksize)]
+    nbytes = data.nbytes
+
+    results = []
+    for method in methods:
+        delta = use_delta(method)
+
+        t0 = time.perf_counter()
+        compressed = []
+        for chunk in chunks:
+            if delta:
+                chunk = delta_encode(chunk)
+            buf, offset, strides = decompose_array(chunk)
+            compressed.append(compress(buf, method, chunk.itemsize))
+        t1 = time.perf_counter()
+        for chunk, comp in zip(chunks, compressed):
+            buf = decompress(comp, method)
+            chunk2 = np.frombuffer(buf, dtype=chunk.dtype).reshape(chunk.shape)
+            if delta:
+                chunk2 = delta_decode(chunk2)
+        t2 = time.perf_counter()
+
+        comp_size = sum(len(memoryview(c).cast('B')) for c in compressed)
+        results.append({'method': method,
+                        'ratio': nbytes / comp_size,
+                        'compress_speed': nbytes / 1e6 / max(t1 - t0, 1e-9),
+                        'decompress_speed': nbytes / 1e6 / max(t2 - t1, 1e-9)})
+
+    if verbose:
+        print('%s %8s %16s %16s' % ('method'.ljust(30), 'ratio', 'compress MB/s', 'decompress MB/s'))
+        for r in results:
+            print('%s %8.2f %16.1f %16.1f' % (repr(r['method']).ljust(30), r['ratio'],
+                                              r['compress_speed'], r['decompress_speed']))
+    return results
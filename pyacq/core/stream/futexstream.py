@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2016, French National Center for Scientific Research (CNRS)
+# Distributed under the (new) BSD License. See LICENSE for more info.
+
+import sys
+import time
+import platform
+import ctypes
+import numpy as np
+
+from .streamhelpers import register_transfermode
+from .sharedmemstream import SharedMemSender, SharedMemReceiver
+from .ringbuffer import _NOTIFY, _TIMESTAMP
+from .streamstats import stream_clock
+
+
+# futex(2) is only reachable through syscall(); its number depends on the arch.
+_SYS_futex = {'x86_64': 202, 'i386': 240, 'i686': 240, 'aarch64': 98,
+              'armv7l': 240, 'ppc64le': 221}.get(platform.machine(), None)
+_FUTEX_WAIT = 0
+_FUTEX_WAKE = 1
+
+HAVE_FUTEX = sys.platform.startswith('linux') and _SYS_futex is not None
+if HAVE_FUTEX:
+    try:
+        _libc = ctypes.CDLL(None, use_errno=True)
+        _libc.syscall.restype = ctypes.c_long
+    except (OSError, AttributeError):
+        HAVE_FUTEX = False
+
+
+class _timespec(ctypes.Structure):
+    _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+
+def futex_wait(word, expected, timeout=None):
+    """Block until *word* is woken up by `futex_wake()`, or until *timeout*
+    (in ms) has elapsed.
+
+    *word* is a 1-element int32 array (usually in shared memory). The call
+    returns immediately if the value of *word* is not *expected* anymore.
+    The GIL is released while waiting.
+    """
+    if timeout is None:
+        ts = None
+    else:
+        ts = ctypes.byref(_timespec(int(timeout // 1000), int((timeout % 1000) * 1000000)))
+    # Return value is ignored: wake up, value changed (EAGAIN), timeout and
+    # signal (EINTR) are all handled by the caller checking the buffer again.
+    _libc.syscall(ctypes.c_long(_SYS_futex), ctypes.c_void_p(word.ctypes.data),
+                  ctypes.c_int(_FUTEX_WAIT), ctypes.c_int(int(expected)), ts,
+                  None, ctypes.c_int(0))
+
+
+def futex_wake(word):
+    """Wake up all threads and processes waiting on *word*.
+    """
+    _libc.syscall(ctypes.c_long(_SYS_futex), ctypes.c_void_p(word.ctypes.data),
+                  ctypes.c_int(_FUTEX_WAKE), ctypes.c_int(2**31 - 1), None,
+                  None, ctypes.c_int(0))
+
+
+def _notify_word(ring_buffer):
+    # int32 view of the notification slot of the ring buffer header
+    return ring_buffer._header[_NOTIFY:_NOTIFY+1].view('int32')[:1]
+
+
+def _timestamp_slot(ring_buffer):
+    # float64 view of the send time slot of the ring buffer header
+    return ring_buffer._header[_TIMESTAMP:_TIMESTAMP+1].view('float64')
+
+
+class FutexSharedMemSender(SharedMemSender):
+    """Stream sender that writes data in a shared memory ring buffer (as
+    :class:`SharedMemSender`) and wakes up readers with a futex stored in the
+    buffer header instead of sending a message over the socket.
+
+    This removes the ZeroMQ hop from the notification path and thus reduces
+    wake-up latency. It only works for readers running on the same host.
+
+    Note: this class is usually not instantiated directly; use
+    ``OutputStream.configure(transfermode='sharedmem_futex')``. It accepts the
+    same parameters as :class:`SharedMemSender`.
+    """
+    def __init__(self, socket, params):
+        SharedMemSender.__init__(self, socket, params)
+        self._word = _notify_word(self._buffer)
+        self._timestamp = _timestamp_slot(self._buffer) if self.params.get('stats', False) else None
+
+    def send(self, index, data):
+        self._write_chunk(index, data)
+        if self._timestamp is not None:
+            self._timestamp[0] = stream_clock()
+        self._word += 1
+        futex_wake(self._word)
+
+    def reset_index(self):
+        SharedMemSender.reset_index(self)
+        self._word += 1
+        futex_wake(self._word)
+
+
+class FutexSharedMemReceiver(SharedMemReceiver):
+    """Stream receiver for :class:`FutexSharedMemSender`.
+
+    There is no message per chunk: each call to `recv()` returns all data
+    written since the previous call (the index is the index of the last
+    sample + 1, as usual). If the reader fell behind by more than
+    ``buffer_size`` frames, the overwritten data is skipped and counted in
+    `overruns`.
+    """
+    socket_notifies = False
+
+    def __init__(self, socket, params):
+        SharedMemReceiver.__init__(self, socket, params)
+        self._word = _notify_word(self.buffer)
+        self._timestamp = _timestamp_slot(self.buffer) if self.params.get('stats', False) else None
+        self._generation, self._last_index, _ = self.buffer._read_header()
+
+    def _new_index(self):
+        gen, index, write_index = self.buffer._read_header()
+        if gen != self._generation:
+            # sender was reset; start over from index 0
+            self._generation = gen
+            self._last_index = 0
+        return index, write_index
+
+    def poll(self, timeout=None):
+        if timeout is not None:
+            deadline = time.perf_counter() + timeout / 1000.
+        while True:
+            # read the futex word *before* checking the index to not miss a
+            # wake up between the check and the wait.
+            expected = self._word[0]
+            index, _ = self._new_index()
+            if index != self._last_index:
+                return True
+            if timeout is None:
+                futex_wait(self._word, expected)
+            else:
+                remaining = (deadline - time.perf_counter()) * 1000.
+                if remaining <= 0:
+                    return False
+                futex_wait(self._word, expected, remaining)
+
+    def recv(self, return_data=False):
+        """Wait for new data in the ring buffer.
+
+        Parameters:
+        -----------
+        return_data : bool
+            If True, return the new data (this may involve copying data
+            from the shared ring buffer). If False, then return None in place
+            of data (the new data can still be accessed using __getitem__). The
+            default is False.
+        """
+        self.poll()
+        index, write_index = self._new_index()
+        start = self._last_index
+        first = write_index - self.buffer.shape[0]
+        if start < first:
+            self.overruns += 1
+            start = first
+        self._last_index = index
+        self._publish_cursor(index)
+        if self._timestamp is not None:
+            # send time of the newest chunk
+            self.last_timestamp = self._timestamp[0]
+        if return_data:
+            data = self.buffer[start:index]
+        else:
+            data = None
+        return index, data
+
+    def empty_queue(self):
+        self._last_index, _ = self._new_index()
+        self._publish_cursor(self._last_index)
+
+
+if HAVE_FUTEX:
+    register_transfermode('sharedmem_futex', FutexSharedMemSender, FutexSharedMemReceiver)
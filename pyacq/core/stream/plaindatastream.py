@@ -4,10 +4,53 @@
 
 import struct
 import numpy as np
+import zmq
 
 from .streamhelpers import DataSender, DataReceiver, register_transfermode
 from .arraytools import is_contiguous, decompose_array, make_dtype
-from .compression import compress, decompress
+from .compression import compress, decompress, use_delta, delta_encode, delta_decode
+from .streamstats import stream_clock
+
+
+# Header sent before each chunk: ndim, index, offset, shape, strides and,
+# for streams configured with stats=True, the send timestamp.
+# Structs are compiled once per ndim.
+_header_structs = {}
+
+def _header_struct(ndim, timestamp=False):
+    st = _header_structs.get((ndim, timestamp), None)
+    if st is None:
+        st = struct.Struct('!' + 'Q' * (3+ndim) + 'q' * ndim + ('d' if timestamp else ''))
+        _header_structs[(ndim, timestamp)] = st
+    return st
+
+_index_struct = struct.Struct('!QQ')
+_timestamp_struct = struct.Struct('!d')
+
+
+# Each message starts with a topic frame: the full stream is published on
+# _full_topic and channel subsets on 'ch:<channels>;'. Topics end with ';' so
+# that none of them is a prefix of another.
+_full_topic = b'*;'
+
+def channel_topic(channels=None):
+    """Return the topic on which a subset of *channels* (or the full stream
+    if None) is published.
+    """
+    if channels is None:
+        return _full_topic
+    return ('ch:' + ','.join(str(int(c)) for c in channels) + ';').encode()
+
+def _parse_topic(topic):
+    # return (valid, channels)
+    if topic == _full_topic:
+        return True, None
+    if topic.startswith(b'ch:') and topic.endswith(b';'):
+        try:
+            return True, [int(c) for c in topic[3:-1].split(b',')]
+        except ValueError:
+            pass
+    return False, None
 
 
 class PlainDataSender(DataSender):
@@ -20,13 +63,61 @@ class PlainDataSender(DataSender):
     sent exactly as it appears in memory including array strides.
     
     This class supports compression.
+    
+    InputStreams can subscribe to a subset of the channels (axis 1) of the
+    stream (see :func:`InputStream.connect`). Subscriptions are read from the
+    XPUB socket, and each chunk is sliced and sent once per distinct subset
+    that has subscribers. With ``hwm_policy='drop_newest'``, a chunk that does
+    not fit in the queue of one subset is still sent to the other subsets
+    (and counted as dropped).
     """
+    socket_type = zmq.XPUB
+    supports_nodrop = True
+    
+    def __init__(self, socket, params):
+        DataSender.__init__(self, socket, params)
+        # also checks that the compression method is available
+        self._delta = use_delta(self.params['compression'])
+        self._timestamp = self.params.get('stats', False)
+        # topic: channels (None for the full stream) for each subscribed topic
+        self._topics = {}
+
     def send(self, index, data):
+        source = data
         # optional pre-processing before send
         if isinstance(data, np.ndarray):
             for f in self.funcs:
                 index, data = f(index, data)
-                
+        if self._delta:
+            data = delta_encode(data)
+        
+        self._update_subscriptions()
+        dropped = False
+        for topic, channels in self._topics.items():
+            try:
+                if channels is None:
+                    self._send_chunk(topic, index, data, source)
+                else:
+                    self._send_chunk(topic, index, data.take(channels, axis=1), source)
+            except zmq.Again:
+                # a reader of this topic is full; still send to the others
+                dropped = True
+        if dropped:
+            raise zmq.Again()
+    
+    def _update_subscriptions(self):
+        socket = self.socket
+        while socket.getsockopt(zmq.EVENTS) & zmq.POLLIN:
+            msg = socket.recv()
+            valid, channels = _parse_topic(msg[1:])
+            if not valid:
+                continue
+            if msg[0] == 1:
+                self._topics[msg[1:]] = channels
+            else:
+                self._topics.pop(msg[1:], None)
+    
+    def _send_chunk(self, topic, index, data, source):
         # serialize
         dtype = data.dtype
         shape = data.shape
@@ -36,48 +127,107 @@ class PlainDataSender(DataSender):
         # compress
         comp = self.params['compression']
         buf = compress(buf, comp, data.itemsize)
+        if not isinstance(buf, np.ndarray):
+            buf = np.frombuffer(buf, dtype='uint8')
         
         
         # Pack and send
-        stat = struct.pack('!' + 'Q' * (3+len(shape)) + 'q' * len(strides), len(shape), index, offset, *(shape + strides))
+        header = _header_struct(len(shape), self._timestamp)
+        if self._timestamp:
+            stat = header.pack(len(shape), index, offset, *(shape + strides + (stream_clock(),)))
+        else:
+            stat = header.pack(len(shape), index, offset, *(shape + strides))
         copy = self.params.get('copy', False)
 
         # this trick avoid "does not support the buffer interface." for datetime[ms] dtype in python
-        buf = buf.flatten().view('uint8')
-        self.socket.send_multipart([stat, buf], copy=copy)
+        buf = buf.reshape(-1).view('uint8')
+        if np.may_share_memory(buf, source):
+            # zmq may send the buffer after send() returns, and the caller
+            # may then reuse its array
+            buf = buf.copy()
+        self.socket.send_multipart([topic, stat, buf], copy=copy)
 
 
 class PlainDataReceiver(DataReceiver):
     """Helper class to receive data serialized over socket.
     
     See PlainDataSender.
+
+    If the stream params contain 'channels', only this subset of channels is
+    received.
+
+    The header layout and the dtype are prepared once from the stream
+    parameters when the InputStream is connected, and the data part of each
+    message is received without copy. With ``recv(out=array)``, data is
+    written into a caller-provided array.
     """
+    supports_channels = True
+
     def __init__(self, socket, params):
         DataReceiver.__init__(self, socket, params)
-    
-    def recv(self, return_data=True):
+        self.dtype = make_dtype(self.params['dtype'])
+        self._timestamp = self.params.get('stats', False)
+        self._header = _header_struct(len(self.params['shape']), self._timestamp)
+        self._can_recv_into = hasattr(self.socket, 'recv_into')
+        self._delta = use_delta(self.params['compression'])
+        self.topic = channel_topic(self.params.get('channels', None))
+
+    def recv(self, return_data=True, out=None):
+        """Receive a data chunk.
+
+        Parameters
+        ----------
+        return_data : bool
+            If False, then only the index is decoded and None is returned in
+            place of the data.
+        out : ndarray or None
+            Array in which the received chunk is written. It must have the
+            shape of the chunk. When the chunk is uncompressed and has the same
+            dtype and memory layout as *out*, it is received directly into
+            *out* without intermediate buffer.
+        """
         # receive and unpack structure
-        stat, data = self.socket.recv_multipart()
-        ndim = struct.unpack('!Q', stat[:8])[0]
-        stat = struct.unpack('!' + 'Q' * (ndim + 2) + 'q' * ndim, stat[8:])
-        index = stat[0]
-        
+        self.socket.recv()  # topic
+        stat = self.socket.recv()
+        if self._timestamp:
+            self.last_timestamp = _timestamp_struct.unpack_from(stat, len(stat) - 8)[0]
+
         if not return_data:
+            index = _index_struct.unpack_from(stat)[1]
+            self.socket.recv(copy=False)
             return index, None
-        
-        offset = stat[1]
-        shape = stat[2:2+ndim]
-        strides = stat[-ndim:]
-        
-        # uncompress
+
+        header = self._header
+        if len(stat) != header.size:
+            # chunk does not have the ndim of the stream
+            header = _header_struct(_index_struct.unpack_from(stat)[0], self._timestamp)
+        stat = header.unpack(stat)
+        ndim = stat[0]
+        index = stat[1]
+        offset = stat[2]
+        shape = stat[3:3+ndim]
+        strides = stat[3+ndim:3+2*ndim]
+
         comp = self.params['compression']
+        if (out is not None and self._can_recv_into and comp == '' and offset == 0
+                and out.dtype == self.dtype and out.shape == shape
+                and out.strides == strides and out.flags['C_CONTIGUOUS']):
+            self.socket.recv_into(out.reshape(-1).view('uint8'))
+            return index, out
+
+        data = self.socket.recv(copy=False).buffer
+
+        # uncompress
         data = decompress(data, comp)
-        
+
         # convert to array
-        dtype = make_dtype(self.params['dtype']) # this avoid some bugs but is not efficient because this is call every sends...
-        #~ dtype = self.params['dtype']
         data = np.ndarray(buffer=data, shape=shape,
-                          strides=strides, offset=offset, dtype=dtype)        
+                          strides=strides, offset=offset, dtype=self.dtype)
+        if self._delta:
+            return index, delta_decode(data, out=out)
+        if out is not None:
+            out[...] = data
+            data = out
         return index, data
 
 
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2016, French National Center for Scientific Research (CNRS)
+# Distributed under the (new) BSD License. See LICENSE for more info.
+
+import numpy as np
+
+from .ringbuffer import RingBuffer
+
+
+class MinMaxPyramid:
+    """Multi-resolution min / max / mean summary of a :class:`RingBuffer`.
+
+    Level *k* holds, for each block of ``2**k`` consecutive frames of the
+    buffer, the minimum, maximum and mean of the block. Levels are updated
+    incrementally from the frames that arrived since the last call to
+    `update()` (level k is computed from level k-1), so that a viewer can read
+    a decimated version of a long segment in time proportional to the number
+    of points displayed instead of the number of frames.
+
+    The pyramid only reads from the buffer, so it can also summarize a shared
+    memory buffer written by another process. It is usually not instantiated
+    directly; use :func:`InputStream.set_pyramid()`, which updates it each
+    time a chunk is received.
+
+    Parameters
+    ----------
+    buffer : RingBuffer
+        The buffer to summarize.
+    levels : int
+        Number of levels. Level *levels* has a decimation factor of
+        ``2**levels``. It is limited by the size of the buffer.
+    """
+    def __init__(self, buffer, levels=8):
+        self.buffer = buffer
+        bsize = buffer.shape[0]
+        self.levels = max(min(levels, int(np.log2(bsize))), 0)
+        self.mean_dtype = np.result_type(buffer.dtype, 'float32')
+
+        # index 0 stands for the buffer itself
+        self._min, self._max, self._mean = [None], [None], [None]
+        for k in range(1, self.levels + 1):
+            shape = (bsize >> k,) + tuple(buffer.shape[1:])
+            self._min.append(RingBuffer(shape, buffer.dtype, double=False, axisorder=buffer.axisorder))
+            self._max.append(RingBuffer(shape, buffer.dtype, double=False, axisorder=buffer.axisorder))
+            self._mean.append(RingBuffer(shape, self.mean_dtype, double=False, axisorder=buffer.axisorder))
+        self._generation = buffer.generation()
+
+    def update(self):
+        """Add the frames that arrived in the buffer since the last update to
+        all levels.
+        """
+        gen = self.buffer.generation()
+        if gen != self._generation:
+            # buffer index was reset
+            for bufs in (self._min, self._max, self._mean):
+                for buf in bufs[1:]:
+                    buf.reset_index()
+            self._generation = gen
+
+        for k in range(1, self.levels + 1):
+            if k == 1:
+                src = self.buffer
+            else:
+                src = self._min[k-1]
+            # only complete blocks of 2 frames of the level below are summarized
+            start = max(self._min[k].index() * 2, src.first_index() + src.first_index() % 2)
+            stop = src.index() - src.index() % 2
+            if stop <= start:
+                break
+            shape = ((stop - start) // 2, 2) + tuple(self.buffer.shape[1:])
+            if k == 1:
+                blocks = src.get_data(start, stop).reshape(shape)
+                mins = maxs = means = blocks
+            else:
+                mins = self._min[k-1].get_data(start, stop).reshape(shape)
+                maxs = self._max[k-1].get_data(start, stop).reshape(shape)
+                means = self._mean[k-1].get_data(start, stop).reshape(shape)
+
+            index = stop // 2
+            self._min[k].new_chunk(mins.min(axis=1), index=index)
+            self._max[k].new_chunk(maxs.max(axis=1), index=index)
+            self._mean[k].new_chunk(means.mean(axis=1, dtype=self.mean_dtype), index=index)
+
+    def index(self, level):
+        """Return the buffer index up to which *level* is available.
+        """
+        if level == 0:
+            return self.buffer.index()
+        return self._min[level].index() << level
+
+    def level_for(self, decimate):
+        """Return the highest level whose decimation factor is not larger than
+        *decimate*.
+        """
+        return int(min(max(np.log2(max(decimate, 1)), 0), self.levels))
+
+    def get_data(self, start, stop, level):
+        """Return ``(min, max, mean)`` arrays summarizing the buffer from
+        *start* to *stop* at *level*.
+
+        *start* and *stop* are buffer indices; they are rounded down to a
+        multiple of ``2**level``. Each returned array has one frame per
+        block of ``2**level`` frames. Level 0 returns the buffer data itself
+        for all three arrays.
+        """
+        if level == 0:
+            data = self.buffer.get_data(start, stop)
+            return data, data, data
+        if not 0 < level <= self.levels:
+            raise ValueError("level must be between 0 and %d" % self.levels)
+        start, stop = start >> level, stop >> level
+        return (self._min[level].get_data(start, stop),
+                self._max[level].get_data(start, stop),
+                self._mean[level].get_data(start, stop))
@@ -2,12 +2,25 @@
 # Copyright (c) 2016, French National Center for Scientific Research (CNRS)
 # Distributed under the (new) BSD License. See LICENSE for more info.
 
+import tempfile
 import numpy as np
 
-from .sharedarray import SharedMem, SharedArray
+from .sharedarray import SharedMem, SharedArray, shm_pool
 from .arraytools import make_dtype
 
 
+# Layout of the int64 header that precedes the data in shared memory. Slots
+# that are not listed here are reserved.
+_header_slots = 8
+_header_size = _header_slots * 8
+_READ_INDEX = 0
+_WRITE_INDEX = 1
+_SEQUENCE = 2    # incremented before and after each header update (odd while updating)
+_GENERATION = 3  # incremented each time the indexes are reset
+_NOTIFY = 4      # int32 futex word used by transfermode='sharedmem_futex'
+_TIMESTAMP = 5   # float64 send time of the last chunk (transfermode='sharedmem_futex', stats=True)
+
+
 class RingBuffer:
     """Class that collects data as it arrives from an InputStream and writes it
     into a single- or double-ring buffer.
@@ -15,12 +28,77 @@ class RingBuffer:
     This allows the user to request the concatenated history of data
     received by the stream, up to a predefined length. Double ring buffers
     allow faster, copyless reads at the expense of doubled write time and memory
-    footprint.
+    footprint. A single ring buffer can instead mirror only its first
+    *max_read_size* frames after its end (a guard band), which makes reads of up
+    to *max_read_size* frames copyless for a write time and memory footprint of
+    ``1 + max_read_size / size``.
+    
+    Parameters
+    ----------
+    shape : tuple
+        Shape of the buffer; the first axis is time.
+    dtype : str or dtype
+        Data type of the buffer.
+    double : bool
+        If True, then use a double ring buffer (see above).
+    shmem : None, True, or str
+        If None, the buffer lives in local memory. If True, a shared memory
+        buffer is taken from the per-process pool (see :class:`SharedMemPool`)
+        and returned to it by `close()`. If str, the shared memory buffer with
+        this id is opened (see :class:`SharedMem`).
+    fill : scalar or None
+        Value used to fill the buffer where no data is available. By default
+        0 for integer types and nan otherwise (always 0 with backing='mmap').
+    axisorder : tuple or None
+        Order of the buffer axes in memory.
+    shm_options : dict or None
+        Extra keyword arguments (*backend*, *populate*, *hugepages*) passed
+        to :class:`SharedMem` when creating a new shared memory buffer.
+    max_read_size : int or None
+        For single ring buffers (double=False), the number of frames mirrored
+        after the end of the buffer. Segments of up to this length are always
+        read without copy. Readers of a shared memory buffer must use the
+        same value as the writer.
+    backing : 'memory' or 'mmap'
+        Where the buffer data is stored. With 'mmap', the data lives in a
+        memory-mapped file (see `numpy.memmap`): recent data is served from the
+        page cache and older data is paged in from disk when it is read, so very
+        long histories can be kept with a bounded resident memory. Use
+        double=False (optionally with *max_read_size*) to avoid writing every
+        frame twice to the file. Not compatible with *shmem*.
+    path : str or None
+        With backing='mmap', the file to use (it is created or overwritten). If
+        None, a temporary file is used and removed when the buffer is
+        collected.
+    
+    Notes
+    -----
+    With backing='mmap', the default fill value is 0 so that the file is left
+    sparse at creation: regions where no data was received yet read as 0. Any
+    other fill value is written over the whole file when the buffer is created.
     """
-    def __init__(self, shape, dtype, double=True, shmem=None, fill=None, axisorder=None):
+    def __init__(self, shape, dtype, double=True, shmem=None, fill=None, axisorder=None, shm_options=None,
+                 max_read_size=None, backing='memory', path=None):
         self.double = double
         self.shape = shape
         
+        if backing not in ('memory', 'mmap'):
+            raise ValueError("backing must be 'memory' or 'mmap'")
+        if backing == 'mmap' and shmem is not None:
+            raise ValueError("backing='mmap' cannot be used with shmem")
+        self.backing = backing
+        self.path = None
+        
+        # size of the mirrored region that follows the ring
+        if double:
+            if max_read_size is not None:
+                raise ValueError("max_read_size can only be used with double=False")
+            self.max_read_size = shape[0]
+        else:
+            self.max_read_size = 0 if max_read_size is None else int(max_read_size)
+            if not 0 <= self.max_read_size <= shape[0]:
+                raise ValueError("max_read_size must be between 0 and the buffer size (%d)" % shape[0])
+        
         dtype = make_dtype(dtype) # fix dtype serialization
         
         # order of axes as written in memory. This does not affect the shape of the 
@@ -30,33 +108,53 @@ class RingBuffer:
             axisorder = np.arange(len(shape))
         self.axisorder = np.array(axisorder)
         
-        shape = (shape[0] * (2 if double else 1),) + shape[1:]
+        shape = (shape[0] + self.max_read_size,) + shape[1:]
         nativeshape = np.array(shape)[self.axisorder]
         
-        # initialize int buffers with 0 and float buffers with nan
+        # initialize int buffers with 0 and float buffers with nan (mmap files
+        # are not written at creation)
         if fill is None:
-            fill = 0 if make_dtype(dtype).kind in 'ui' else np.nan
+            fill = 0 if make_dtype(dtype).kind in 'ui' or backing == 'mmap' else np.nan
         self._filler = fill
         
-        if shmem is None:
+        if backing == 'mmap':
+            if path is None:
+                # removed when this object is collected
+                self._mmap_file = tempfile.NamedTemporaryFile(prefix='pyacq_RingBuffer_')
+                path = self._mmap_file.name
+            self.path = path
+            buf = np.memmap(path, dtype=dtype, mode='w+', shape=tuple(int(n) for n in nativeshape))
+            self.buffer = buf.transpose(np.argsort(axisorder))
+            if self._filler != 0:
+                self.buffer[:] = self._filler
+            self._header = np.zeros((_header_slots,), dtype='int64')
+            self._shmem = None
+            self.shm_id = None
+        elif shmem is None:
             self.buffer = np.empty(nativeshape, dtype=dtype).transpose(np.argsort(axisorder))
             self.buffer[:] = self._filler
-            self._indexes = np.zeros((2,), dtype='int64')
+            self._header = np.zeros((_header_slots,), dtype='int64')
             self._shmem = None
             self.shm_id = None
         else:
-            size = np.product(shape) * make_dtype(dtype).itemsize + 16
+            size = np.product(shape) * make_dtype(dtype).itemsize + _header_size
             if shmem is True:
-                # create new shared memory buffer
-                self._shmem = SharedMem(nbytes=size)
+                # new (or recycled) shared memory buffer; the header is reset below
+                self._shmem = shm_pool.acquire(size, owner=self, keep_bytes=_header_size,
+                                               **(shm_options or {}))
             else:
                 self._shmem = SharedMem(nbytes=size, shm_id=shmem)
-            buf = self._shmem.to_numpy(offset=16, dtype=dtype, shape=nativeshape)
+            buf = self._shmem.to_numpy(offset=_header_size, dtype=dtype, shape=nativeshape)
             self.buffer = buf.transpose(np.argsort(axisorder))
-            self._indexes = self._shmem.to_numpy(offset=0, dtype='int64', shape=(2,))
+            self._header = self._shmem.to_numpy(offset=0, dtype='int64', shape=(_header_slots,))
             self.shm_id = self._shmem.shm_id
+            if shmem is True:
+                self._reset_header()
         
+        self._indexes = self._header[:2]
         self.dtype = self.buffer.dtype
+        # reused by get_data(scratch=True)
+        self._scratch = None
         
         if shmem in (None, True):
             # Index of last writable sample + 1. This value is used to determine which
@@ -75,6 +173,12 @@ class RingBuffer:
         #   2. new data is written over the old buffer data
         #   3. read_index is increased to indicate that the new data is now
         #      readable
+        #
+        # Each update of the header is bracketed by increments of a sequence
+        # counter (seqlock), so a reader can take a consistent snapshot of the
+        # indexes. A generation counter is incremented by reset_index().
+        # Together these let a reader that obtained a view without copying
+        # check afterward that the data was not overwritten (see is_valid()).
 
         #
         #              write_index-bsize     break_index      read_index       write_index
@@ -88,6 +192,24 @@ class RingBuffer:
         #                               [....|......]                read with copy
         # 
         
+    def close(self):
+        """Release the memory of this buffer.
+        
+        A shared memory buffer created with shmem=True is returned to the
+        shared memory pool; one opened from an id is unmapped. The buffer
+        can not be used after this call.
+        """
+        shmem, self._shmem = self._shmem, None
+        self.buffer = self._header = self._indexes = self._scratch = None
+        if shmem is not None:
+            if shmem.owner:
+                shm_pool.release(shmem)
+            else:
+                shmem.close()
+        if getattr(self, '_mmap_file', None) is not None:
+            self._mmap_file.close()
+            self._mmap_file = None
+    
     def index(self):
         return self._read_index
 
@@ -103,16 +225,83 @@ class RingBuffer:
         return self._indexes[0]
 
     def _set_write_index(self, i):
-        # what kind of protection do we need here?
+        # A single aligned int64 store; readers see either the old or the new
+        # value. Consistency with the other slots is given by the sequence counter.
+        self._header[_SEQUENCE] += 1
         self._indexes[1] = i
+        self._header[_SEQUENCE] += 1
 
     def _set_read_index(self, i):
-        # what kind of protection do we need here?
+        self._header[_SEQUENCE] += 1
         self._indexes[0] = i
+        self._header[_SEQUENCE] += 1
+    
+    def _read_header(self, max_tries=1000):
+        """Return a consistent snapshot (generation, read_index, write_index)
+        of the header.
+        
+        If the writer is still updating the header after *max_tries*
+        attempts (for example because it died mid-update), return the last
+        values read.
+        """
+        header = self._header
+        for i in range(max_tries):
+            seq = header[_SEQUENCE]
+            gen, r, w = header[_GENERATION], header[_READ_INDEX], header[_WRITE_INDEX]
+            if seq % 2 == 0 and header[_SEQUENCE] == seq:
+                break
+        return gen, r, w
+    
+    def generation(self):
+        """Return the number of times the buffer index has been reset.
+        
+        A reader can store this value along with the indexes it has read to
+        detect that the writer has been reset in the meantime (see `is_valid()`).
+        """
+        return self._header[_GENERATION]
+    
+    def is_valid(self, start, generation=None):
+        """Return True if the data from *start* onward has not been overwritten.
+        
+        This is used to validate, after the fact, a view returned by
+        `get_data(start, stop, copy=False)` (or a copy made from it) when
+        the buffer is written by another thread or process: if this method
+        returns True after the data was used, then the data was not modified
+        while it was read.
+        
+        Parameters
+        ----------
+        start : int
+            The first index of the segment that was read.
+        generation : int or None
+            The value of `generation()` at the time the segment was read. If
+            given, the segment is considered invalid if the buffer has been
+            reset since.
+        """
+        gen, r, w = self._read_header()
+        if generation is not None and gen != generation:
+            return False
+        # The writer advances write_index *before* writing, so any sample that
+        # may have been touched is below write_index - bsize.
+        return start >= w - self.shape[0]
+    
+    def _reset_header(self):
+        # Readers of the previous stream may still have a recycled buffer open:
+        # advance the generation instead of zeroing it so that they can tell
+        # that the buffer was reused.
+        header = self._header
+        header[_SEQUENCE] += 1
+        for slot in range(_header_slots):
+            if slot not in (_SEQUENCE, _GENERATION):
+                header[slot] = 0
+        header[_GENERATION] += 1
+        header[_SEQUENCE] += 1
     
     def reset_index(self):
-        self._set_write_index(0)
-        self._set_read_index(0)
+        self._header[_SEQUENCE] += 1
+        self._header[_GENERATION] += 1
+        self._indexes[:] = 0
+        self._header[_SEQUENCE] += 1
     
     def new_chunk(self, data, index=None):
         dsize = data.shape[0]
@@ -165,19 +354,34 @@ class RingBuffer:
         if self.double:
             self.buffer[i:i+dsize] = value
             i += bsize
+            end = 2 * bsize
+        else:
+            end = bsize
         
-        if i + dsize <= self.buffer.shape[0]:
+        is_array = hasattr(value, '__len__')
+        if i + dsize <= end:
             self.buffer[i:i+dsize] = value
+            n = dsize
         else:
-            n = self.buffer.shape[0]-i
-            if hasattr(value, '__len__'):
+            n = end-i
+            if is_array:
                 # case array
-                self.buffer[i:] = value[:n]
+                self.buffer[i:end] = value[:n]
                 self.buffer[:dsize-n] = value[n:]
             else:
                 # case value is a scalar (when self._filler)
-                self.buffer[i:] = value
+                self.buffer[i:end] = value
                 self.buffer[:dsize-n] = value
+        
+        m = self.max_read_size
+        if not self.double and m > 0:
+            # update the mirror of the first m frames
+            if i < m:
+                k = min(m, i + n) - i
+                self.buffer[bsize+i:bsize+i+k] = value[:k] if is_array else value
+            if n < dsize:
+                k = min(m, dsize - n)
+                self.buffer[bsize:bsize+k] = value[n:n+k] if is_array else value
 
     def __getitem__(self, item):
         if isinstance(item, tuple):
@@ -203,7 +407,7 @@ class RingBuffer:
         
         return data
 
-    def get_data(self, start, stop, copy=False, join=True):
+    def get_data(self, start, stop, copy=False, join=True, out=None, scratch=False):
         """Return a segment of the ring buffer.
         
         Parameters
@@ -217,17 +421,32 @@ class RingBuffer:
             If True, then a copy of the data is returned to ensure that modifying
             the data will not affect the ring buffer. If False, then a reference to
             the buffer will be returned if possible. Default is False.
+            When the buffer is written concurrently (shared memory), use
+            `is_valid(start)` after reading to check that the data was
+            not overwritten in the meantime.
         join : bool
             If True, then a single contiguous array is returned for the entire
             requested segment. If False, then two separate arrays are returned
             for the beginning and end of the requested segment. This can be
             used to avoid an unnecessary copy when the buffer has double=False
             and the caller does not require a contiguous array.
+        out : ndarray or None
+            Array of shape ``(stop-start,) + shape[1:]`` in which the segment is
+            written (with casting if its dtype differs) and which is returned.
+            This avoids any allocation when the segment is read repeatedly.
+        scratch : bool
+            If True and the segment must be reconstructed from two pieces
+            (double=False), it is written into an internal buffer that is
+            reused by the following calls instead of a newly allocated array.
+            The returned data is then only valid until the next call to
+            `get_data()`; use `out` or `copy` to keep it.
         """
         first, last = self.first_index(), self.index()
         if start < first or stop > last:
             raise IndexError("Requested segment (%d, %d) is out of bounds for ring buffer. "
                              "Current bounds are (%d, %d)." % (start, stop, first, last))
+        if out is not None and out.shape != (stop-start,) + tuple(self.shape[1:]):
+            raise ValueError("out has shape %s; expected %s" % (out.shape, (stop-start,) + tuple(self.shape[1:])))
         
         bsize = self.shape[0]
         copied = False
@@ -245,29 +464,40 @@ class RingBuffer:
             data = self.buffer[start_ind:stop_ind]
         else:
             break_index = self._write_index - (self._write_index % bsize)
-            if (start < break_index) == (stop <= break_index):
+            if (start < break_index) == (stop <= break_index) or stop - break_index <= self.max_read_size:
+                # (the beginning of the ring is mirrored up to max_read_size)
                 start_ind = start % bsize
                 stop_ind = start_ind + (stop - start)
                 data = self.buffer[start_ind:stop_ind]
             else:
                 # need to reconstruct from two pieces
-                newshape = np.array((stop-start,) + self.shape[1:])[self.axisorder]
-                a = self.buffer[start%bsize:]
+                a = self.buffer[start%bsize:bsize]
                 b = self.buffer[:stop%bsize]
-                if join is False:
+                if out is not None:
+                    out[:a.shape[0]] = a
+                    out[a.shape[0]:] = b
+                    data = out
+                elif join is False:
                     if copy is True:
                         return (a.copy(), b.copy())
                     else:
                         return (a, b)
                 else:
-                    data = np.empty(newshape, self.buffer.dtype).transpose(np.argsort(self.axisorder))
+                    if scratch:
+                        data = self._get_scratch(stop-start)
+                    else:
+                        newshape = np.array((stop-start,) + self.shape[1:])[self.axisorder]
+                        data = np.empty(newshape, self.buffer.dtype).transpose(np.argsort(self.axisorder))
                     #data[:break_index-start] = a #not robust if break_index==start
                     #data[break_index-start:] = b
                     data[:a.shape[0]] = a
                     data[a.shape[0]:] = b
                     copied = True
         
-        if copy and not copied:
+        if out is not None and data is not out:
+            out[...] = data
+            data = out
+        elif copy and not copied:
             data = data.copy()
             
         if join:
@@ -276,6 +506,79 @@ class RingBuffer:
             empty = np.empty((0,) + data.shape[1:], dtype=data.dtype)
             return data, empty
 
+    def _get_scratch(self, size):
+        # Return a (size,)+shape[1:] view of the scratch buffer, with the axis
+        # order of the ring buffer. The scratch buffer only grows.
+        scratch = self._scratch
+        if scratch is None or scratch.shape[0] < size:
+            nativeshape = np.array((size,) + self.shape[1:])[self.axisorder]
+            scratch = np.empty(nativeshape, self.buffer.dtype).transpose(np.argsort(self.axisorder))
+            self._scratch = scratch
+        return scratch[:size]
+
+    def get_windows(self, stops, length, out=None, invalid='raise'):
+        """Return many segments of equal length from the ring buffer.
+        
+        Windows are gathered with a single fancy-indexing operation, which is
+        much faster than calling `get_data()` for each window when there are
+        many of them (for example, one per trigger).
+        
+        Parameters
+        ----------
+        stops : array of int
+            The stop index of each window (the sample at this index is not
+            included).
+        length : int
+            The length of each window.
+        out : ndarray or None
+            Array of shape ``(len(stops), length) + shape[1:]`` in which the
+            windows are written (with casting if its dtype differs). By default
+            a new array is allocated, with the axis order of the buffer.
+        invalid : 'raise' or 'fill'
+            What to do with windows that are not entirely inside the readable
+            part of the buffer: raise IndexError, or fill them with the fill
+            value of the buffer.
+        
+        Returns
+        -------
+        out : ndarray
+            Array of shape ``(len(stops), length) + shape[1:]``.
+        """
+        stops = np.asarray(stops, dtype='int64').reshape(-1)
+        n = stops.shape[0]
+        bsize = self.shape[0]
+        if length > bsize:
+            raise ValueError("Window length %d is larger than ring buffer size %d" % (length, bsize))
+        
+        first, last = self.first_index(), self.index()
+        valid = (stops - length >= first) & (stops <= last)
+        all_valid = valid.all()
+        if not all_valid and invalid == 'raise':
+            i = np.nonzero(~valid)[0][0]
+            raise IndexError("Requested window (%d, %d) is out of bounds for ring buffer. "
+                             "Current bounds are (%d, %d)." % (stops[i]-length, stops[i], first, last))
+        elif invalid not in ('raise', 'fill'):
+            raise ValueError("invalid must be 'raise' or 'fill'")
+        
+        if out is None:
+            # keep the memory layout of the buffer for each window
+            nativeshape = np.array((n, length) + tuple(self.shape[1:]))[np.concatenate([[0], self.axisorder + 1])]
+            out = np.empty(nativeshape, dtype=self.dtype).transpose(np.argsort(np.concatenate([[0], self.axisorder + 1])))
+        elif out.shape != (n, length) + tuple(self.shape[1:]):
+            raise ValueError("out has shape %s; expected %s" % (out.shape, (n, length) + tuple(self.shape[1:])))
+        
+        # Both halves of a double buffer hold the same data, so buffer indices
+        # modulo bsize are valid in all modes.
+        inds = (stops[:, None] - length + np.arange(length)[None, :]) % bsize
+        if out.dtype == self.dtype:
+            np.take(self.buffer, inds, axis=0, out=out, mode='clip')
+        else:
+            out[...] = self.buffer[inds]
+        
+        if not all_valid:
+            out[~valid] = self._filler
+        return out
+
     def _interpret_index(self, index):
         """Return normalized index, accounting for negative and None values.
         Also check that the index is readable.
@@ -3,11 +3,32 @@
 # Distributed under the (new) BSD License. See LICENSE for more info.
 
 import numpy as np
-import sys, random, string, tempfile, mmap
+import os, sys, random, string, tempfile, mmap, weakref, threading
 
 
-# TODO
-# On POSIX system it can optionally the shm_open way to avoid mmap.
+# /dev/shm is the tmpfs used by shm_open() on linux; files created there
+# are never written back to disk.
+_shm_dir = '/dev/shm'
+
+# Backends that can be used to create a new SharedMem. The first one is the default.
+if sys.platform.startswith('win'):
+    shm_backends = ['tagname']
+else:
+    shm_backends = ['tempfile']
+    if os.path.isdir(_shm_dir):
+        shm_backends.insert(0, 'posix')
+
+
+def _unlink_shm(path):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+def _random_name(n):
+    return ''.join(random.SystemRandom().choice(string.ascii_uppercase + string.digits) for _ in range(n))
+
 
 class SharedMem:
     """Class to create a shared memory buffer.
@@ -25,36 +46,104 @@ class SharedMem:
         The id of an existing SharedMem to open. If None, then a new shared
         memory file is created.
         On linux this is the filename, on Windows this is the tagname.
+    backend : str or None
+        The method used to create a new buffer (ignored when *shm_id* is given).
+        
+        * 'posix': anonymous memory in /dev/shm (as shm_open does). The memory
+          is never backed by a disk file. This is the default on linux.
+        * 'tempfile': a sparse temporary file. Used where /dev/shm is not
+          available (OSX).
+        * 'tagname': a named mapping of the paging file. Windows only.
+        
+        All available backends are listed in `shm_backends`.
+    populate : bool
+        If True, then ask the kernel to pre-fault the whole mapping
+        (MAP_POPULATE) so that the first writes do not stall on page faults.
+        Ignored where not supported.
+    hugepages : bool
+        If True, then advise the kernel to back the mapping with huge pages
+        (MADV_HUGEPAGE). Ignored where not supported.
+    writable : bool
+        If True, then a buffer opened from *shm_id* is mapped read-write. By
+        default, opened buffers are read-only; new buffers are always writable.
     
+    Notes
+    -----
+    
+    The process that created the buffer owns it: calling `close()` on the
+    owner (or collecting it, or exiting the process) removes the buffer name so
+    that no new process can open it. Processes that have already opened the
+    buffer keep a valid mapping until they close it themselves.
     """
-    def __init__(self, nbytes, shm_id=None):
+    def __init__(self, nbytes, shm_id=None, backend=None, populate=False, hugepages=False, writable=False):
         self.nbytes = nbytes
         self.mmap_size = (self.nbytes // mmap.PAGESIZE + 1) * mmap.PAGESIZE
         self.shm_id = shm_id
+        self.owner = shm_id is None
+        
+        if backend is None:
+            backend = shm_backends[0]
+        if self.owner and backend not in shm_backends:
+            raise ValueError("Unsupported shared memory backend '%s' (available: %s)" %
+                             (backend, ', '.join(shm_backends)))
+        self.backend = backend
         
         if sys.platform.startswith('win'):
             if shm_id is None:
-                self.shm_id = u'pyacq_SharedMem_'+''.join(random.SystemRandom().choice(string.ascii_uppercase + string.digits) for _ in range(128))
+                self.shm_id = u'pyacq_SharedMem_'+_random_name(128)
                 self.mmap = mmap.mmap(-1, self.nbytes, self.shm_id, access=mmap.ACCESS_WRITE)
             else:
-                self.mmap = mmap.mmap(-1, self.nbytes, self.shm_id, access=mmap.ACCESS_READ)
+                access = mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ
+                self.mmap = mmap.mmap(-1, self.nbytes, self.shm_id, access=access)
         else:
+            flags = mmap.MAP_SHARED
+            if populate:
+                flags |= getattr(mmap, 'MAP_POPULATE', 0)
             if shm_id is None:
-                self._tmpFile = tempfile.NamedTemporaryFile(prefix=u'pyacq_SharedMem_')
-                self._tmpFile.write(b'\x00' * self.nbytes)
-                self._tmpFile.flush()  # I do not anderstand but this is needed....
-                self.shm_id = self._tmpFile.name
-                self.mmap = mmap.mmap(self._tmpFile.fileno(), self.nbytes, mmap.MAP_SHARED, mmap.PROT_WRITE)
+                if backend == 'posix':
+                    self.shm_id = os.path.join(_shm_dir, u'pyacq_SharedMem_'+_random_name(24))
+                    fd = os.open(self.shm_id, os.O_RDWR | os.O_CREAT | os.O_EXCL, 0o600)
+                    self._tmpFile = open(fd, 'r+b', buffering=0)
+                    # like NamedTemporaryFile, make sure the name is released
+                    # when this object is collected or the process exits.
+                    self._unlink = weakref.finalize(self, _unlink_shm, self.shm_id)
+                else:
+                    self._tmpFile = tempfile.NamedTemporaryFile(prefix=u'pyacq_SharedMem_')
+                    self.shm_id = self._tmpFile.name
+                # size the file without writing to it; pages are zero-filled
+                # by the kernel on first access.
+                os.ftruncate(self._tmpFile.fileno(), self.nbytes)
+                self.mmap = mmap.mmap(self._tmpFile.fileno(), self.nbytes, flags, mmap.PROT_READ | mmap.PROT_WRITE)
             else:
-                self._tmpFile = open(self.shm_id, 'rb')
-                self.mmap = mmap.mmap(self._tmpFile.fileno(), self.nbytes, mmap.MAP_SHARED, mmap.PROT_READ)
+                if writable:
+                    self._tmpFile = open(self.shm_id, 'r+b')
+                    prot = mmap.PROT_READ | mmap.PROT_WRITE
+                else:
+                    self._tmpFile = open(self.shm_id, 'rb')
+                    prot = mmap.PROT_READ
+                self.mmap = mmap.mmap(self._tmpFile.fileno(), self.nbytes, flags, prot)
+            if hugepages and hasattr(mmap, 'MADV_HUGEPAGE'):
+                try:
+                    self.mmap.madvise(mmap.MADV_HUGEPAGE)
+                except OSError:
+                    pass
                 
     def close(self):
         """Close this buffer.
+        
+        If this buffer was created by this instance, then its name is also
+        released (see Notes).
         """
-        self.mmap.close()
+        try:
+            self.mmap.close()
+        except BufferError:
+            # arrays still point to the buffer; the mapping is released when
+            # they are collected.
+            pass
         if not sys.platform.startswith('win') and hasattr(self, '_tmpFile'):
             self._tmpFile.close()
+            if hasattr(self, '_unlink'):
+                self._unlink()
     
     def to_dict(self):
         """Return a dict that can be serialized and sent to other processes to
@@ -67,9 +156,104 @@ class SharedMem:
         """
         return np.ndarray(buffer=self.mmap, shape=shape,
                           strides=strides, offset=offset, dtype=dtype)        
+
+
+def _size_class(nbytes):
+    # segments are allocated in multiples of the page size, rounded up to one
+    # of 8 steps per power of 2 so that at most 12.5% is wasted
+    pages = max(-(-int(nbytes) // mmap.PAGESIZE), 1)
+    step = 1 << max(pages.bit_length() - 4, 0)
+    return -(-pages // step) * step * mmap.PAGESIZE
+
+
+class SharedMemPool:
+    """Per-process pool of :class:`SharedMem` buffers.
+    
+    Released buffers are kept (up to *max_free_bytes*) and handed out again
+    to later requests of the same size class (a multiple of the page size,
+    at most 12.5% larger than requested), backend, populate and huge page
+    options, which avoids creating and mapping a new buffer each time a stream
+    is reconfigured. Recycled buffers are zero-filled, like new ones.
+    
+    The module-level instance `shm_pool` is used by :class:`RingBuffer` for
+    its shared memory buffers.
+    
+    Parameters
+    ----------
+    max_free_bytes : int
+        Maximum total size of the released buffers kept for reuse. Buffers
+        released beyond this limit are closed. It can be changed at any time,
+        for example ``shm_pool.max_free_bytes = 2**30`` for processes that
+        reconfigure streams with large buffers, or set to 0 to disable
+        pooling.
+    
+    Notes
+    -----
+    A recycled buffer keeps its *shm_id*. Processes that still have the
+    previous buffer open see the data of the new owner. :class:`RingBuffer`
+    keeps its header in recycled buffers and advances its generation, so that
+    these readers can detect the reuse (see `RingBuffer.is_valid()`).
+    """
+    def __init__(self, max_free_bytes=2**26):
+        self.max_free_bytes = max_free_bytes
+        self.lock = threading.Lock()
+        self._free = {}  # key: [SharedMem, ...]
+        self._free_bytes = 0
+        self._owners = {}  # id(SharedMem): finalizer of its owner
+    
+    def acquire(self, nbytes, owner=None, backend=None, populate=False, hugepages=False, keep_bytes=0):
+        """Return a SharedMem of at least *nbytes* bytes.
         
+        If *owner* is given, the buffer is released automatically when the
+        owner is collected without having called `release()`. The first
+        *keep_bytes* bytes of a recycled buffer are left as they are instead
+        of being zero-filled. Other arguments are passed to
+        :class:`SharedMem` when a new buffer must be created.
+        """
+        size = _size_class(nbytes)
+        key = (size, backend or shm_backends[0], populate, hugepages)
+        with self.lock:
+            free = self._free.get(key, [])
+            shmem = free.pop() if len(free) > 0 else None
+            if shmem is not None:
+                self._free_bytes -= size
+        
+        if shmem is None:
+            shmem = SharedMem(nbytes=size, backend=backend, populate=populate, hugepages=hugepages)
+        else:
+            shmem.to_numpy(offset=keep_bytes, dtype='uint8', shape=(nbytes - keep_bytes,))[:] = 0
+        shmem._pool_key = key
+        if owner is not None:
+            self._owners[id(shmem)] = weakref.finalize(owner, self.release, shmem)
+        return shmem
+    
+    def release(self, shmem):
+        """Return a buffer obtained from `acquire()` to the pool.
+        
+        The buffer is closed instead if the pool is full.
+        """
+        finalizer = self._owners.pop(id(shmem), None)
+        if finalizer is not None:
+            finalizer.detach()
+        with self.lock:
+            if self._free_bytes + shmem.nbytes <= self.max_free_bytes:
+                self._free.setdefault(shmem._pool_key, []).append(shmem)
+                self._free_bytes += shmem.nbytes
+                return
+        shmem.close()
+    
+    def clear(self):
+        """Close all released buffers.
+        """
+        with self.lock:
+            free = [shmem for shmems in self._free.values() for shmem in shmems]
+            self._free = {}
+            self._free_bytes = 0
+        for shmem in free:
+            shmem.close()
 
 
+shm_pool = SharedMemPool()
 
 
 class SharedArray:
@@ -95,13 +279,19 @@ class SharedArray:
         The id of an existing SharedMem to open. If None, then a new shared
         memory file is created.
         On linux this is the filename, on Windows this is the tagname.
+    backend : str or None
+        The backend used to create a new shared memory buffer. See
+        :class:`SharedMem`.
+    kwds :
+        Extra keyword arguments (*populate*, *hugepages*, *writable*) are passed to
+        :class:`SharedMem`.
     
     """
-    def __init__(self, shape=(1,), dtype='float64', shm_id=None):
+    def __init__(self, shape=(1,), dtype='float64', shm_id=None, backend=None, **kwds):
         self.shape = shape
         self.dtype = np.dtype(dtype)
         nbytes = np.prod(shape)*self.dtype.itemsize
-        self.shmem = SharedMem(nbytes, shm_id)
+        self.shmem = SharedMem(nbytes, shm_id, backend=backend, **kwds)
     
     def to_dict(self):
         return {'shape': self.shape, 'dtype': self.dtype, 'shm_id': self.shmem.shm_id}
@@ -2,12 +2,156 @@
 # Copyright (c) 2016, French National Center for Scientific Research (CNRS)
 # Distributed under the (new) BSD License. See LICENSE for more info.
 
+import os
+import sys
 import struct
+import random
+import weakref
+import contextlib
 import numpy as np
 
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
 from .streamhelpers import DataSender, DataReceiver, register_transfermode
 from .ringbuffer import RingBuffer
+from .sharedarray import SharedArray
 from .arraytools import make_dtype
+from .streamstats import stream_clock
+
+
+# Columns of the reader cursor table
+_CURSOR_TOKEN = 0       # random id of the reader that claimed the slot; 0 if free
+_CURSOR_INDEX = 1       # index up to which the reader has received data
+_CURSOR_GENERATION = 2  # buffer generation of _CURSOR_INDEX
+_CURSOR_OVERRUNS = 3    # overruns counted by the reader
+_CURSOR_PID = 4         # process id of the reader
+_cursor_columns = 5
+
+
+def _pid_alive(pid):
+    # Return False if no process with this id exists. Not checked on windows.
+    if sys.platform.startswith('win'):
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class ReaderCursors:
+    """Table of reader cursors in shared memory.
+    
+    Each :class:`SharedMemReceiver` claims a slot in the table and publishes
+    the index up to which it has received data and its overrun count, so
+    that the sender can tell how far behind each reader is.
+    
+    Slots also hold the process id of their reader. The slot of a reader
+    whose process has exited without releasing it is ignored by `status()`
+    and can be claimed again (except on Windows, where process ids are not
+    checked). A receiver that is collected without being closed releases
+    its slot.
+    
+    Note: this class is usually not instantiated directly; use
+    ``OutputStream.configure(transfermode='sharedmem', max_readers=n)`` and
+    :func:`OutputStream.get_reader_status`.
+    
+    Parameters
+    ----------
+    max_readers : int
+        Number of slots. Readers that connect while all slots are taken are
+        not tracked.
+    shm_id : str or None
+        The id of the table to open, or None to create a new one.
+    """
+    def __init__(self, max_readers, shm_id=None):
+        self._array = SharedArray(shape=(max_readers, _cursor_columns), dtype='int64',
+                                  shm_id=shm_id, writable=True)
+        self.table = self._array.to_numpy()
+        self.shm_id = self._array.shmem.shm_id
+        self._tokens = {}  # slot: token of the slots claimed by this instance
+    
+    @contextlib.contextmanager
+    def _lock(self):
+        # serialize slot claims between processes; slots are claimed without
+        # locking where flock is not available.
+        f = getattr(self._array.shmem, '_tmpFile', None)
+        if fcntl is None or f is None:
+            yield
+            return
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    
+    def claim(self, index=0, generation=0):
+        """Claim a free slot starting at *index* and return its number, or
+        None if all slots are taken.
+        """
+        token = random.SystemRandom().getrandbits(62) + 1
+        with self._lock():
+            for slot in range(self.table.shape[0]):
+                if self.table[slot, _CURSOR_TOKEN] == 0 or self._is_stale(self.table[slot]):
+                    self.table[slot, _CURSOR_TOKEN] = token
+                    self.table[slot, _CURSOR_PID] = os.getpid()
+                    self._tokens[slot] = token
+                    self.update(slot, index, generation, 0)
+                    return slot
+        return None
+    
+    def _owns(self, slot):
+        # the slot may have been reclaimed by another reader
+        return self.table[slot, _CURSOR_TOKEN] == self._tokens.get(slot, 0)
+    
+    def _is_stale(self, row):
+        return row[_CURSOR_TOKEN] != 0 and not _pid_alive(int(row[_CURSOR_PID]))
+    
+    def update(self, slot, index, generation, overruns):
+        """Publish the cursor of the reader owning *slot*.
+        """
+        if not self._owns(slot):
+            return
+        row = self.table[slot]
+        row[_CURSOR_GENERATION] = generation
+        row[_CURSOR_INDEX] = index
+        row[_CURSOR_OVERRUNS] = overruns
+    
+    def release(self, slot):
+        """Free *slot* if it is still owned by this instance.
+        """
+        with self._lock():
+            if self._owns(slot):
+                self.table[slot, _CURSOR_TOKEN] = 0
+        self._tokens.pop(slot, None)
+    
+    def status(self, index, generation):
+        """Return a list with one dict per claimed slot.
+        
+        Each dict has the 'slot' number, the reader 'index', its 'lag' (in
+        frames) behind the sender *index* and its 'overruns' count. A reader
+        that did not receive data since the last index reset (*generation*)
+        is at index 0.
+        """
+        readers = []
+        for slot, row in enumerate(self.table.tolist()):
+            token, rindex, rgen, overruns, pid = row
+            if token == 0 or not _pid_alive(pid):
+                continue
+            if rgen != generation:
+                rindex = 0
+            readers.append({'slot': slot, 'index': rindex,
+                            'lag': max(index - rindex, 0), 'overruns': overruns})
+        return readers
+    
+    def close(self):
+        self.table = None
+        self._array.shmem.close()
 
 class SharedMemSender(DataSender):
     """Stream sender that uses shared memory for efficient interprocess
@@ -23,22 +167,55 @@ class SharedMemSender(DataSender):
     * double (bool) if True, then the buffer size is doubled and all frames are
       written to the buffer twice. This makes it possible to guarantee
       zero-copy reads by any connected InputStream.
+    * max_read_size (int or None) with double=False, only this many frames are
+      written twice (see :class:`RingBuffer`), which guarantees zero-copy reads
+      of up to max_read_size frames.
     * axisorder (tuple) The order that buffer axes should be arranged in
       memory. This makes it possible to optimize for specific algorithms that
       expect either row-major or column-major alignment. The default is
       row-major; the time axis comes first in the axis order.
     * fill (float) Value used to fill the buffer where no data is available.
+    * shm_backend (str or None) the method used to allocate shared memory
+      ('posix', 'tempfile' or 'tagname'). See :class:`SharedMem`.
+    * shm_populate (bool) if True, pre-fault the shared memory pages at
+      allocation.
+    * shm_hugepages (bool) if True, advise the kernel to use huge pages for the
+      shared memory.
+    * max_readers (int) if > 0, allocate this many reader cursor slots (see
+      :class:`ReaderCursors`). Each connected InputStream then publishes how
+      far it has received, and :func:`OutputStream.get_reader_status` reports
+      the lag and overruns of every reader.
     """
     def __init__(self, socket, params):
         DataSender.__init__(self, socket, params)
         self.size = self.params['buffer_size']
         shape = (self.size,) + tuple(self.params['shape'][1:])
+        shm_options = dict(backend=self.params.get('shm_backend', None),
+                           populate=self.params.get('shm_populate', False),
+                           hugepages=self.params.get('shm_hugepages', False))
         self._buffer = RingBuffer(shape=shape, dtype=make_dtype(self.params['dtype']),
                                   shmem=True, axisorder=self.params['axisorder'],
-                                  double=self.params['double'], fill=self.params['fill'])
+                                  double=self.params['double'], fill=self.params['fill'],
+                                  shm_options=shm_options, max_read_size=self.params['max_read_size'])
         self.params['shm_id'] = self._buffer.shm_id
+        
+        if self.params.get('max_readers', 0) > 0:
+            self._cursors = ReaderCursors(self.params['max_readers'])
+            self.params['cursor_shm_id'] = self._cursors.shm_id
+        else:
+            self._cursors = None
+            self.params['cursor_shm_id'] = None
     
     def send(self, index, data):
+        self._write_chunk(index, data)
+        generation = self._buffer.generation()
+        if self.params.get('stats', False):
+            stat = struct.pack('!QQqd', index, data.shape[0], generation, stream_clock())
+        else:
+            stat = struct.pack('!QQq', index, data.shape[0], generation)
+        self.socket.send_multipart([stat])
+    
+    def _write_chunk(self, index, data):
         assert data.dtype == self.params['dtype']
         shape = data.shape
         if self.params['shape'][0] != -1:
@@ -47,15 +224,44 @@ class SharedMemSender(DataSender):
             assert tuple(shape[1:]) == tuple(self.params['shape'][1:]), '{} {}'.format(shape, self.params['shape'])
  
         self._buffer.new_chunk(data, index)
-        
-        stat = struct.pack('!' + 'QQ', index, shape[0])
-        self.socket.send_multipart([stat])
     
     def reset_index(self):
         self._buffer.reset_index()
+    
+    def reader_status(self):
+        if self._cursors is None:
+            return None
+        index = self._buffer.index()
+        readers = self._cursors.status(index, self._buffer.generation())
+        return {
+            'index': index,
+            'buffer_size': self.size,
+            'max_lag': max([r['lag'] for r in readers], default=0),
+            'readers': readers,
+        }
+    
+    def close(self):
+        # return the shared memory to the pool
+        self._buffer.close()
+        if self._cursors is not None:
+            self._cursors.close()
 
 
 class SharedMemReceiver(DataReceiver):
+    """Stream receiver that reads data from the shared memory ring buffer
+    written by a :class:`SharedMemSender`.
+    
+    The data announced by each message may already have been overwritten if
+    this receiver fell behind the sender by more than ``buffer_size`` frames.
+    Such events are counted in the `overruns` attribute, as are chunks
+    announced for another generation of the buffer (the sender was reset, or
+    the buffer was recycled by the shared memory pool for another stream
+    since). Data read without copy from `buffer` can be validated after use
+    with :func:`RingBuffer.is_valid() <pyacq.core.stream.ringbuffer.RingBuffer.is_valid>`.
+    
+    If the sender has reader cursor slots (*max_readers*), this receiver
+    claims one and updates it at each `recv()`.
+    """
     def __init__(self, socket, params):
         # init data receiver with no ring buffer; we will implement our own from shm.
         DataReceiver.__init__(self, socket, params)
@@ -63,7 +269,26 @@ class SharedMemReceiver(DataReceiver):
         self.size = self.params['buffer_size']
         shape = (self.size,) + tuple(self.params['shape'][1:])
         self.buffer = RingBuffer(shape=shape, dtype=self.params['dtype'], double=self.params['double'],
-                                 shmem=self.params['shm_id'], axisorder=self.params['axisorder'])
+                                 shmem=self.params['shm_id'], axisorder=self.params['axisorder'],
+                                 max_read_size=self.params['max_read_size'])
+        # number of received chunks that were already overwritten by the sender
+        self.overruns = 0
+        # generation of the buffer for the last received chunk; each message
+        # carries the generation it was written in
+        self._generation = self.buffer.generation()
+        
+        self._cursors = None
+        self._slot = None
+        if self.params.get('cursor_shm_id', None) is not None:
+            self._cursors = ReaderCursors(self.params['max_readers'], shm_id=self.params['cursor_shm_id'])
+            self._slot = self._cursors.claim(self.buffer.index(), self._generation)
+            if self._slot is not None:
+                # free the slot if this receiver is collected without close()
+                self._release_slot = weakref.finalize(self, self._cursors.release, self._slot)
+    
+    def _publish_cursor(self, index):
+        if self._slot is not None:
+            self._cursors.update(self._slot, index, self._generation, self.overruns)
 
     def recv(self, return_data=False):
         """Receive message indicating the index of the next data chunk.
@@ -77,12 +302,25 @@ class SharedMemReceiver(DataReceiver):
             default is False.
         """
         stat = self.socket.recv_multipart()[0]
-        index, size = struct.unpack('!QQ', stat)
+        index, size, self._generation = struct.unpack_from('!QQq', stat)
+        if len(stat) > 24:
+            self.last_timestamp = struct.unpack_from('!d', stat, 24)[0]
+        if not self.buffer.is_valid(index - size, self._generation):
+            self.overruns += 1
+        self._publish_cursor(index)
         if return_data:
             data = self.buffer[index-size:index]
         else:
             data = None
         return index, data
+    
+    def close(self):
+        if self._cursors is not None:
+            if self._slot is not None:
+                self._release_slot()
+            self._cursors.close()
+            self._cursors = self._slot = None
+        self.buffer.close()
 
 
 register_transfermode('sharedmem', SharedMemSender, SharedMemReceiver)
@@ -2,15 +2,21 @@
 # Copyright (c) 2016, French National Center for Scientific Research (CNRS)
 # Distributed under the (new) BSD License. See LICENSE for more info.
 
+import os
 import random
 import string
+import tempfile
 import zmq
 import numpy as np
 import weakref
+import collections
 
 from .ringbuffer import RingBuffer
+from .pyramid import MinMaxPyramid
+from .coalesce import ChunkCoalescer
 from .streamhelpers import all_transfermodes
-from ..rpc import ObjectProxy
+from .streamstats import StreamStats, stream_clock
+from ..rpc import ObjectProxy, RPCServer
 from .arraytools import fix_struct_dtype, make_dtype
 
 
@@ -30,9 +36,22 @@ default_stream = dict(
     units='',
     sample_rate=1.,
     double=False,#make sens only for transfermode='sharemem',
+    max_read_size=None,  # only used by transfermode='sharedmem' with double=False
     fill=None,
+    shm_backend=None,  # only used by transfermode='sharedmem'
+    shm_populate=False,  # only used by transfermode='sharedmem'
+    shm_hugepages=False,  # only used by transfermode='sharedmem'
+    max_readers=0,  # only used by transfermode='sharedmem'
+    max_latency_ms=None,
+    max_chunk_frames=None,
+    sndhwm=None,
+    rcvhwm=None,
+    hwm_policy=None,
+    stats=False,
 )
 
+hwm_policies = [None, 'drop_newest', 'drop_oldest', 'block']
+
 
 class OutputStream(object):
     """Class for streaming data to an InputStream.
@@ -53,6 +72,9 @@ class OutputStream(object):
         spec = {} if spec is None else spec
         self.last_index = 0
         self.configured = False
+        self._coalescer = None
+        self.dropped_chunks = 0
+        self.stats = None
         self.spec = spec  # this is a priori stream params, and must be change when Node.configure
         if node is not None:
             self.node = weakref.ref(node)
@@ -77,6 +99,8 @@ class OutputStream(object):
             
             * 'plaindata': data are sent over a plain socket in two parts: (frame index, data).
             * 'sharedmem': data are stored in shared memory in a ring buffer and the current frame index is sent over the socket.
+            * 'sharedmem_futex': (linux only) like 'sharedmem', but readers on the same host are woken up
+              through a futex in the shared memory instead of the socket, for lower latency.
             * 'shared_cuda_buffer': (planned) data are stored in shared Cuda buffer and the current frame index is sent over the socket.
             * 'share_opencl_buffer': (planned) data are stored in shared OpenCL buffer and the current frame index is sent over the socket.
             
@@ -91,8 +115,16 @@ class OutputStream(object):
             
             * For ``streamtype=image``, the shape should be ``(-1, H, W)`` or ``(n_frames, H, W)``.
             * For ``streamtype=analogsignal`` the shape should be ``(n_samples, n_channels)`` or ``(-1, n_channels)``.
-        compression: '', 'blosclz', 'blosc-lz4'
-            The compression for the data stream. The default uses no compression.
+        compression: str
+            The compression for the data stream (only used by ``transfermode='plaindata'``).
+            The default uses no compression. Available backends are listed in
+            ``compression_methods`` ('zlib', and 'blosc-blosclz', 'blosc-lz4',
+            'blosc2', 'zstd', 'lz4' when installed). Filters can be applied
+            before the backend by joining them with '+', e.g.
+            ``'delta+bitshuffle+zstd'``: 'delta' sends the difference between
+            consecutive frames (integer dtypes only), 'shuffle' and 'bitshuffle'
+            regroup bytes / bits of the same significance. Use
+            ``compression.benchmark_compression()`` to choose a method.
         scale: float
             An optional scale factor + offset to apply to the data before it is sent over the stream.
             ``output = offset + scale * input``
@@ -102,11 +134,51 @@ class OutputStream(object):
             Units of the stream data. Mainly used for 'analogsignal'.
         sample_rate: float or None
             Sample rate of the stream in Hz.
+        max_latency_ms: float or None
+            If set, consecutive chunks are merged and sent as a single chunk
+            (see :class:`ChunkCoalescer <stream.coalesce.ChunkCoalescer>`). A
+            chunk is held at most this long before being sent. This reduces
+            the per-message overhead of devices that produce small chunks.
+            The default (None) sends each chunk immediately.
+        max_chunk_frames: int or None
+            When merging chunks, send as soon as this many frames are pending.
+        sndhwm: int or None
+            High-water mark (maximum number of queued chunks) of the socket
+            for each connected InputStream. The default (None) uses the ZeroMQ
+            default (1000).
+        rcvhwm: int or None
+            Default high-water mark of the connected InputStreams (see
+            :func:`InputStream.connect`).
+        hwm_policy: None, 'drop_newest', 'drop_oldest' or 'block'
+            What happens when the queue of a slow reader is full:
+            
+            * None: chunks are silently dropped for that reader (ZeroMQ default).
+            * 'drop_newest': the chunk is not sent and is counted in
+              `OutputStream.dropped_chunks`. Note that the chunk is then dropped
+              for all readers.
+            * 'drop_oldest': each InputStream keeps only the newest *rcvhwm*
+              chunks; older pending chunks are discarded when it receives and
+              counted in `InputStream.dropped_chunks`.
+            * 'block': `send()` blocks until all readers have room in their queue.
+            
+            'drop_newest' and 'block' are only supported by the plaindata
+            transfer mode. With sharedmem transfer modes the data is always
+            written to the ring buffer; use :func:`get_reader_status` to
+            detect slow readers.
+        stats: bool
+            If True, the output and its connected inputs count chunks, frames,
+            bytes and the time spent sending / receiving, and the send time of
+            each chunk is embedded in the messages so that inputs can measure
+            the latency. See :func:`get_stats`. Latencies are only meaningful
+            between processes on the same host.
         kwargs :
             All extra keyword arguments are passed to the DataSender constructor
             for the chosen transfermode (for example, see 
             :class:`SharedMemSender <stream.sharedmemstream.SharedMemSender>`).
         """
+        if self.configured:
+            # release the socket and shared memory of the previous configuration
+            self.close()
         
         self.params = dict(default_stream)
         self.params.update(self.spec)
@@ -119,34 +191,64 @@ class OutputStream(object):
             # fix error in structred dtype with bad serilization
             self.params['dtype'] = fix_struct_dtype(self.params['dtype'])
         
+        if self.params['hwm_policy'] not in hwm_policies:
+            raise ValueError("Unsupported hwm_policy '%s'" % self.params['hwm_policy'])
+        
         shape = self.params['shape']
         assert shape[0] == -1 or shape[0] > 0, "First element in shape must be -1 or > 0."
         for i in range(1, len(shape)):
             assert shape[i] > 0, "Shape index %d must be > 0." % i
         
+        transfermode = self.params['transfermode']
+        if transfermode not in all_transfermodes:
+            raise ValueError("Unsupported transfer mode '%s'" % transfermode)
+        sender_class = all_transfermodes[transfermode][0]
+        if self.params['hwm_policy'] in ('drop_newest', 'block') and not sender_class.supports_nodrop:
+            raise ValueError("hwm_policy '%s' is not supported by transfer mode '%s'" %
+                             (self.params['hwm_policy'], transfermode))
+        
         if self.params['protocol'] in ('inproc', 'ipc'):
             pipename = u'pyacq_pipe_'+''.join(random.SystemRandom().choice(string.ascii_uppercase + string.digits) for _ in range(24))
+            if self.params['protocol'] == 'ipc':
+                # keep ipc socket files out of the working directory
+                pipename = os.path.join(tempfile.gettempdir(), pipename)
             self.params['interface'] = pipename
             self.url = '{protocol}://{interface}'.format(**self.params)
         else:
             self.url = '{protocol}://{interface}:{port}'.format(**self.params)
         context = zmq.Context.instance()
-        self.socket = context.socket(zmq.PUB)
+        self.socket = context.socket(sender_class.socket_type)
         self.socket.linger = 1000  # don't let socket deadlock when exiting
+        if self.params['sndhwm'] is not None:
+            self.socket.sndhwm = self.params['sndhwm']
+        if self.params['hwm_policy'] in ('drop_newest', 'block'):
+            # send() fails (or blocks) instead of silently dropping messages
+            self.socket.setsockopt(zmq.XPUB_NODROP, 1)
+            if self.params['hwm_policy'] == 'drop_newest':
+                self.socket.sndtimeo = 0
         self.socket.bind(self.url)
         self.addr = self.socket.getsockopt(zmq.LAST_ENDPOINT).decode()
         self.port = self.addr.rpartition(':')[2]
         self.params['port'] = self.port
         
-        transfermode = self.params['transfermode']
-        if transfermode not in all_transfermodes:
-            raise ValueError("Unsupported transfer mode '%s'" % transfermode)
-        sender_class = all_transfermodes[transfermode][0]
         self.sender = sender_class(self.socket, self.params)
+        
+        self._coalescer = None
+        if self.params['max_latency_ms'] is not None:
+            max_frames = self.params['max_chunk_frames']
+            if transfermode.startswith('sharedmem'):
+                # a merged chunk must fit in the ring buffer
+                max_frames = min(max_frames or self.params['buffer_size'], self.params['buffer_size'])
+            self._coalescer = ChunkCoalescer(self._send_chunk, self.params['max_latency_ms'], max_frames)
+        
+        self.stats = StreamStats() if self.params['stats'] else None
 
         self.configured = True
         if self.node and self.node():
             self.node().after_output_configure(self.name)
+            RPCServer.object_changed(self, self.node())
+        else:
+            RPCServer.object_changed(self)
 
     def send(self, data, index=None, **kargs):
         """Send a data chunk and its frame index.
@@ -161,17 +263,67 @@ class OutputStream(object):
         if index is None:
             index = self.last_index + data.shape[0]
         self.last_index = index
-        self.sender.send(index, data, **kargs)
+        if self._coalescer is None:
+            self._send_chunk(index, data, **kargs)
+        else:
+            self._coalescer.send(index, data, **kargs)
+
+    def _send_chunk(self, index, data, **kargs):
+        if self.stats is not None:
+            t0 = stream_clock()
+        try:
+            self.sender.send(index, data, **kargs)
+        except zmq.Again:
+            # hwm_policy='drop_newest' and a reader queue is full
+            self.dropped_chunks += 1
+            return
+        if self.stats is not None:
+            self.stats.add_chunk(data.shape[0], data.nbytes, stream_clock() - t0)
+
+    def get_stats(self):
+        """Return a dict of statistics about this stream, or None if the stream
+        was not configured with ``stats=True``.
+        
+        See :func:`StreamStats.get_stats() <stream.streamstats.StreamStats.get_stats>`.
+        The number of chunks dropped because of *hwm_policy* is also included.
+        """
+        if self.stats is None:
+            return None
+        stats = self.stats.get_stats()
+        stats['dropped_chunks'] = self.dropped_chunks
+        return stats
+    
+    def reset_stats(self):
+        """Reset the counters returned by :func:`get_stats`.
+        """
+        if self.stats is not None:
+            self.stats.reset()
+    
+    def get_reader_status(self):
+        """Return the progress of the connected InputStreams, or None if
+        the transfer mode does not track readers.
+        
+        With ``transfermode='sharedmem'`` (or 'sharedmem_futex') and
+        ``max_readers > 0``, this is a dict with the current 'index', the
+        'buffer_size', the 'max_lag' (frames) of the slowest reader and a list
+        of 'readers', each a dict with 'slot', 'index', 'lag' and 'overruns'.
+        A reader whose lag approaches *buffer_size* is about to lose data.
+        Readers whose process has exited are not listed.
+        """
+        return self.sender.reader_status()
 
     def close(self):
         """Close the output.
         
         This closes the socket and releases shared memory, if necessary.
         """
+        if self._coalescer is not None:
+            self._coalescer.close()
         self.sender.close()
         self.socket.close()
         del self.socket
         del self.sender
+        self.configured = False
     
     def reset_buffer_index(self):
         """
@@ -179,6 +331,8 @@ class OutputStream(object):
         Usefull for multiple start/stop on Node to reset the index.
         """
         self.last_index = 0
+        if self._coalescer is not None:
+            self._coalescer.flush()
         self.sender.reset_index()
 
 
@@ -232,8 +386,14 @@ class InputStream(object):
         self.name = name
         self.buffer = None
         self._own_buffer = False  # whether InputStream should populate buffer
+        self.pyramid = None
+        self._chunk_start = None  # start of the next window of iter_chunks()
+        self._chunk_generation = None
+        self._queue = None
+        self.dropped_chunks = 0
+        self.stats = None
     
-    def connect(self, output):
+    def connect(self, output, rcvhwm=None, hwm_policy=None, channels=None):
         """Connect an output to this input.
         
         Any data send over the stream using :func:`output.send() <OutputStream.send>`
@@ -243,11 +403,25 @@ class InputStream(object):
         ----------
         output : OutputStream (or proxy to a remote OutputStream)
             The OutputStream to connect.
+        rcvhwm : int or None
+            Maximum number of chunks queued for this input. By default, use the
+            *rcvhwm* of the output stream.
+        hwm_policy : str or None
+            Override the *hwm_policy* of the output stream for this input. Only
+            'drop_oldest' has an effect on the receiving side. See
+            :func:`OutputStream.configure`.
+        channels : list or None
+            If given, only receive these channels (indices along axis 1 of the
+            stream). The output slices each chunk once for every distinct
+            subset requested by its inputs, so only the requested channels are
+            transmitted. The shape (and 'channel_info', if any) in the params of
+            this input are updated accordingly. Only supported with
+            ``transfermode='plaindata'``.
         """
         if isinstance(output, dict):
-            self.params = output
+            self.params = dict(output)
         elif isinstance(output, OutputStream):
-            self.params = output.params
+            self.params = dict(output.params)
         elif isinstance(output, ObjectProxy):
             self.params = output.params._get_value()
         else:
@@ -274,30 +448,69 @@ class InputStream(object):
                                 (k, v, k, self.params[k]))
             else:
                 self.params[k] = v
+        if rcvhwm is not None:
+            self.params['rcvhwm'] = rcvhwm
+        if hwm_policy is not None:
+            self.params['hwm_policy'] = hwm_policy
+        rcvhwm = self.params.get('rcvhwm', None)
+        
+        transfermode = self.params['transfermode']
+        if transfermode not in all_transfermodes:
+            raise ValueError("Unsupported transfer mode '%s'" % transfermode)
+        receiver_class = all_transfermodes[transfermode][1]
+        
+        if channels is not None:
+            if not receiver_class.supports_channels:
+                raise ValueError("Channel subsets are not supported with transfermode '%s'" % transfermode)
+            shape = self.params['shape']
+            channels = [int(c) for c in channels]
+            if len(shape) < 2 or any(c < 0 or c >= shape[1] for c in channels):
+                raise ValueError("Invalid channels %s for stream of shape %s" % (channels, shape))
+            self.params['channels'] = channels
+            self.params['shape'] = (shape[0], len(channels)) + tuple(shape[2:])
+            if isinstance(self.params.get('channel_info', None), list):
+                self.params['channel_info'] = [self.params['channel_info'][c] for c in channels]
         
         context = zmq.Context.instance()
         self.socket = context.socket(zmq.SUB)
         self.socket.linger = 1000  # don't let socket deadlock when exiting
-        self.socket.setsockopt(zmq.SUBSCRIBE, b'')
+        if rcvhwm is not None:
+            self.socket.rcvhwm = rcvhwm
+        self.receiver = receiver_class(self.socket, self.params)
+        self.socket.setsockopt(zmq.SUBSCRIBE, self.receiver.topic)
         #~ self.socket.setsockopt(zmq.DELAY_ATTACH_ON_CONNECT,1)
         self.socket.connect(self.url)
         
-        transfermode = self.params['transfermode']
-        if transfermode not in all_transfermodes:
-            raise ValueError("Unsupported transfer mode '%s'" % transfermode)
-        receiver_class = all_transfermodes[transfermode][1]
-        self.receiver = receiver_class(self.socket, self.params)
+        if self.params.get('hwm_policy', None) == 'drop_oldest':
+            # chunks are moved from the socket to this queue before being
+            # returned by recv(); the oldest ones are discarded when it is full
+            self._queue = collections.deque(maxlen=rcvhwm or self.socket.rcvhwm)
+        else:
+            self._queue = None
+        
+        if self.params.get('stats', False):
+            self.stats = StreamStats()
+            frame_shape = self.params['shape'][1:]
+            self._frame_nbytes = int(np.prod(frame_shape)) * make_dtype(self.params['dtype']).itemsize
+            self._stats_index = None
+        else:
+            self.stats = None
         
         self.connected = True
         if self.node and self.node():
-            self.node().after_input_connect(self.name)        
+            self.node().after_input_connect(self.name)
+            RPCServer.object_changed(self, self.node())
+        else:
+            RPCServer.object_changed(self)
     
     def poll(self, timeout=None):
         """Poll the socket of input stream.
         
         Return True if a new packet is available.
         """
-        return self.socket.poll(timeout=timeout)
+        if self._queue is not None and len(self._queue) > 0:
+            return True
+        return self.receiver.poll(timeout=timeout)
     
     def recv(self, **kargs):
         """
@@ -314,11 +527,66 @@ class InputStream(object):
             to read from the shared array or ``input_stream.recv(with_data=True)``
             to return the received data chunk.
         """
-        index, data = self.receiver.recv(**kargs)
+        if self.stats is not None:
+            t0 = stream_clock()
+        if self._queue is None:
+            index, data = self.receiver.recv(**kargs)
+        else:
+            index, data = self._recv_newest(**kargs)
+        if self.stats is not None:
+            self._update_stats(index, data, t0)
         if self._own_buffer and data is not None and self.buffer is not None:
             self.buffer.new_chunk(data, index=index)
+        if self.pyramid is not None:
+            self.pyramid.update()
         return index, data
     
+    def _update_stats(self, index, data, t0):
+        now = stream_clock()
+        if data is not None:
+            frames = data.shape[0]
+        elif self._stats_index is None or index < self._stats_index:
+            # first chunk, or index was reset
+            frames = 0
+        else:
+            frames = index - self._stats_index
+        self._stats_index = index
+        self.stats.add_chunk(frames, frames * self._frame_nbytes, now - t0)
+        if self.receiver.last_timestamp is not None:
+            self.stats.add_latency(now - self.receiver.last_timestamp)
+    
+    def get_stats(self):
+        """Return a dict of statistics about this stream, or None if the
+        connected output was not configured with ``stats=True``.
+        
+        See :func:`StreamStats.get_stats() <stream.streamstats.StreamStats.get_stats>`.
+        'time' includes the time spent waiting for data in :func:`recv`, and
+        'latency' is the time between :func:`OutputStream.send` and the return
+        of :func:`recv`. The number of chunks dropped because of *hwm_policy*
+        and the ring buffer overruns (sharedmem) are also included.
+        """
+        if self.stats is None:
+            return None
+        stats = self.stats.get_stats()
+        stats['dropped_chunks'] = self.dropped_chunks
+        stats['overruns'] = getattr(self.receiver, 'overruns', 0)
+        return stats
+    
+    def reset_stats(self):
+        """Reset the counters returned by :func:`get_stats`.
+        """
+        if self.stats is not None:
+            self.stats.reset()
+    
+    def _recv_newest(self, **kargs):
+        # hwm_policy='drop_oldest': move all pending chunks to the queue
+        queue = self._queue
+        while len(queue) == 0 or self.receiver.poll(timeout=0):
+            if len(queue) == queue.maxlen:
+                self.dropped_chunks += 1
+            queue.append(self.receiver.recv(**kargs))
+        return queue.popleft()
+    
     def empty_queue(self):
         """
         Receive all pending messing in the zmq queue without consuming them.
@@ -328,14 +596,19 @@ class InputStream(object):
         This can be annoying.
         This recv every thing with timeout=0 and so empty the queue.
         """
-        while self.socket.poll(timeout=0)>0:
-            self.socket.recv_multipart()
+        if self._queue is not None:
+            self._queue.clear()
+        self.receiver.empty_queue()
     
     def close(self):
         """Close the stream.
         
-        This closes the socket. No data can be received after this point.
+        This closes the socket and releases the shared memory of the buffer,
+        if necessary. No data can be received after this point.
         """
+        if self._own_buffer and self.buffer is not None:
+            self.buffer.close()
+            self.buffer = None
         self.receiver.close()
         self.socket.close()
         del self.socket
@@ -363,12 +636,107 @@ class InputStream(object):
             raise TypeError("No ring buffer configured for this InputStream.")
         return self.buffer.get_data(*args, **kargs)
     
-    def set_buffer(self, size=None, double=True, axisorder=None, shmem=None, fill=None):
+    def get_windows(self, *args, **kargs):
+        """
+        Return many equal-length segments of the RingBuffer attached to this
+        InputStream.
+        
+        If no RingBuffer is attached, raise an exception.
+        
+        For parameters, see :func:`RingBuffer.get_windows()`.
+        """
+        if self.buffer is None:
+            raise TypeError("No ring buffer configured for this InputStream.")
+        return self.buffer.get_windows(*args, **kargs)
+    
+    def _next_chunk_start(self, step):
+        # start of the next window of iter_chunks(); windows that were
+        # overwritten in the buffer are skipped, and iteration starts over
+        # when the buffer index is reset.
+        buf = self.buffer
+        gen = buf.generation()
+        first = max(buf.first_index(), 0)
+        if self._chunk_start is None or self._chunk_generation != gen:
+            self._chunk_start = first
+            self._chunk_generation = gen
+        elif self._chunk_start < first:
+            self._chunk_start += -(-(first - self._chunk_start) // step) * step
+        return self._chunk_start
+    
+    def available_chunks(self, size, step=None):
+        """Return the number of windows that :func:`iter_chunks` can yield
+        from the RingBuffer without receiving more data.
+        
+        If no RingBuffer is attached, raise an exception.
+        """
+        if self.buffer is None:
+            raise TypeError("No ring buffer configured for this InputStream.")
+        step = size if step is None else step
+        start = self._next_chunk_start(step)
+        return max((self.buffer.index() - start - size) // step + 1, 0)
+    
+    def iter_chunks(self, size, step=None, timeout=None, receive=True):
+        """Iterate over fixed-size windows of the stream.
+        
+        Yields ``(index, data)`` where *data* holds the *size* frames that end
+        at *index*. Consecutive windows start *step* frames apart (default:
+        *size*, i.e. no overlap). Windows are read from the RingBuffer attached
+        with `set_buffer()`; with ``double=True`` (or a *max_read_size* of at
+        least *size*) they are views of the buffer, without copy, and remain
+        valid until the buffer wraps around.
+        
+        Iteration starts with the oldest data in the buffer and continues
+        where the previous iteration stopped. Windows overwritten before they
+        were yielded are skipped.
+        
+        Parameters
+        ----------
+        size : int
+            Number of frames per window.
+        step : int or None
+            Number of frames between the starts of consecutive windows.
+        timeout : float or None
+            Maximum time (ms) to wait for a new chunk when no window is
+            available. The iteration stops when it expires; the default waits
+            forever.
+        receive : bool
+            If False, only windows already in the buffer are yielded. Use this
+            when chunks are received elsewhere (e.g. by a ThreadPollInput).
+        """
+        if self.buffer is None:
+            raise TypeError("No ring buffer configured for this InputStream.")
+        step = size if step is None else step
+        if size > self.buffer.shape[0]:
+            raise ValueError("Window size %d is larger than the ring buffer" % size)
+        while True:
+            if self.available_chunks(size, step) == 0:
+                if not receive or not self.poll(timeout=timeout):
+                    return
+                self.recv()
+                continue
+            start = self._chunk_start
+            self._chunk_start += step
+            yield start + size, self.buffer.get_data(start, start + size)
+    
+    def set_buffer(self, size=None, double=True, axisorder=None, shmem=None, fill=None, shm_options=None,
+                   max_read_size=None, backing='memory', path=None):
         """Ensure that this InputStream has a RingBuffer at least as large as 
         *size* and with the specified double-mode and axis order.
         
+        With double=False, *max_read_size* is the length of the longest segment
+        that must be readable without copy (see :class:`RingBuffer`); an
+        existing buffer that mirrors at least this many frames is reused.
+        
+        With backing='mmap', the buffer is stored in a memory-mapped file at
+        *path* (a temporary file if None). This allows histories much longer
+        than the available memory, e.g.
+        ``set_buffer(size=30*60*sample_rate, double=False, backing='mmap', path='history.raw')``.
+        
         If necessary, this will attach a new RingBuffer to the stream and remove
         any existing buffer.
+        
+        *shmem*, *fill* and *shm_options* are passed to the :class:`RingBuffer`
+        when a new one is created.
         """
         # first see if we already have a buffer that meets requirements
         bufs = []
@@ -377,16 +745,37 @@ class InputStream(object):
         if self.receiver.buffer is not None:
             bufs.append((self.receiver.buffer, False))
         for buf, own in bufs:
-            if buf.shape[0] >= size and buf.double == double and (axisorder is None or all(buf.axisorder == axisorder)):
+            if (buf.shape[0] >= size and buf.double == double and buf.max_read_size >= (max_read_size or 0)
+                    and buf.backing == backing and (path is None or buf.path == path)
+                    and (axisorder is None or all(buf.axisorder == axisorder))):
                 self.buffer = buf
                 self._own_buffer = own
                 return
             
         # attach a new buffer
+        if self._own_buffer and self.buffer is not None:
+            self.buffer.close()
         shape = (size,) + tuple(self.params['shape'][1:])
         dtype = make_dtype(self.params['dtype'])
-        self.buffer = RingBuffer(shape=shape, dtype=dtype, double=double, axisorder=axisorder, shmem=shmem, fill=fill)
+        self.buffer = RingBuffer(shape=shape, dtype=dtype, double=double, axisorder=axisorder, shmem=shmem, fill=fill,
+                                 shm_options=shm_options, max_read_size=max_read_size, backing=backing, path=path)
         self._own_buffer = True
+        self._chunk_start = None
+        if self.pyramid is not None:
+            self.pyramid = MinMaxPyramid(self.buffer, levels=self.pyramid.levels)
+    
+    def set_pyramid(self, levels=8):
+        """Attach a :class:`MinMaxPyramid` to the RingBuffer of this
+        InputStream.
+        
+        The pyramid is available as `InputStream.pyramid` and is updated each
+        time a chunk is received, for all transfer modes. A buffer must have
+        been attached with `set_buffer()` first.
+        """
+        if self.buffer is None:
+            raise TypeError("No ring buffer configured for this InputStream.")
+        self.pyramid = MinMaxPyramid(self.buffer, levels=levels)
+        self.pyramid.update()
     
     def reset_buffer_index(self):
         """
@@ -2,6 +2,8 @@
 # Copyright (c) 2016, French National Center for Scientific Research (CNRS)
 # Distributed under the (new) BSD License. See LICENSE for more info.
 
+import zmq
+
 from .arraytools import make_dtype
 from pyacq.core.rpc.proxy import ObjectProxy
 
@@ -17,6 +19,12 @@ class DataSender:
 
     Subclasses are used to implement different methods of data transmission.
     """
+    # type of the socket created by OutputStream
+    socket_type = zmq.PUB
+    # whether hwm_policy='drop_newest' and 'block' are supported (the socket
+    # must be an XPUB to set XPUB_NODROP)
+    supports_nodrop = False
+    
     def __init__(self, socket, params):
         self.socket = socket
         self.params = params
@@ -29,6 +37,12 @@ class DataSender:
     def send(self, index, data):
         raise NotImplementedError()
     
+    def reader_status(self):
+        """Return the progress of the connected readers, or None if this
+        transfer mode does not track them.
+        """
+        return None
+    
     def close(self):
         pass
 
@@ -41,6 +55,12 @@ class DataReceiver:
 
     Subclasses are used to implement different methods of data transmission.
     """
+    # whether InputStream.connect(channels=...) is supported
+    supports_channels = False
+    # whether each chunk is announced by a message on the socket (required
+    # to poll the socket directly, as in ThreadPollMultiInput)
+    socket_notifies = True
+    
     def __init__(self, socket, params):
         self.socket = socket
         self.params = params
@@ -49,9 +69,26 @@ class DataReceiver:
         #~ if 'dtype' in self.params:
             #~ self.params['dtype'] = make_dtype(self.params['dtype'])
         self.buffer = None
+        # topic subscribed by the InputStream socket
+        self.topic = b''
+        # send time of the last received chunk (only with stats=True)
+        self.last_timestamp = None
             
     def recv(self, return_data=False):
         raise NotImplementedError()
     
+    def poll(self, timeout=None):
+        """Return True if a new chunk can be received without blocking.
+        
+        The default implementation polls the socket.
+        """
+        return self.socket.poll(timeout=timeout)
+    
+    def empty_queue(self):
+        """Discard all pending messages.
+        """
+        while self.socket.poll(timeout=0)>0:
+            self.socket.recv_multipart()
+    
     def close(self):
         pass
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2016, French National Center for Scientific Research (CNRS)
+# Distributed under the (new) BSD License. See LICENSE for more info.
+
+import time
+import bisect
+import numpy as np
+
+
+# Clock used for the send timestamps embedded in stream messages. It is
+# monotonic and shared by all processes of a host, so latencies are only
+# meaningful between streams on the same machine.
+stream_clock = time.perf_counter
+
+
+class StreamStats:
+    """Throughput counters and latency histogram of an OutputStream or
+    InputStream.
+
+    Note: this class is usually not instantiated directly; use
+    ``OutputStream.configure(stats=True)`` and ``get_stats()`` on the streams.
+    """
+    # latency histogram bin edges (s): 0, then 4 bins per decade from 1 us to 10 s
+    latency_bins = [0.] + list(10 ** np.arange(-6, 1.01, 0.25))
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """Reset all counters.
+        """
+        self.start_time = stream_clock()
+        self.chunks = 0
+        self.frames = 0
+        self.nbytes = 0
+        self.time = 0.
+        self.latency_counts = [0] * len(self.latency_bins)
+        self.latency_sum = 0.
+        self.latency_max = 0.
+        self.latency_n = 0
+
+    def add_chunk(self, frames, nbytes, dt):
+        """Count a chunk of *frames* frames and *nbytes* bytes that took *dt*
+        seconds to send or receive.
+        """
+        self.chunks += 1
+        self.frames += frames
+        self.nbytes += nbytes
+        self.time += dt
+
+    def add_latency(self, latency):
+        """Add a latency (s) to the histogram.
+        """
+        i = max(bisect.bisect_right(self.latency_bins, latency) - 1, 0)
+        self.latency_counts[i] += 1
+        self.latency_sum += latency
+        self.latency_max = max(self.latency_max, latency)
+        self.latency_n += 1
+
+    def get_stats(self):
+        """Return a dict of counters and rates since the last reset.
+
+        Keys are 'chunks', 'frames', 'bytes', 'time' (seconds spent sending or
+        receiving), 'elapsed', 'chunk_rate', 'frame_rate' and 'byte_rate' (per
+        second of elapsed time). If latencies were measured, 'latency' is a
+        dict with 'count', 'mean', 'max', 'bin_edges' and 'counts'; the last
+        bin counts all latencies above the last edge.
+        """
+        elapsed = stream_clock() - self.start_time
+        stats = {
+            'chunks': self.chunks,
+            'frames': self.frames,
+            'bytes': self.nbytes,
+            'time': self.time,
+            'elapsed': elapsed,
+            'chunk_rate': self.chunks / elapsed,
+            'frame_rate': self.frames / elapsed,
+            'byte_rate': self.nbytes / elapsed,
+        }
+        if self.latency_n > 0:
+            stats['latency'] = {
+                'count': self.latency_n,
+                'mean': self.latency_sum / self.latency_n,
+                'max': self.latency_max,
+                'bin_edges': list(self.latency_bins),
+                'counts': list(self.latency_counts),
+            }
+        return stats
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+# Copyright (c) 2016, French National Center for Scientific Research (CNRS)
+# Distributed under the (new) BSD License. See LICENSE for more info.
+
+import time
+import numpy as np
+import pytest
+from pyacq.core.stream import OutputStream, InputStream, RingBuffer, MinMaxPyramid
+
+
+def check_pyramid(pyramid, index):
+    buf = pyramid.buffer
+    bsize = buf.shape[0]
+    for level in range(1, pyramid.levels + 1):
+        n = 2**level
+        # blocks entirely inside the readable part of the buffer
+        start = -(-max(index - bsize, 0) // n) * n
+        stop = (index // n) * n
+        assert pyramid.index(level) == stop
+        mins, maxs, means = pyramid.get_data(start, stop, level)
+        blocks = buf.get_data(start, stop).reshape((-1, n) + buf.shape[1:])
+        assert np.all(mins == blocks.min(axis=1))
+        assert np.all(maxs == blocks.max(axis=1))
+        assert np.allclose(means, blocks.mean(axis=1))
+
+
+def test_pyramid():
+    data = np.random.randint(-1000, 1000, size=(1000, 3)).astype('int16')
+    for double in (True, False):
+        buf = RingBuffer(shape=(64, 3), dtype='int16', double=double)
+        pyramid = MinMaxPyramid(buf, levels=4)
+        assert pyramid.levels == 4
+        assert pyramid.level_for(10) == 3
+        i = 0
+        for size in [5, 13, 1, 30, 64, 7, 40, 33, 2]:
+            buf.new_chunk(data[i:i+size])
+            i += size
+            pyramid.update()
+            check_pyramid(pyramid, i)
+        
+        # data skipped by more than the buffer size
+        buf.new_chunk(data[500:520], index=520)
+        pyramid.update()
+        check_pyramid(pyramid, 520)
+        
+        # reset
+        buf.reset_index()
+        buf.new_chunk(data[:20])
+        pyramid.update()
+        check_pyramid(pyramid, 20)
+    
+    with pytest.raises(ValueError):
+        pyramid.get_data(0, 16, 5)
+
+
+def test_stream_pyramid():
+    data = np.random.randn(600, 2).astype('float32')
+    for transfermode in ('plaindata', 'sharedmem'):
+        outstream = OutputStream()
+        outstream.configure(protocol='tcp', transfermode=transfermode, buffer_size=200,
+                            dtype='float32', shape=(-1, 2))
+        instream = InputStream()
+        instream.connect(outstream)
+        instream.set_buffer(size=200, double=False)
+        instream.set_pyramid(levels=5)
+        time.sleep(.2)
+        
+        for i in range(0, 600, 50):
+            outstream.send(data[i:i+50])
+            instream.recv()
+        assert np.all(instream[-200:] == data[-200:])
+        check_pyramid(instream.pyramid, 600)
+        
+        instream.close()
+        outstream.close()
+
+
+if __name__ == '__main__':
+    test_pyramid()
+    test_stream_pyramid()
@@ -2,6 +2,7 @@
 # Copyright (c) 2016, French National Center for Scientific Research (CNRS)
 # Distributed under the (new) BSD License. See LICENSE for more info.
 
+import os
 import numpy as np
 import pytest
 from pyacq.core.stream import OutputStream, InputStream, RingBuffer
@@ -142,7 +143,159 @@ def test_ringbuffer_shm():
     assert np.all(buf1[:] == buf2[:])
 
 
+def test_ringbuffer_validation():
+    for double in (True, False):
+        buf1 = RingBuffer(shape=(10, 3), dtype='float32', double=double, shmem=True)
+        buf2 = RingBuffer(shape=(10, 3), dtype='float32', double=double, shmem=buf1.shm_id)
+        d = np.ones((4, 3), dtype='float32')
+        buf1.new_chunk(d)
+        buf1.new_chunk(d)
+        
+        # read without copy from the reader side
+        gen = buf2.generation()
+        view = buf2.get_data(2, 8)
+        assert buf2.is_valid(2, gen)
+        
+        # chunk overwrites indices < 2
+        buf1.new_chunk(d)
+        assert buf2.is_valid(2, gen)
+        assert not buf2.is_valid(1, gen)
+        
+        # chunk overwrites part of the view
+        buf1.new_chunk(d)
+        assert not buf2.is_valid(2, gen)
+        assert buf2.is_valid(6, gen)
+        
+        # reset invalidates everything read before
+        buf1.reset_index()
+        assert buf2.generation() == gen + 1
+        assert not buf2.is_valid(6, gen)
+        assert buf2.index() == 0
+        
+        
+def test_ringbuffer_windows():
+    for double in (True, False):
+        for axisorder in (None, (1, 0)):
+            buf = RingBuffer(shape=(20, 3), dtype='float32', double=double, axisorder=axisorder, fill=-1)
+            data = np.arange(90, dtype='float32').reshape(30, 3)
+            buf.new_chunk(data[:15])
+            buf.new_chunk(data[15:])
+            
+            stops = [15, 18, 30]
+            win = buf.get_windows(stops, 5)
+            assert win.shape == (3, 5, 3)
+            for i, stop in enumerate(stops):
+                assert np.all(win[i] == data[stop-5:stop])
+                assert np.all(win[i] == buf[stop-5:stop])
+            
+            # caller-provided destination, with casting
+            out = np.empty((3, 5, 3), dtype='float64')
+            assert buf.get_windows(stops, 5, out=out) is out
+            assert np.all(out == win)
+            
+            # windows outside the readable range
+            with pytest.raises(IndexError):
+                buf.get_windows([12, 20], 5)
+            win = buf.get_windows([12, 20], 5, invalid='fill')
+            assert np.all(win[0] == -1)
+            assert np.all(win[1] == data[15:20])
+
+            with pytest.raises(ValueError):
+                buf.get_windows(stops, 21)
+
+
+def test_ringbuffer_out():
+    for double in (True, False):
+        buf = RingBuffer(shape=(10, 3), dtype='int16', double=double)
+        data = np.arange(45, dtype='int16').reshape(15, 3)
+        buf.new_chunk(data[:8])
+        buf.new_chunk(data[8:])
+        
+        # write into a caller-provided array, with casting
+        for start, stop in [(8, 13), (11, 14)]:
+            out = np.empty((stop-start, 3), dtype='float64')
+            assert buf.get_data(start, stop, out=out) is out
+            assert np.all(out == data[start:stop])
+        with pytest.raises(ValueError):
+            buf.get_data(8, 13, out=np.empty((4, 3)))
+        
+        # scratch buffer is reused between reads
+        a = buf.get_data(8, 13, scratch=True)
+        assert np.all(a == data[8:13])
+        b = buf.get_data(7, 12, scratch=True)
+        assert np.all(b == data[7:12])
+        if not double:
+            assert np.shares_memory(a, b)
+
+
+def test_ringbuffer_mirror():
+    # single ring buffer with the first 4 frames mirrored after its end
+    buf = RingBuffer(shape=(10, 3), dtype='int32', double=False, max_read_size=4, axisorder=(1, 0))
+    assert buf.buffer.shape == (14, 3)
+    data = np.arange(300, dtype='int32').reshape(100, 3)
+    i = 0
+    for size in [3, 7, 1, 10, 5, 6, 2, 9, 4, 8]:
+        buf.new_chunk(data[i:i+size])
+        i += size
+        # mirrored region is always consistent with the ring
+        assert np.all(buf.buffer[10:] == buf.buffer[:4])
+        for start in range(max(0, i-10), i):
+            for stop in range(start+1, min(start+4, i)+1):
+                d = buf.get_data(start, stop)
+                assert np.all(d == data[start:stop])
+                # short reads never copy
+                assert np.shares_memory(d, buf.buffer)
+        assert np.all(buf[max(0, i-10):i] == data[max(0, i-10):i])
+    
+    # skipped data is filled in the mirror too
+    buf.new_chunk(data[:2], index=i+13)
+    assert np.all(buf.buffer[10:] == buf.buffer[:4])
+    assert np.all(buf.get_data(i+3, i+7) == 0)
+    
+    with pytest.raises(ValueError):
+        RingBuffer(shape=(10, 3), dtype='int32', double=False, max_read_size=11)
+    with pytest.raises(ValueError):
+        RingBuffer(shape=(10, 3), dtype='int32', double=True, max_read_size=4)
+    
+    buf1 = RingBuffer(shape=(10, 3), dtype='int32', double=False, max_read_size=4, shmem=True)
+    buf2 = RingBuffer(shape=(10, 3), dtype='int32', double=False, max_read_size=4, shmem=buf1.shm_id)
+    buf1.new_chunk(data[:8])
+    buf1.new_chunk(data[8:13])
+    assert np.all(buf2.get_data(8, 12) == data[8:12])
+
+
+def test_ringbuffer_mmap():
+    for double, max_read_size in [(True, None), (False, None), (False, 3)]:
+        buf1 = RingBuffer(shape=(10, 3), dtype='float32', double=double, max_read_size=max_read_size,
+                          fill=0)
+        buf2 = RingBuffer(shape=(10, 3), dtype='float32', double=double, max_read_size=max_read_size,
+                          backing='mmap')
+        assert isinstance(buf2.buffer.base, np.memmap)
+        assert os.path.exists(buf2.path)
+        data = np.arange(150, dtype='float32').reshape(50, 3)
+        i = 0
+        for size in [3, 7, 1, 10, 5, 6]:
+            buf1.new_chunk(data[i:i+size])
+            buf2.new_chunk(data[i:i+size])
+            i += size
+            np.testing.assert_array_equal(buf1[-10:], buf2[-10:])
+            assert np.all(buf2.get_data(i-3, i) == data[i-3:i])
+    
+    # the file is not written at creation
+    buf = RingBuffer(shape=(100000, 4), dtype='float32', double=False, backing='mmap')
+    assert buf._filler == 0
+    assert os.stat(buf.path).st_blocks * 512 < buf.buffer.nbytes // 10
+    assert np.all(buf.buffer == 0)
+    
+    with pytest.raises(ValueError):
+        RingBuffer(shape=(10, 3), dtype='float32', backing='mmap', shmem=True)
+
 
 if __name__ =='__main__':
     test_ringbuffer()
-    test_ringbuffer_shm()
\ No newline at end of file
+    test_ringbuffer_shm()
+    test_ringbuffer_validation()
+    test_ringbuffer_windows()
+    test_ringbuffer_out()
+    test_ringbuffer_mirror()
+    test_ringbuffer_mmap()
\ No newline at end of file
@@ -3,8 +3,11 @@
 # Distributed under the (new) BSD License. See LICENSE for more info.
 
 
-from pyacq.core.stream.sharedarray import SharedArray, SharedMem
+from pyacq.core.stream.sharedarray import SharedArray, SharedMem, SharedMemPool, shm_backends, _size_class
 import numpy as np
+import os
+import sys
+import mmap
 import pyqtgraph.multiprocess as mp
 
 
@@ -18,6 +21,78 @@ def test_sharedmem():
     assert not arr2.flags['WRITEABLE']
 
 
+def test_sharedmem_backends():
+    for backend in shm_backends:
+        shm1 = SharedMem(nbytes=1000, backend=backend, populate=True, hugepages=True)
+        assert shm1.backend == backend
+        arr1 = shm1.to_numpy(offset=0, shape=1000, dtype='ubyte')
+        # new buffers are zero-filled
+        assert np.all(arr1 == 0)
+        arr1[:] = np.arange(1000) % 256
+        
+        shm2 = SharedMem(nbytes=1000, shm_id=shm1.shm_id)
+        arr2 = shm2.to_numpy(offset=0, shape=1000, dtype='ubyte')
+        assert np.all(arr1 == arr2)
+        del arr1, arr2
+        
+        shm2.close()
+        shm1.close()
+        if not sys.platform.startswith('win'):
+            # owner releases the name on close
+            assert not os.path.exists(shm1.shm_id)
+
+
+
+def test_sharedmem_pool():
+    pool = SharedMemPool(max_free_bytes=2**20)
+    shm1 = pool.acquire(5000)
+    assert shm1.nbytes >= 5000
+    arr = shm1.to_numpy(offset=0, shape=5000, dtype='ubyte')
+    arr[:] = 1
+    del arr
+    pool.release(shm1)
+    
+    # same size class: recycled and zero-filled
+    shm2 = pool.acquire(6000)
+    assert shm2 is shm1
+    assert np.all(shm2.to_numpy(offset=0, shape=6000, dtype='ubyte') == 0)
+    
+    # leading bytes can be kept; buffers created with other options are not reused
+    shm2.to_numpy(offset=0, shape=6000, dtype='ubyte')[:] = 1
+    pool.release(shm2)
+    assert pool.acquire(5000, populate=True) is not shm2
+    shm2 = pool.acquire(5000, keep_bytes=64)
+    arr = shm2.to_numpy(offset=0, shape=5000, dtype='ubyte')
+    assert np.all(arr[:64] == 1) and np.all(arr[64:] == 0)
+    del arr
+    
+    # buffer is released when its owner is collected
+    class Owner:
+        pass
+    owner = Owner()
+    shm3 = pool.acquire(5000, owner=owner)
+    assert shm3 is not shm2
+    del owner
+    assert pool.acquire(5000) is shm3
+    
+    # too large to be kept in the pool
+    shm4 = pool.acquire(2**21)
+    pool.release(shm4)
+    assert pool.acquire(2**21) is not shm4
+    
+    # size classes waste at most 12.5%
+    page = mmap.PAGESIZE
+    for pages in [1, 7, 8, 9, 17, 33, 100, 1000, 4097]:
+        size = _size_class(pages * page)
+        assert size % page == 0
+        assert pages * page <= size <= pages * page * 1.125
+    
+    pool.release(shm2)
+    pool.clear()
+    if not sys.platform.startswith('win'):
+        assert not os.path.exists(shm2.shm_id)
+
+
 def test_sharedarray():    
     sa = SharedArray(shape=(10), dtype = 'int32')
     np_a = sa.to_numpy()
@@ -47,5 +122,7 @@ def test_sharedarray_multiprocess():
     
 if __name__ == '__main__':
     test_sharedmem()
+    test_sharedmem_backends()
+    test_sharedmem_pool()
     test_sharedarray()
     test_sharedarray_multiprocess()
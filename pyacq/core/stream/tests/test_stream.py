@@ -7,8 +7,17 @@ import timeit
 import pytest
 import sys
 import os
+import threading
+import asyncio
+import subprocess
+import gc
 
-from pyacq.core.stream import OutputStream, InputStream, RingBuffer, compression_methods
+from pyacq.core.stream import (OutputStream, InputStream, AsyncOutputStream, AsyncInputStream,
+                               RingBuffer, compression_methods, all_transfermodes)
+from pyacq.core.stream.sharedarray import shm_backends
+from pyacq.core.stream.coalesce import ChunkCoalescer
+from pyacq.core.stream.compression import compress, decompress
+from pyacq.core.stream.sharedmemstream import _CURSOR_TOKEN, _CURSOR_PID
 import numpy as np
 
 
@@ -21,6 +30,38 @@ def test_stream_plaindata():
     for protocol in protocols:
         for compression in compression_methods:
             check_stream(transfermode='plaindata', protocol=protocol, compression=compression)
+
+def test_stream_compression_filters():
+    methods = ['delta', 'shuffle+zlib', 'delta+shuffle+zlib', 'delta+bitshuffle+zlib']
+    for method in methods:
+        # float data is sent unchanged by 'delta'
+        check_stream(transfermode='plaindata', compression=method)
+        
+        outstream = OutputStream()
+        outstream.configure(transfermode='plaindata', dtype='int16', shape=(-1, 3),
+                            compression=method)
+        instream = InputStream()
+        instream.connect(outstream)
+        time.sleep(.1)
+        
+        data = np.cumsum(np.random.randint(-100, 100, size=(301, 3)), axis=0).astype('int16')
+        for chunk in [data[:100], np.asfortranarray(data[100:300]), data[300:]]:
+            outstream.send(chunk)
+            index, chunk2 = instream.recv(return_data=True)
+            assert np.all(chunk2 == chunk)
+        
+        outstream.close()
+        instream.close()
+    
+    with pytest.raises(ValueError):
+        OutputStream().configure(compression='zlib+delta')
+    
+    # compress() returns bytes, as the backends do
+    data = np.arange(1000, dtype='int16')
+    for method in ['zlib', 'shuffle', 'bitshuffle+zlib']:
+        comp = compress(data, method, data.itemsize)
+        assert isinstance(comp, bytes)
+        assert np.all(np.frombuffer(decompress(comp, method), dtype='int16') == data)
             
 def test_stream_sharedmem():
     chunksize = 128
@@ -29,10 +70,613 @@ def test_stream_sharedmem():
     dtype = 'float32'
     shm_size = chunksize * n_shared_chunks
     for protocol in protocols:
-        check_stream(chunksize=chunksize, chan_shape=chan_shape, buffer_size=shm_size,
-                     transfermode='sharedmem', protocol=protocol,
-                     dtype=dtype)
+        for shm_backend in shm_backends:
+            check_stream(chunksize=chunksize, chan_shape=chan_shape, buffer_size=shm_size,
+                         transfermode='sharedmem', protocol=protocol,
+                         dtype=dtype, shm_backend=shm_backend)
             
+def test_stream_coalescing():
+    for transfermode in ['plaindata', 'sharedmem']:
+        outstream = OutputStream()
+        outstream.configure(transfermode=transfermode, dtype='float32', shape=(-1, 4),
+                            buffer_size=1000, max_latency_ms=100, max_chunk_frames=50)
+        instream = InputStream()
+        instream.connect(outstream)
+        instream.set_buffer(1000)
+        time.sleep(.1)
+        
+        data = np.arange(400, dtype='float32').reshape(100, 4)
+        
+        # flush on size
+        for i in range(5):
+            outstream.send(data[i*10:(i+1)*10])
+        assert instream.poll(timeout=50)
+        index, chunk = instream.recv(return_data=True)
+        assert index == 50
+        assert np.all(chunk == data[:50])
+        
+        # flush on timer
+        for i in range(5, 8):
+            outstream.send(data[i*10:(i+1)*10])
+        assert not instream.poll(timeout=20)
+        assert instream.poll(timeout=500)
+        index, chunk = instream.recv(return_data=True)
+        assert index == 80
+        assert np.all(chunk == data[50:80])
+        
+        # skipped data is not merged
+        outstream.send(data[80:90])
+        outstream.send(data[90:100], index=110)
+        index, chunk = instream.recv(return_data=True)
+        assert index == 90
+        index, chunk = instream.recv(return_data=True)
+        assert index == 110
+        assert np.all(instream[100:110] == data[90:100])
+        
+        outstream.close()
+        instream.close()
+    
+    # chunks with extra arguments are sent on their own, in order
+    sent = []
+    coalescer = ChunkCoalescer(lambda index, data, **kargs: sent.append((index, kargs)), 1000)
+    coalescer.send(10, data[:10])
+    coalescer.send(20, data[10:20], flag=True)
+    coalescer.send(30, data[20:30])
+    coalescer.close()
+    assert sent == [(10, {}), (20, {'flag': True}), (30, {})]
+
+
+def test_plaindata_recv_out():
+    outstream = OutputStream()
+    outstream.configure(transfermode='plaindata', dtype='float32', shape=(-1, 16))
+    instream = InputStream()
+    instream.connect(outstream)
+    time.sleep(.1)
+    
+    out = np.empty((64, 16), dtype='float32')
+    
+    # same layout: received directly into out
+    arr = np.random.rand(64, 16).astype('float32')
+    outstream.send(arr)
+    index, data = instream.recv(out=out)
+    assert index == 64
+    assert data is out
+    assert np.all(out == arr)
+    
+    # different layout: copied into out
+    arr = np.random.rand(16, 64).astype('float32').T
+    outstream.send(arr)
+    index, data = instream.recv(out=out)
+    assert index == 128
+    assert data is out
+    assert np.all(out == arr)
+    
+    outstream.close()
+    instream.close()
+
+
+def test_plaindata_reuse_array():
+    # the caller may change its array as soon as send() returns
+    for protocol in ['tcp', 'inproc']:
+        outstream = OutputStream()
+        outstream.configure(protocol=protocol, transfermode='plaindata', dtype='float32', shape=(-1, 64))
+        instream = InputStream()
+        instream.connect(outstream)
+        time.sleep(.1)
+        
+        arr = np.empty((1024, 64), dtype='float32')
+        for i in range(20):
+            arr[:] = i
+            outstream.send(arr)
+            arr[:] = -1
+        for i in range(20):
+            index, data = instream.recv()
+            assert np.all(data == i)
+        
+        outstream.close()
+        instream.close()
+
+
+@pytest.mark.skipif('sharedmem_futex' not in all_transfermodes, reason='futex not available')
+def test_stream_sharedmem_futex():
+    check_stream(chunksize=128, chan_shape=(16,), buffer_size=1280,
+                 transfermode='sharedmem_futex', dtype='float32')
+    check_stream_ringbuffer(transfermode='sharedmem_futex', buffer_size=4096)
+    
+    outstream = OutputStream()
+    outstream.configure(transfermode='sharedmem_futex', dtype='float32', shape=(-1, 4),
+                        buffer_size=100)
+    instream = InputStream()
+    instream.connect(outstream)
+    assert not instream.poll(timeout=10)
+    
+    # wake up a reader blocked in poll() from another thread
+    chunk = np.ones((10, 4), dtype='float32')
+    threading.Timer(0.1, outstream.send, args=(chunk,)).start()
+    t0 = time.perf_counter()
+    assert instream.poll(timeout=5000)
+    assert time.perf_counter() - t0 < 1.
+    index, data = instream.recv(return_data=True)
+    assert index == 10
+    assert np.all(data == chunk)
+    
+    # chunks sent before recv are merged
+    outstream.send(chunk)
+    outstream.send(chunk*2)
+    index, data = instream.recv(return_data=True)
+    assert index == 30
+    assert data.shape == (20, 4)
+    
+    # overrun: reader skips overwritten data
+    for i in range(12):
+        outstream.send(chunk)
+    index, data = instream.recv(return_data=True)
+    assert index == 150
+    assert data.shape == (100, 4)
+    assert instream.receiver.overruns == 1
+    
+    # reset goes back to index 0
+    outstream.reset_buffer_index()
+    outstream.send(chunk)
+    index, data = instream.recv(return_data=True)
+    assert index == 10
+    
+    outstream.close()
+    instream.close()
+
+
+def test_sharedmem_overrun():
+    outstream = OutputStream()
+    outstream.configure(transfermode='sharedmem', dtype='float32', shape=(-1, 4),
+                        buffer_size=100, double=True)
+    instream = InputStream()
+    instream.connect(outstream)
+    time.sleep(.1)
+    
+    chunk = np.zeros((40, 4), dtype='float32')
+    outstream.send(chunk)
+    instream.recv()
+    assert instream.receiver.overruns == 0
+    
+    # sender runs 3 chunks ahead of the reader; the first one is overwritten
+    for i in range(3):
+        outstream.send(chunk)
+    index, _ = instream.recv()
+    assert index == 80
+    assert instream.receiver.overruns == 1
+    for i in range(2):
+        instream.recv()
+    assert instream.receiver.overruns == 1
+    
+    outstream.close()
+    instream.close()
+
+
+def test_sharedmem_reader_cursors():
+    for transfermode in ('sharedmem', 'sharedmem_futex'):
+        if transfermode not in all_transfermodes:
+            continue
+        outstream = OutputStream()
+        outstream.configure(transfermode=transfermode, dtype='float32', shape=(-1, 4),
+                            buffer_size=100, double=True, max_readers=2)
+        fast, slow, untracked = InputStream(), InputStream(), InputStream()
+        for instream in (fast, slow, untracked):
+            instream.connect(outstream)
+        time.sleep(.1)
+        assert untracked.receiver._slot is None
+        
+        chunk = np.zeros((40, 4), dtype='float32')
+        for i in range(4):
+            outstream.send(chunk)
+            fast.recv()
+        status = outstream.get_reader_status()
+        assert status['index'] == 160
+        lags = {r['slot']: r['lag'] for r in status['readers']}
+        assert lags[fast.receiver._slot] == 0
+        assert lags[slow.receiver._slot] == 160
+        assert status['max_lag'] == 160
+        
+        # the slow reader publishes its overruns
+        slow.recv()
+        status = outstream.get_reader_status()
+        reader = [r for r in status['readers'] if r['slot'] == slow.receiver._slot][0]
+        assert reader['overruns'] == 1
+        
+        # a closed reader frees its slot
+        slot = slow.receiver._slot
+        slow.close()
+        status = outstream.get_reader_status()
+        assert slot not in [r['slot'] for r in status['readers']]
+        
+        # the slot of a reader whose process died is ignored, then reclaimed
+        if not sys.platform.startswith('win'):
+            proc = subprocess.Popen([sys.executable, '-c', 'pass'])
+            proc.wait()
+            table = outstream.sender._cursors.table
+            table[slot, _CURSOR_TOKEN] = 1
+            table[slot, _CURSOR_PID] = proc.pid
+            status = outstream.get_reader_status()
+            assert slot not in [r['slot'] for r in status['readers']]
+            reader = InputStream()
+            reader.connect(outstream)
+            assert reader.receiver._slot == slot
+            reader.close()
+        
+        # a reader that is collected without close() frees its slot
+        reader = InputStream()
+        reader.connect(outstream)
+        assert reader.receiver._slot == slot
+        del reader
+        gc.collect()
+        assert outstream.sender._cursors.table[slot, _CURSOR_TOKEN] == 0
+        
+        fast.close()
+        untracked.close()
+        outstream.close()
+    
+    # without max_readers, readers are not tracked
+    outstream = OutputStream()
+    outstream.configure(transfermode='sharedmem', dtype='float32', shape=(-1, 4), buffer_size=100)
+    assert outstream.get_reader_status() is None
+    outstream.close()
+
+
+def test_sharedmem_pool_reuse():
+    outstream = OutputStream()
+    outstream.configure(transfermode='sharedmem', dtype='float32', shape=(-1, 4),
+                        buffer_size=100, double=True)
+    shm_id = outstream.params['shm_id']
+    
+    # reconfiguring releases the previous buffer, which is then recycled
+    outstream.configure(transfermode='sharedmem', dtype='float32', shape=(-1, 4),
+                        buffer_size=100, double=True)
+    assert outstream.params['shm_id'] == shm_id
+    
+    instream = InputStream()
+    instream.connect(outstream)
+    time.sleep(.1)
+    chunk = np.ones((40, 4), dtype='float32')
+    outstream.send(chunk)
+    instream.recv()
+    assert np.all(instream.receiver.buffer[0:40] == chunk)
+    gen = instream.receiver.buffer.generation()
+    outstream.close()
+    
+    # the released buffer was zero-filled before reuse
+    buf = RingBuffer(shape=(100, 4), dtype='float32', double=True, shmem=True)
+    assert buf.shm_id == shm_id
+    assert np.all(buf.buffer == 0)
+    
+    # a reader of the previous stream can tell that the buffer was reused
+    buf.new_chunk(chunk)
+    assert buf.generation() == gen + 1
+    assert not instream.receiver.buffer.is_valid(0, generation=gen)
+    instream.close()
+    buf.close()
+    
+    # a chunk announced before the buffer was recycled is counted as overrun
+    outstream = OutputStream()
+    outstream.configure(transfermode='sharedmem', dtype='float32', shape=(-1, 4),
+                        buffer_size=100, double=True)
+    shm_id = outstream.params['shm_id']
+    instream = InputStream()
+    instream.connect(outstream)
+    time.sleep(.1)
+    outstream.send(chunk)
+    assert instream.poll(timeout=1000)
+    outstream.close()
+    buf = RingBuffer(shape=(100, 4), dtype='float32', double=True, shmem=True)
+    assert buf.shm_id == shm_id
+    buf.new_chunk(chunk)
+    instream.recv()
+    assert instream.receiver.overruns == 1
+    instream.close()
+    buf.close()
+    
+    # but not after the sender was reset
+    outstream = OutputStream()
+    outstream.configure(transfermode='sharedmem', dtype='float32', shape=(-1, 4),
+                        buffer_size=100, double=True)
+    instream = InputStream()
+    instream.connect(outstream)
+    time.sleep(.1)
+    outstream.send(chunk)
+    instream.recv()
+    outstream.reset_buffer_index()
+    outstream.send(chunk)
+    assert instream.recv()[0] == 40
+    assert instream.receiver.overruns == 0
+    outstream.close()
+    instream.close()
+
+
+def test_stream_hwm_policy():
+    data = np.zeros((2, 4), dtype='float32')
+    
+    def connect(policy, sndhwm=5, rcvhwm=5):
+        outstream = OutputStream()
+        outstream.configure(protocol='inproc', dtype='float32', shape=(-1, 4), sndhwm=sndhwm,
+                            rcvhwm=rcvhwm, hwm_policy=policy)
+        instream = InputStream()
+        instream.connect(outstream)
+        time.sleep(.1)
+        return outstream, instream
+    
+    def recv_all(instream):
+        indexes = []
+        while instream.poll(timeout=50):
+            indexes.append(instream.recv()[0])
+        return indexes
+    
+    # drop_newest: chunks that do not fit are counted by the sender
+    outstream, instream = connect('drop_newest')
+    for i in range(50):
+        outstream.send(data)
+    received = recv_all(instream)
+    assert outstream.dropped_chunks > 0
+    assert len(received) + outstream.dropped_chunks == 50
+    assert received == [2 * (i+1) for i in range(len(received))]
+    outstream.close()
+    instream.close()
+    
+    # drop_newest: a full reader of a channel subset does not block the others
+    outstream = OutputStream()
+    outstream.configure(protocol='inproc', dtype='float32', shape=(-1, 4), sndhwm=5,
+                        rcvhwm=5, hwm_policy='drop_newest')
+    instream_sub = InputStream()
+    instream_sub.connect(outstream, channels=[0, 1])
+    time.sleep(.1)
+    instream = InputStream()
+    instream.connect(outstream)
+    time.sleep(.1)
+    received = []
+    for i in range(50):
+        outstream.send(data)
+        received.extend(recv_all(instream))
+    assert received == [2 * (i+1) for i in range(50)]
+    assert outstream.dropped_chunks > 0
+    outstream.close()
+    instream.close()
+    instream_sub.close()
+    
+    # drop_oldest: the reader keeps the newest chunks
+    outstream, instream = connect('drop_oldest', sndhwm=100)
+    for i in range(50):
+        outstream.send(data)
+    received = recv_all(instream)
+    assert received == [2 * i for i in range(46, 51)]
+    assert instream.dropped_chunks == 45
+    outstream.close()
+    instream.close()
+    
+    # block: send() waits for the reader
+    outstream, instream = connect('block')
+    def send():
+        for i in range(50):
+            outstream.send(data)
+    thread = threading.Thread(target=send, daemon=True)
+    thread.start()
+    time.sleep(.2)
+    assert thread.is_alive()
+    received = []
+    while len(received) < 50:
+        assert instream.poll(timeout=1000)
+        received.append(instream.recv()[0])
+    thread.join()
+    assert received == [2 * (i+1) for i in range(50)]
+    assert outstream.dropped_chunks == 0
+    outstream.close()
+    instream.close()
+    
+    # sharedmem senders cannot hold back a chunk for a slow reader
+    for transfermode in ['sharedmem', 'sharedmem_futex']:
+        if transfermode not in all_transfermodes:
+            continue
+        for policy in ['drop_newest', 'block']:
+            with pytest.raises(ValueError):
+                OutputStream().configure(transfermode=transfermode, dtype='float32',
+                                         shape=(-1, 4), buffer_size=100, hwm_policy=policy)
+        
+        # drop_oldest only acts on the receiving side; nothing is dropped by
+        # the sender
+        outstream = OutputStream()
+        outstream.configure(transfermode=transfermode, dtype='float32', shape=(-1, 4),
+                            buffer_size=1000, hwm_policy='drop_oldest', rcvhwm=5)
+        instream = InputStream()
+        instream.connect(outstream)
+        time.sleep(.1)
+        for i in range(50):
+            outstream.send(data)
+        received = recv_all(instream)
+        assert received[-1] == 100
+        assert outstream.dropped_chunks == 0
+        outstream.close()
+        instream.close()
+
+
+def test_stream_stats():
+    for transfermode in ['plaindata', 'sharedmem', 'sharedmem_futex']:
+        if transfermode not in all_transfermodes:
+            continue
+        outstream = OutputStream()
+        outstream.configure(transfermode=transfermode, dtype='float32', shape=(-1, 4),
+                            buffer_size=1000, stats=True)
+        instream = InputStream()
+        instream.connect(outstream)
+        time.sleep(.1)
+        
+        data = np.zeros((10, 4), dtype='float32')
+        for i in range(10):
+            outstream.send(data)
+            instream.recv(return_data=True)
+        
+        stats = outstream.get_stats()
+        assert stats['chunks'] == 10
+        assert stats['frames'] == 100
+        assert stats['bytes'] == 100 * 16
+        assert stats['dropped_chunks'] == 0
+        
+        stats = instream.get_stats()
+        assert stats['chunks'] == 10
+        assert stats['frames'] == 100
+        assert stats['latency']['count'] == 10
+        assert sum(stats['latency']['counts']) == 10
+        assert 0 < stats['latency']['mean'] <= stats['latency']['max'] < 1
+        
+        instream.reset_stats()
+        assert instream.get_stats()['chunks'] == 0
+        
+        outstream.close()
+        instream.close()
+    
+    # disabled by default
+    outstream = OutputStream()
+    outstream.configure()
+    assert outstream.get_stats() is None
+    outstream.close()
+
+
+def test_stream_channel_subset():
+    outstream = OutputStream()
+    outstream.configure(transfermode='plaindata', dtype='float32', shape=(-1, 8),
+                        compression='delta+shuffle+zlib')
+    outstream.params['channel_info'] = [{'name': 'ch%d' % i} for i in range(8)]
+    full = InputStream()
+    full.connect(outstream)
+    subsets = [[1, 5], [1, 5], [7, 0, 3]]
+    instreams = []
+    for channels in subsets:
+        instream = InputStream()
+        instream.connect(outstream, channels=channels)
+        instreams.append(instream)
+    time.sleep(.1)
+    
+    assert instreams[2].params['shape'] == (-1, 3)
+    assert [ch['name'] for ch in instreams[2].params['channel_info']] == ['ch7', 'ch0', 'ch3']
+    assert outstream.params['shape'] == (-1, 8)
+    
+    for i in range(3):
+        data = np.random.normal(size=(100, 8)).astype('float32')
+        outstream.send(data)
+        index, chunk = full.recv(return_data=True)
+        assert np.all(chunk == data)
+        for channels, instream in zip(subsets, instreams):
+            index, chunk = instream.recv(return_data=True)
+            assert index == 100 * (i+1)
+            assert np.all(chunk == data[:, channels])
+    
+    # one message per distinct subset
+    assert len(outstream.sender._topics) == 3
+    
+    for instream in instreams:
+        instream.close()
+    full.close()
+    outstream.close()
+    
+    with pytest.raises(ValueError):
+        outstream = OutputStream()
+        outstream.configure(transfermode='sharedmem', shape=(-1, 8), buffer_size=100)
+        InputStream().connect(outstream, channels=[0])
+    outstream.close()
+
+
+def test_stream_iter_chunks():
+    for transfermode in ['plaindata', 'sharedmem']:
+        outstream = OutputStream()
+        outstream.configure(transfermode=transfermode, dtype='float32', shape=(-1, 2),
+                            buffer_size=200, double=True)
+        instream = InputStream()
+        instream.connect(outstream)
+        instream.set_buffer(200, double=True)
+        time.sleep(.1)
+        
+        data = np.arange(1000, dtype='float32').reshape(500, 2)
+        for i in range(3):
+            outstream.send(data[i*30:(i+1)*30])
+        with pytest.raises(ValueError):
+            next(instream.iter_chunks(500))
+        
+        # overlapping windows, zero-copy from the double buffer
+        windows = list(instream.iter_chunks(40, step=20, timeout=100))
+        assert [index for index, _ in windows] == [40, 60, 80]
+        for index, window in windows:
+            assert np.all(window == data[index-40:index])
+            assert np.shares_memory(window, instream.buffer.buffer)
+        assert instream.available_chunks(40, step=20) == 0
+        
+        # iteration resumes where it stopped
+        outstream.send(data[90:130])
+        instream.recv()
+        assert instream.available_chunks(40, step=20) == 2
+        windows = list(instream.iter_chunks(40, step=20, receive=False))
+        assert [index for index, _ in windows] == [100, 120]
+        
+        # overwritten windows are skipped
+        for i in range(10):
+            outstream.send(data[130+i*30:160+i*30])
+            instream.recv()
+        index, window = next(instream.iter_chunks(40, step=20, receive=False))
+        assert index == 280
+        assert np.all(window == data[index-40:index])
+        
+        outstream.close()
+        instream.close()
+
+
+def test_stream_async():
+    async def run(transfermode, hwm_policy):
+        outstream = AsyncOutputStream()
+        outstream.configure(transfermode=transfermode, dtype='float32', shape=(-1, 4),
+                            buffer_size=1000, hwm_policy=hwm_policy)
+        instreams = [AsyncInputStream() for i in range(3)]
+        for instream in instreams:
+            instream.connect(outstream)
+        await asyncio.sleep(.1)
+        assert not await instreams[0].poll(timeout=10)
+        
+        data = np.random.normal(size=(100, 4)).astype('float32')
+        
+        async def consume(instream):
+            received = []
+            async for index, chunk in instream.iter_chunks(return_data=True):
+                received.append(index)
+                assert np.all(chunk == data[index-chunk.shape[0]:index])
+                if index == 100:
+                    break
+            return received
+        
+        async def produce():
+            for i in range(10):
+                await outstream.send(data[i*10:(i+1)*10])
+                await asyncio.sleep(.01)
+        
+        results = await asyncio.gather(produce(), *[consume(instream) for instream in instreams])
+        for received in results[1:]:
+            assert received[-1] == 100
+            if transfermode != 'sharedmem_futex':
+                assert received == list(range(10, 101, 10))
+        
+        # a cancelled wait releases its worker thread promptly
+        task = asyncio.ensure_future(instreams[0].recv())
+        await asyncio.sleep(.05)
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        await asyncio.wait_for(asyncio.get_running_loop().shutdown_default_executor(), 1)
+        
+        outstream.close()
+        for instream in instreams:
+            instream.close()
+    
+    for transfermode in ['plaindata', 'sharedmem', 'sharedmem_futex']:
+        if transfermode not in all_transfermodes:
+            continue
+        for hwm_policy in [None, 'block'] if transfermode == 'plaindata' else [None]:
+            asyncio.run(run(transfermode, hwm_policy))
+
+
 def check_stream(chunksize=1024, chan_shape=(16,), **kwds):
     chunk_shape = (chunksize,) + chan_shape
     stream_spec = dict(protocol='tcp', interface='127.0.0.1', port='*', 
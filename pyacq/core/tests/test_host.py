@@ -30,6 +30,17 @@ def test_host1():
     p2.stop()
 
 
+def test_host_workers():
+    # calls that look up their server also work in the worker threads
+    p1, host1 = Host.spawn('host1', max_workers=2)
+    ng11 = host1.create_nodegroup('ng1')
+    assert len(host1.spawners) == 1
+    host1.close_all_nodegroups()
+    assert len(host1.spawners) == 0
+    p1.stop()
+
+
 if __name__ == '__main__':
     logging.getLogger().level=logging.INFO
     test_host1()
+    test_host_workers()
@@ -3,7 +3,9 @@
 # Distributed under the (new) BSD License. See LICENSE for more info.
 
 from pyacq.core import OutputStream, InputStream
-from pyacq.core.tools import ThreadPollInput, StreamConverter, ChannelSplitter, ChunkResizer
+from pyacq.core.tools import (ThreadPollInput, ThreadPollMultiInput, StreamConverter, ChannelSplitter, ChunkResizer,
+                              StreamSynchronizer)
+from pyacq.core.stream.streamstats import stream_clock
 from pyqtgraph.Qt import QtCore, QtGui
 import pyqtgraph as pg
 
@@ -216,8 +218,115 @@ def test_ChunkResizer():
     
     
 
+def test_StreamSynchronizer():
+    app = pg.mkQApp()
+    
+    # two devices sending their new frames every 20 ms; each frame holds its
+    # acquisition time
+    rates = [1000., 300.]
+    outstreams = []
+    for rate in rates:
+        outstream = OutputStream()
+        outstream.configure(dtype='float64', shape=(-1, 1), sample_rate=rate, stats=True)
+        outstreams.append(outstream)
+    
+    sync = StreamSynchronizer()
+    sync.configure(nb_input=2, sample_rate=500., chunksize=25)
+    for i, outstream in enumerate(outstreams):
+        sync.inputs['in%d' % i].connect(outstream)
+    for output in sync.outputs.values():
+        output.configure()
+    sync.initialize()
+    assert sync.outputs['out1'].params['sample_rate'] == 500.
+    
+    instreams = []
+    for output in sync.outputs.values():
+        instream = InputStream()
+        instream.connect(output)
+        instreams.append(instream)
+    sync.start()
+    time.sleep(.2)
+    
+    t_start = stream_clock()
+    for n in range(50):
+        time.sleep(.02)
+        t = stream_clock()
+        for outstream, rate in zip(outstreams, rates):
+            index = np.arange(outstream.last_index, int((t - t_start) * rate) + 1)
+            outstream.send(t_start + index[:, None] / rate)
+    time.sleep(.2)
+    sync.stop()
+    
+    blocks = [[], []]
+    for instream, received in zip(instreams, blocks):
+        while instream.poll(timeout=0):
+            index, data = instream.recv(return_data=True)
+            assert data.shape == (25, 1)
+            received.append(data)
+    nb_block = min(len(b) for b in blocks)
+    assert nb_block > 10
+    out0, out1 = [np.concatenate(b[:nb_block])[:, 0] for b in blocks]
+    # outputs are aligned on the same clock and resampled at 500 Hz
+    assert not np.any(np.isnan(out0)) and not np.any(np.isnan(out1))
+    error = np.abs(out0 - out1)
+    assert error.max() < 5e-3
+    # once the clock fits have converged
+    assert error[250:].max() < 2e-3
+    assert abs((out0[-1] - out0[0]) / (len(out0) - 1) - 1 / 500.) < 1e-5
+    
+    sync.close()
+    for stream in outstreams + instreams:
+        stream.close()
+
+
+def test_ThreadPollMultiInput():
+    app = pg.mkQApp()
+    
+    nb_stream = 4
+    outstreams, senders, pollers = [], [], []
+    last_pos = [0] * nb_stream
+    
+    def make_callback(i):
+        def on_new_data(pos, arr):
+            assert arr.shape == (chunksize, nb_channel)
+            last_pos[i] += chunksize
+            assert last_pos[i] == pos
+        return on_new_data
+    
+    for i in range(nb_stream):
+        outstream = OutputStream()
+        outstream.configure(**stream_spec)
+        instream = InputStream()
+        instream.connect(outstream)
+        outstreams.append((outstream, instream))
+        senders.append(ThreadSender(output_stream=outstream))
+        poller = ThreadPollInput(input_stream=instream, return_data=True)
+        # process_data is called from the multiplexing thread
+        poller.process_data = make_callback(i)
+        pollers.append(poller)
+    
+    multi_poller = ThreadPollMultiInput(pollers)
+    time.sleep(.2)
+    
+    multi_poller.start()
+    for sender in senders:
+        sender.start()
+    for sender in senders:
+        sender.wait()
+    time.sleep(.2)
+    multi_poller.stop()
+    multi_poller.wait()
+    
+    assert last_pos == [500 * chunksize] * nb_stream
+    for outstream, instream in outstreams:
+        outstream.close()
+        instream.close()
+
+
 if __name__ == '__main__':
     test_ThreadPollInput()
     test_streamconverter()
     test_stream_splitter()
     test_ChunkResizer()
+    test_StreamSynchronizer()
+    test_ThreadPollMultiInput()
@@ -6,6 +6,7 @@ import time
 import weakref
 import logging
 import atexit
+import collections
 import numpy as np
 import zmq
 from collections import OrderedDict
@@ -15,6 +16,7 @@ from pyqtgraph.util.mutex import Mutex
 from .node import Node, register_node_type
 from .stream import OutputStream, InputStream
 from .stream.arraytools import make_dtype
+from .stream.streamstats import stream_clock
 
 
 class ThreadPollInput(QtCore.QThread):
@@ -72,14 +74,21 @@ class ThreadPollInput(QtCore.QThread):
                 break
             ev = self.input_stream().poll(timeout=self.timeout)
             if ev>0:
-                try:
-                    pos, data = self.input_stream().recv(return_data=self.return_data)
-                except zmq.error.ContextTerminated:
-                    self.stop()
+                if not self._recv():
                     return
-                with self.lock:
-                    self._pos = pos
-                self.process_data(self._pos, data)
+    
+    def _recv(self):
+        # Receive one chunk and process it. Return False if the stream was
+        # closed by context termination.
+        try:
+            pos, data = self.input_stream().recv(return_data=self.return_data)
+        except zmq.error.ContextTerminated:
+            self.stop()
+            return False
+        with self.lock:
+            self._pos = pos
+        self.process_data(self._pos, data)
+        return True
     
     def process_data(self, pos, data):
         """This method is called from the polling thread when a new data chunk
@@ -123,6 +132,120 @@ class ThreadPollOutput(ThreadPollInput):
         ThreadPollInput.__init__(self, self.instream, **kargs)
 
 
+class ThreadPollMultiInput(QtCore.QThread):
+    """Thread that polls many InputStreams with a single zmq.Poller.
+    
+    Each stream is handled by a :class:`ThreadPollInput` (or subclass) that is
+    added to this thread instead of being started. When data is available on
+    a stream, this thread receives it and calls the ``process_data()`` method
+    of its ThreadPollInput, so existing pollers can be multiplexed without
+    modification. This avoids running one thread per stream in nodes with
+    many inputs.
+    
+    Usage::
+    
+        pollers = [ThreadPollInput(input, return_data=True) for input in inputs]
+        multi_poller = ThreadPollMultiInput(pollers)
+        multi_poller.start()
+        ...
+        multi_poller.stop()
+        multi_poller.wait()
+    
+    Parameters
+    ----------
+    pollers : list
+        ThreadPollInput instances (not started) to multiplex. More can be
+        added later with `add_poller()`.
+    timeout : int
+        Poll timeout in ms. The thread will unblock at this interval to check
+        for calls to `stop()`.
+    parent : QObject or None
+        QObject parent for the poller QThread.
+    
+    Streams whose transfer mode does not signal new data on the socket
+    (``transfermode='sharedmem_futex'``) cannot be multiplexed.
+    """
+    def __init__(self, pollers=(), timeout=200, parent=None):
+        QtCore.QThread.__init__(self, parent)
+        self.timeout = timeout
+        
+        self.running = False
+        self.running_lock = Mutex()
+        self.lock = Mutex()
+        self.pollers = []
+        self._changed = True
+        for poller in pollers:
+            self.add_poller(poller)
+        atexit.register(self.stop)
+    
+    def add_poller(self, poller):
+        """Add a ThreadPollInput to be polled by this thread.
+        """
+        input_stream = poller.input_stream()
+        if not input_stream.receiver.socket_notifies:
+            raise ValueError("Cannot multiplex InputStream with transfermode '%s'" %
+                             input_stream.params['transfermode'])
+        with self.lock:
+            self.pollers.append(poller)
+            self._changed = True
+    
+    def remove_poller(self, poller):
+        """Stop polling the stream of a ThreadPollInput.
+        """
+        with self.lock:
+            self.pollers.remove(poller)
+            self._changed = True
+    
+    def run(self):
+        with self.running_lock:
+            self.running = True
+        
+        sockets = {}
+        while True:
+            with self.running_lock:
+                if not self.running:
+                    break
+            with self.lock:
+                if self._changed:
+                    zpoller = zmq.Poller()
+                    sockets = {}
+                    for poller in self.pollers:
+                        input_stream = poller.input_stream()
+                        if input_stream is None:
+                            logging.info("ThreadPollMultiInput has lost InputStream")
+                            continue
+                        zpoller.register(input_stream.socket, zmq.POLLIN)
+                        sockets[input_stream.socket] = poller
+                    self._changed = False
+            if len(sockets) == 0:
+                time.sleep(self.timeout / 1000.)
+                continue
+            
+            try:
+                events = zpoller.poll(self.timeout)
+            except zmq.error.ContextTerminated:
+                self.stop()
+                return
+            for socket, ev in events:
+                poller = sockets[socket]
+                input_stream = poller.input_stream()
+                if input_stream is None:
+                    continue
+                # also process chunks that are already queued
+                while True:
+                    if not poller._recv():
+                        self.stop()
+                        return
+                    if not input_stream.poll(timeout=0):
+                        break
+    
+    def stop(self):
+        """Request the polling thread to stop.
+        """
+        with self.running_lock:
+            self.running = False
+
+
 class ThreadStreamConverter(ThreadPollInput):
     """Thread that polls for data on an input stream and converts the transfer
     mode or time axis of the data before relaying it through its output.
@@ -230,7 +353,10 @@ class ChannelSplitter(Node):
             output.configure(someotherspec)
         splitter.initialize()
         splitter.start()
-        
+    
+    For plaindata streams, ``InputStream.connect(output, channels=[...])``
+    receives a channel subset directly from the output, without the extra
+    thread and hop of this node.
     """
     _input_specs = {'in': {}}
     _output_specs = {}  # done dynamically in _configure
@@ -362,3 +488,298 @@ class ChunkResizer(Node):
         pass
 
 register_node_type(ChunkResizer)
+
+
+
+class StreamClock:
+    """Linear model of the acquisition time of the frames of a stream.
+    
+    Frame *i* is assumed to be acquired at ``offset + period * (i + 0.5)``,
+    i.e. a chunk is sent on average half a frame after its last frame was
+    acquired. *offset* and *period*
+    are fitted by least squares to the (index, time) pairs of the last
+    *fit_length* chunks, so that the drift of the device clock relative to the
+    local clock is followed. With a single chunk, the nominal *sample_rate*
+    is used as period.
+    """
+    def __init__(self, sample_rate, fit_length=50):
+        self.nominal_period = 1. / sample_rate
+        self.points = collections.deque(maxlen=fit_length)
+        self.offset = None
+        self.period = None
+    
+    def reset(self):
+        self.points.clear()
+        self.offset = None
+        self.period = None
+    
+    def add_chunk(self, index, t):
+        """Add the time *t* (local clock) of the chunk ending at *index*.
+        """
+        self.points.append((index, t))
+        indexes, times = np.array(self.points, dtype='float64').T
+        period = self.nominal_period
+        di = indexes - indexes.mean()
+        den = (di ** 2).sum()
+        if den > 0:
+            fit = (di * (times - times.mean())).sum() / den
+            if fit > 0:
+                period = fit
+        self.period = period
+        self.offset = times.mean() - period * indexes.mean()
+    
+    def time(self, index):
+        """Return the time of frame *index*.
+        """
+        return self.offset + self.period * (np.asarray(index) + .5)
+    
+    def index(self, t):
+        """Return the (fractional) frame index at time *t*.
+        """
+        return (np.asarray(t) - self.offset) / self.period - .5
+
+
+def interpolate_frames(buffer, positions, method='linear', first_index=0, fill=np.nan, dtype=None):
+    """Return the frames of a RingBuffer at fractional *positions*.
+    
+    *positions* must be increasing. With method='linear', frames are linearly
+    interpolated between their two neighbours; with 'nearest', the closest
+    frame is taken. Positions outside of the data available in the buffer
+    (and before *first_index*) are set to *fill*. The frames are read from a
+    single view of the buffer and interpolated with vectorized operations.
+    """
+    if dtype is None:
+        dtype = buffer.dtype
+    out = np.empty((len(positions),) + tuple(buffer.shape[1:]), dtype=dtype)
+    if method == 'nearest':
+        i0 = np.round(positions).astype('int64')
+        i1 = i0
+    elif method == 'linear':
+        i0 = np.floor(positions).astype('int64')
+        i1 = i0 + 1
+    else:
+        raise ValueError("Unsupported interpolation method '%s'" % method)
+    
+    valid = (i0 >= max(buffer.first_index(), first_index)) & (i1 < buffer.index())
+    out[~valid] = fill
+    if not np.any(valid):
+        return out
+    i0, i1 = i0[valid], i1[valid]
+    start = i0[0]
+    data = buffer.get_data(start, i1[-1] + 1)
+    a = data[i0 - start].astype(dtype)
+    if method == 'nearest':
+        out[valid] = a
+    else:
+        frac = (positions[valid] - i0).reshape((-1,) + (1,) * (data.ndim - 1))
+        b = data[i1 - start].astype(dtype)
+        out[valid] = a + (b - a) * frac
+    return out
+
+
+class ThreadPollSyncInput(ThreadPollInput):
+    """Poller of one input of a :class:`ThreadStreamSynchronizer`.
+    """
+    def __init__(self, input_stream, synchronizer, num, **kargs):
+        ThreadPollInput.__init__(self, input_stream, **kargs)
+        self.synchronizer = weakref.ref(synchronizer)
+        self.num = num
+    
+    def process_data(self, pos, data):
+        self.synchronizer().new_chunk(self.num, pos, data)
+
+
+class ThreadStreamSynchronizer(ThreadPollMultiInput):
+    """Thread that receives the inputs of a :class:`StreamSynchronizer` and
+    sends the resampled blocks on its outputs.
+    """
+    def __init__(self, inputs, outputs, sample_rate, chunksize, max_latency=None,
+                 method='linear', clock_offsets=None, fill=None, fit_length=50,
+                 timeout=200, parent=None):
+        ThreadPollMultiInput.__init__(self, timeout=timeout, parent=parent)
+        self.outputs = [weakref.ref(output) for output in outputs]
+        self.sample_rate = sample_rate
+        self.chunksize = chunksize
+        self.max_latency = max_latency
+        self.method = method
+        self.clock_offsets = clock_offsets or [0.] * len(inputs)
+        self.fill = fill
+        self.clocks = [StreamClock(input.params['sample_rate'], fit_length) for input in inputs]
+        for i, input in enumerate(inputs):
+            self.add_poller(ThreadPollSyncInput(input, self, i, timeout=timeout))
+        self.reset()
+    
+    def reset(self):
+        for clock in self.clocks:
+            clock.reset()
+        # index of the first received frame of each input
+        self.start_indexes = [None] * len(self.clocks)
+        # time of output frame 0, and number of output frames sent
+        self.t0 = None
+        self.sent = 0
+    
+    def new_chunk(self, num, pos, data=None):
+        input = self.pollers[num].input_stream()
+        t = input.receiver.last_timestamp
+        if t is None:
+            # no send timestamp (stats=False); use the receive time
+            t = stream_clock()
+        else:
+            t -= self.clock_offsets[num]
+        if self.start_indexes[num] is None:
+            # without data (sharedmem), all frames in the buffer are valid
+            self.start_indexes[num] = 0 if data is None else pos - data.shape[0]
+        self.clocks[num].add_chunk(pos, t)
+        self.send_blocks()
+    
+    def send_blocks(self):
+        if any(i is None for i in self.start_indexes):
+            return
+        clocks = self.clocks
+        inputs = [poller.input_stream() for poller in self.pollers]
+        if self.t0 is None:
+            # first time at which all inputs have data, with one frame of
+            # margin for later refinements of the clock fits
+            self.t0 = max(clock.time(i + 1) for clock, i in zip(clocks, self.start_indexes))
+        
+        # time up to which all inputs have data
+        covered = min(clock.time(input.buffer.index() - 1) for clock, input in zip(clocks, inputs))
+        if self.max_latency is None:
+            deadline = covered
+        else:
+            deadline = max(covered, stream_clock() - self.max_latency)
+        
+        times = np.arange(self.chunksize) / self.sample_rate
+        while self.t0 + (self.sent + self.chunksize - 1) / self.sample_rate <= deadline:
+            block_times = self.t0 + self.sent / self.sample_rate + times
+            self.sent += self.chunksize
+            for i, input in enumerate(inputs):
+                output = self.outputs[i]()
+                dtype = make_dtype(output.params['dtype'])
+                fill = self.fill
+                if fill is None:
+                    fill = np.nan if dtype.kind in 'fc' else 0
+                block = interpolate_frames(input.buffer, clocks[i].index(block_times), method=self.method,
+                                           first_index=self.start_indexes[i], fill=fill, dtype=dtype)
+                output.send(block, index=self.sent)
+
+
+class StreamSynchronizer(Node):
+    """
+    StreamSynchronizer aligns streams acquired at different rates (and
+    possibly on different hosts) and resamples them on a common clock.
+    
+    For each input, the relation between frame index and time is estimated
+    from the send time of the chunks (see :class:`StreamClock`). The
+    connected outputs must be configured with ``stats=True`` to embed the
+    send times; otherwise the receive time is used, which includes the
+    transmission jitter. Send times are measured with the clock of the sending
+    host: for inputs from another host, give the clock offset returned by
+    :func:`RPCClient.measure_clock_diff` for that host in *clock_offsets*.
+    
+    Output 'out<i>' carries input 'in<i>' resampled at *sample_rate*, in
+    blocks of *chunksize* frames. Frame *k* of all outputs corresponds to the
+    same time. Blocks are sent as soon as all inputs have data for them, or,
+    with *max_latency*, at the latest *max_latency* seconds after their end;
+    frames missing from a late input are then set to *fill*.
+    
+    Usage::
+    
+        sync = StreamSynchronizer()
+        sync.configure(nb_input=2, sample_rate=1000., chunksize=50)
+        sync.inputs['in0'].connect(eeg.output)
+        sync.inputs['in1'].connect(audio.output)
+        for output in sync.outputs.values():
+            output.configure()
+        sync.initialize()
+        sync.start()
+    
+    All inputs are received by a single thread, so transfermode='sharedmem_futex'
+    inputs are not supported.
+    """
+    _input_specs = {}  # done dynamically in _configure
+    _output_specs = {}
+    
+    def __init__(self, **kargs):
+        Node.__init__(self, **kargs)
+    
+    def _configure(self, nb_input=2, sample_rate=1000., chunksize=100, max_latency=None,
+                   method='linear', clock_offsets=None, fill=None, fit_length=50, buffer_duration=2.):
+        """
+        Params
+        -----------
+        nb_input: int
+            Number of inputs (and outputs).
+        sample_rate: float
+            Sample rate of the outputs.
+        chunksize: int
+            Number of frames per output chunk.
+        max_latency: float or None
+            Maximum delay (s) between the end of a block and its sending. If
+            None, blocks wait for all inputs.
+        method: 'linear' or 'nearest'
+            Interpolation method. 'linear' outputs have a floating point dtype.
+        clock_offsets: list or None
+            For each input, offset (s) of the clock of the sending host relative
+            to the local clock (remote - local).
+        fill: float or None
+            Value of the frames where an input has no data. The default is NaN
+            for floating point outputs and 0 otherwise.
+        fit_length: int
+            Number of chunks used to fit the index/time relation of each input.
+        buffer_duration: float
+            Duration (s) of the ring buffer of each input.
+        """
+        self.nb_input = nb_input
+        self.sample_rate = sample_rate
+        self.chunksize = chunksize
+        self.max_latency = max_latency
+        self.method = method
+        self.clock_offsets = clock_offsets
+        self.fill = fill
+        self.fit_length = fit_length
+        self.buffer_duration = buffer_duration
+        if clock_offsets is not None:
+            assert len(clock_offsets) == nb_input, 'clock_offsets must have one value per input'
+        self.inputs = OrderedDict()
+        self.outputs = OrderedDict()
+        for i in range(nb_input):
+            name = 'in%d' % i
+            self.inputs[name] = InputStream(node=self, name=name)
+            name = 'out%d' % i
+            self.outputs[name] = OutputStream(node=self, name=name)
+    
+    def after_input_connect(self, inputname):
+        params = self.inputs[inputname].params
+        dtype = make_dtype(params['dtype'])
+        if self.method == 'linear':
+            dtype = np.result_type(dtype, 'float32')
+        output = self.outputs['out' + inputname[2:]]
+        output.spec['dtype'] = dtype.str
+        output.spec['shape'] = (-1,) + tuple(params['shape'][1:])
+        output.spec['sample_rate'] = self.sample_rate
+        if 'channel_info' in params:
+            output.spec['channel_info'] = params['channel_info']
+    
+    def _initialize(self):
+        inputs = list(self.inputs.values())
+        for input in inputs:
+            size = max(int(self.buffer_duration * input.params['sample_rate']), 2)
+            input.set_buffer(size=size, double=True)
+        self.thread = ThreadStreamSynchronizer(inputs, list(self.outputs.values()), self.sample_rate,
+                                               self.chunksize, max_latency=self.max_latency, method=self.method,
+                                               clock_offsets=self.clock_offsets, fill=self.fill,
+                                               fit_length=self.fit_length)
+    
+    def _start(self):
+        self.thread.reset()
+        self.thread.start()
+
+    def _stop(self):
+        self.thread.stop()
+        self.thread.wait()
+    
+    def _close(self):
+        pass
+
+register_node_type(StreamSynchronizer)
@@ -7,7 +7,7 @@ import pyqtgraph as pg
 import numpy as np
 from pyqtgraph.util.mutex import Mutex
 
-from ..core import (Node, register_node_type, ThreadPollInput)
+from ..core import (Node, register_node_type, ThreadPollInput, ThreadPollMultiInput)
 
 
 
@@ -16,6 +16,8 @@ class ThreadPollInputUntilPosLimit(ThreadPollInput):
     Thread waiting a futur pos in a stream.
     """
     limit_reached = QtCore.pyqtSignal(int)
+    # all limits reached by a chunk, as an array
+    limits_reached = QtCore.pyqtSignal(object)
     def __init__(self,input_stream,  **kargs):
         ThreadPollInput.__init__(self, input_stream, **kargs)
         
@@ -36,9 +38,11 @@ class ThreadPollInputUntilPosLimit(ThreadPollInput):
     def process_data(self, pos, data):
         with self.limit_lock:
             if len(self.limit_indexes)==0: return
-            for limit_index in self.limit_indexes:
-                if pos>=limit_index:
-                    self.limit_reached.emit(limit_index)
+            reached = [limit_index for limit_index in self.limit_indexes if pos>=limit_index]
+            for limit_index in reached:
+                self.limit_reached.emit(limit_index)
+            if len(reached) > 0:
+                self.limits_reached.emit(np.array(reached, dtype='int64'))
             self.limit_indexes = [limit_index for limit_index in self.limit_indexes if pos<limit_index]
     
     
@@ -85,7 +89,7 @@ class TriggerAccumulator(Node,  QtCore.QObject):
         self.params = pg.parametertree.Parameter.create( name='Accumulator options',
                                                     type='group', children =self._default_params)
     
-    def _configure(self, max_stack_size = 10, max_xsize=2., events_dtype_field = None):
+    def _configure(self, max_stack_size = 10, max_xsize=2., events_dtype_field = None, single_thread=False):
         """
         Arguments
         ---------------
@@ -97,7 +101,9 @@ class TriggerAccumulator(Node,  QtCore.QObject):
             Standart dtype for 'events' input is 'int64',
             In case of complex dtype (ex : dtype = [('index', 'int64'), ('label', 'S12), ) ] you can precise which
             filed is the index.
-            
+        single_thread: bool
+            If True, poll the 'signals' and 'events' inputs from a single thread
+            (see ThreadPollMultiInput) instead of one thread each.
         
         """
         self.params.sigTreeStateChanged.connect(self.on_params_change)
@@ -105,6 +111,7 @@ class TriggerAccumulator(Node,  QtCore.QObject):
         self.events_dtype_field = events_dtype_field
         self.params.param('stack_size').setLimits([1, self.max_stack_size])
         self.max_xsize = max_xsize
+        self.single_thread = single_thread
     
     def after_input_connect(self, inputname):
         if inputname == 'signals':
@@ -125,20 +132,30 @@ class TriggerAccumulator(Node,  QtCore.QObject):
         self.trig_poller.new_data.connect(self.on_new_trig)
         
         self.limit_poller = ThreadPollInputUntilPosLimit(self.inputs['signals'])
-        self.limit_poller.limit_reached.connect(self.on_limit_reached)
+        self.limit_poller.limits_reached.connect(self.on_limits_reached)
+        
+        if self.single_thread:
+            self.multi_poller = ThreadPollMultiInput([self.trig_poller, self.limit_poller])
         
         self.wait_thread_list = []
         self.recreate_stack()
         
     def _start(self):
-        self.trig_poller.start()
-        self.limit_poller.start()
+        if self.single_thread:
+            self.multi_poller.start()
+        else:
+            self.trig_poller.start()
+            self.limit_poller.start()
 
     def _stop(self):
-        self.trig_poller.stop()
-        self.trig_poller.wait()
-        self.limit_poller.stop()
-        self.limit_poller.wait()
+        if self.single_thread:
+            self.multi_poller.stop()
+            self.multi_poller.wait()
+        else:
+            self.trig_poller.stop()
+            self.trig_poller.wait()
+            self.limit_poller.stop()
+            self.limit_poller.wait()
         
         for thread in self.wait_thread_list:
             thread.stop()
@@ -161,15 +178,23 @@ class TriggerAccumulator(Node,  QtCore.QObject):
                 self.limit_poller.append_limit(trig_index[ self.events_dtype_field]+self.limit2)
     
     def on_limit_reached(self, limit_index):
-        arr = self.inputs['signals'].get_data(limit_index-self.size, limit_index).transpose()
-        if arr is not None:
-            self.stack[self.stack_pos,:,:] = arr
-            
-            self.stack_pos +=1
-            self.stack_pos = self.stack_pos%self.params['stack_size']
-            self.total_trig += 1
-            
-            self.new_chunk.emit(self.total_trig)
+        self.on_limits_reached([limit_index])
+    
+    def on_limits_reached(self, limit_indexes):
+        stack_size = self.params['stack_size']
+        # only the last stack_size windows are kept
+        limit_indexes = np.asarray(limit_indexes)[-stack_size:]
+        n = limit_indexes.shape[0]
+        # (n, channel, time) view of (n, time, channel) windows
+        windows = self.inputs['signals'].get_windows(limit_indexes, self.size).transpose(0, 2, 1)
+        
+        pos = (self.stack_pos + np.arange(n)) % stack_size
+        self.stack[pos, :, :] = windows
+        
+        self.stack_pos = (self.stack_pos + n) % stack_size
+        self.total_trig += n
+        
+        self.new_chunk.emit(self.total_trig)
 
     def recreate_stack(self):
         self.limit1 = l1 = int(self.params['left_sweep']*self.sample_rate)
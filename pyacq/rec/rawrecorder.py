@@ -8,7 +8,7 @@ import logging
 import os
 import json
 
-from ..core import Node, register_node_type, ThreadPollInput, InputStream
+from ..core import Node, register_node_type, ThreadPollInput, ThreadPollMultiInput, InputStream
 from pyqtgraph.Qt import QtCore, QtGui
 from pyqtgraph.util.mutex import Mutex
 
@@ -21,6 +21,8 @@ class RawRecorder(Node):
     
     Implementation is simple, this launch one thread by stream.
     Each one pull data and write it directly into a file in binary format.
+    With ``single_thread=True``, all streams are polled from a single thread
+    instead (see :class:`ThreadPollMultiInput`).
     
     Usage:
     list_of_stream_to_record = [...]
@@ -35,9 +37,10 @@ class RawRecorder(Node):
     def __init__(self, **kargs):
         Node.__init__(self, **kargs)
     
-    def _configure(self, streams=[], autoconnect=True, dirname=None):
+    def _configure(self, streams=[], autoconnect=True, dirname=None, single_thread=False):
         self.streams = streams
         self.dirname = dirname
+        self.single_thread = single_thread
         
         assert not os.path.exists(dirname), 'dirname already exists'
         
@@ -85,19 +88,29 @@ class RawRecorder(Node):
         
         self._flush_stream_properties()
         
+        if self.single_thread:
+            self.multi_poller = ThreadPollMultiInput(self.threads)
+        
         self._annotations = {}
     
     def _start(self):
         for name, input in self.inputs.items():
             input.empty_queue()
         
-        for thread in self.threads:
-            thread.start()
+        if self.single_thread:
+            self.multi_poller.start()
+        else:
+            for thread in self.threads:
+                thread.start()
 
     def _stop(self):
-        for thread in self.threads:
-            thread.stop()
-            thread.wait()
+        if self.single_thread:
+            self.multi_poller.stop()
+            self.multi_poller.wait()
+        else:
+            for thread in self.threads:
+                thread.stop()
+                thread.wait()
         
         #test in any pending data in streams
         for i, (name, input) in enumerate(self.inputs.items()):
@@ -16,6 +16,7 @@ import pyqtgraph as pg
 
 import os
 import shutil
+import tempfile
 import datetime
 
 
@@ -38,9 +39,7 @@ def test_AviRecorder():
     dev.output.configure(protocol='tcp', interface='127.0.0.1',transfermode='plaindata',)
     dev.initialize()
 
-    dirname = './test_rec_avi'
-    if os.path.exists(dirname):
-        shutil.rmtree(dirname)
+    dirname = os.path.join(tempfile.mkdtemp(), 'test_rec_avi')
     
     rec = AviRecorder()
     #~ rec = ng0.create_node('AviRecorder')
@@ -82,6 +81,7 @@ def test_AviRecorder():
     timer2.start()
 
     app.exec_()
+    shutil.rmtree(os.path.dirname(dirname))
 
 
 
@@ -15,6 +15,7 @@ import pyqtgraph as pg
 
 import os
 import shutil
+import tempfile
 import datetime
 
 
@@ -55,9 +56,7 @@ def test_RawRecorder():
         devices.append(dev)
 
 
-    dirname = './test_rec'
-    if os.path.exists(dirname):
-        shutil.rmtree(dirname)
+    dirname = os.path.join(tempfile.mkdtemp(), 'test_rec')
     
     rec = RawRecorder()
     #~ rec = ng1.create_node('RawRecorder')
@@ -89,6 +88,7 @@ def test_RawRecorder():
     app.exec_()
 
     man.close()
+    shutil.rmtree(os.path.dirname(dirname))
 
 
 if __name__ == '__main__':
@@ -80,7 +80,7 @@ class QDigitalOscilloscope(QOscilloscope):
         QOscilloscope._initialize(self)
         self.params_controller.compute_rescale()
 
-    def get_visible_chunk(self, head=None, limit_to_head_0=True):
+    def get_visible_chunk(self, head=None, limit_to_head_0=True, out=None):
         if head is None:
             head = self._head
         if limit_to_head_0:
@@ -96,4 +96,7 @@ class QDigitalOscilloscope(QOscilloscope):
             mask = 1<<(chan%8)
             sigs[:, chan] =  (raw_bits[:,b] & mask)>0
         
+        if out is not None:
+            out[...] = sigs
+            return out
         return sigs
@@ -127,6 +127,7 @@ class BaseOscilloscope(WidgetNode):
         self.poller.new_data.connect(self._on_new_data)
         # timer
         self._head = 0
+        self._refresh_buffer = None
         self.timer = QtCore.QTimer(singleShot=False, interval=100)
         self.timer.timeout.connect(self.refresh)
 
@@ -396,6 +397,11 @@ default_by_channel_params = [
 class QOscilloscope(BaseOscilloscope):
     """
     Continuous, multi-channel oscilloscope based on Qt and pyqtgraph.
+    
+    With ``configure(use_pyramid=True)``, a :class:`MinMaxPyramid` of the input
+    is updated as data arrives, and the 'min_max' and 'mean' decimations are
+    read from it instead of being recomputed from the whole visible window at
+    each refresh (the automatic decimation is then a power of 2).
     """
     _input_specs = {'signals': dict(streamtype='signals')}
     
@@ -408,13 +414,17 @@ class QOscilloscope(BaseOscilloscope):
         BaseOscilloscope.__init__(self, **kargs)
         
 
-    def _configure(self, with_user_dialog=True, max_xsize = 60.):
+    def _configure(self, with_user_dialog=True, max_xsize = 60., use_pyramid=False):
         BaseOscilloscope._configure(self, with_user_dialog=with_user_dialog, max_xsize = max_xsize)
+        self.use_pyramid = use_pyramid
 
     def _initialize(self):
         
         BaseOscilloscope._initialize(self)
         
+        if self.use_pyramid:
+            self.inputs['signals'].set_pyramid(levels=16)
+        
         if self.params_controller is not None:
             self.viewBox.doubleclicked.connect(self.show_params_controller)
             self.viewBox.gain_zoom.connect(self.params_controller.apply_ygain_zoom)
@@ -452,27 +462,9 @@ class QOscilloscope(BaseOscilloscope):
             else:
                 head = head - head%decimate
         
-        full_arr = self.get_visible_chunk(head=head, limit_to_head_0=False).T
-        
-        full_arr = full_arr.astype(float)
-
-
-        
-        if decimate>1:
-            if self.params['decimation_method'] == 'pure_decimate':
-                small_arr = full_arr[:, ::decimate].copy()
-            elif self.params['decimation_method'] == 'min_max':
-                arr = full_arr.reshape(full_arr.shape[0], -1, decimate*2)
-                small_arr = np.empty((full_arr.shape[0], self.small_size), dtype=full_arr.dtype)
-                small_arr[:, ::2] = arr.max(axis=2)
-                small_arr[:, 1::2] = arr.min(axis=2)
-            elif self.params['decimation_method'] == 'mean':
-                arr = full_arr.reshape(full_arr.shape[0], -1, decimate)
-                small_arr = arr.mean(axis=2)
-            else:
-                raise(NotImplementedError)
-        else:
-            small_arr = full_arr.copy()
+        small_arr = self._get_pyramid_chunk(head, decimate)
+        if small_arr is None:
+            small_arr = self._get_decimated_chunk(head, decimate)
         
         # gain/offset
         small_arr[visibles, :] *= gains[visibles, None]
@@ -513,6 +505,56 @@ class QOscilloscope(BaseOscilloscope):
         self.plot.showAxis('left', self.params['show_left_axis'])
         self.plot.showAxis('bottom', self.params['show_bottom_axis'])
 
+    def _get_decimated_chunk(self, head, decimate):
+        # read directly into a reused float buffer (channels x time)
+        if self._refresh_buffer is None or self._refresh_buffer.shape != (self.nb_channel, self.full_size):
+            self._refresh_buffer = np.empty((self.nb_channel, self.full_size), dtype=float)
+        full_arr = self.get_visible_chunk(head=head, limit_to_head_0=False, out=self._refresh_buffer.T).T
+        
+        if decimate>1:
+            if self.params['decimation_method'] == 'pure_decimate':
+                small_arr = full_arr[:, ::decimate].copy()
+            elif self.params['decimation_method'] == 'min_max':
+                arr = full_arr.reshape(full_arr.shape[0], -1, decimate*2)
+                small_arr = np.empty((full_arr.shape[0], self.small_size), dtype=full_arr.dtype)
+                small_arr[:, ::2] = arr.max(axis=2)
+                small_arr[:, 1::2] = arr.min(axis=2)
+            elif self.params['decimation_method'] == 'mean':
+                arr = full_arr.reshape(full_arr.shape[0], -1, decimate)
+                small_arr = arr.mean(axis=2)
+            else:
+                raise(NotImplementedError)
+        else:
+            small_arr = full_arr.copy()
+        return small_arr
+    
+    def _get_pyramid_chunk(self, head, decimate):
+        # Return the decimated visible chunk read from the pyramid of the
+        # input, or None if the pyramid cannot provide this decimation.
+        pyramid = self.inputs['signals'].pyramid
+        method = self.params['decimation_method']
+        if pyramid is None or decimate <= 1 or method not in ('min_max', 'mean'):
+            return None
+        factor = decimate*2 if method == 'min_max' else decimate
+        level = pyramid.level_for(factor)
+        if 2**level != factor:
+            return None
+        
+        mins, maxs, means = pyramid.get_data(head-self.full_size, head, level)
+        if method == 'min_max':
+            small_arr = np.empty((self.nb_channel, self.small_size), dtype=float)
+            small_arr[:, ::2] = maxs.T
+            small_arr[:, 1::2] = mins.T
+        else:
+            small_arr = means.T.astype(float)
+        return small_arr
+    
+    def estimate_decimate(self, nb_point=4000):
+        BaseOscilloscope.estimate_decimate(self, nb_point=nb_point)
+        if self.inputs['signals'].pyramid is not None:
+            # a decimation that can be read from the pyramid
+            self.params['decimate'] = 2**int(np.log2(self.params['decimate']))
+    
     def on_param_change(self, params, changes):
         for param, change, data in changes:
             if change != 'value': continue
@@ -548,14 +590,14 @@ class QOscilloscope(BaseOscilloscope):
                 #~ p['offset'] = p['offset'] + self.all_mean[i]*p['gain'] - self.all_mean[i]*p['gain']*factor
             #~ p['gain'] = p['gain']*factor
     
-    def get_visible_chunk(self, head=None, limit_to_head_0=True):
+    def get_visible_chunk(self, head=None, limit_to_head_0=True, out=None):
         if head is None:
             head = self._head
         if limit_to_head_0:
             sigs = self.inputs['signals'].get_data(max(-1, head-self.full_size), head, copy=False, join=True) # this ensure having at least one sample
         else:
             # get signal even before head=0
-            sigs = self.inputs['signals'].get_data(head-self.full_size, head, copy=False, join=True)
+            sigs = self.inputs['signals'].get_data(head-self.full_size, head, copy=False, join=True, out=out)
         return sigs
         
     def auto_scale(self, spacing_factor=9.):
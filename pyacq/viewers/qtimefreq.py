@@ -14,7 +14,7 @@ import time
 from collections import OrderedDict
 
 from ..core import (WidgetNode, Node, register_node_type, InputStream, OutputStream,
-        ThreadPollInput, ThreadPollOutput, StreamConverter)
+        ThreadPollInput, ThreadPollOutput, ThreadPollMultiInput, StreamConverter)
 
 from .qoscilloscope import MyViewBox
 
@@ -119,11 +119,13 @@ class QTimeFreq(WidgetNode):
     def show_params_controller(self):
         self.params_controller.show()
     
-    def _configure(self, with_user_dialog=True, max_xsize=60., nodegroup_friends=None):
+    def _configure(self, with_user_dialog=True, max_xsize=60., nodegroup_friends=None, single_thread=False):
         self.with_user_dialog = with_user_dialog
         self.max_xsize = max_xsize
         self.nodegroup_friends = nodegroup_friends
         self.local_workers = self.nodegroup_friends is None
+        # poll the signal stream and the maps of remote workers from a single thread
+        self.single_thread = single_thread
         
     
     def _initialize(self, ):
@@ -184,6 +186,8 @@ class QTimeFreq(WidgetNode):
                 ng = self.nodegroup_friends[i%max(len(self.nodegroup_friends)-1, 1)]
                 worker = ng.create_node('TimeFreqWorker')
                 worker.ng_proxy = ng
+                # output params are read here and again by input_map.connect()
+                worker._set_proxy_options(cache_attrs=['output.params'])
             worker.configure(channel=i, local=self.local_workers)
             worker.input.connect(self.conv.output)
             if self.local_workers:
@@ -214,6 +218,12 @@ class QTimeFreq(WidgetNode):
                 poller.chan = i
                 self.map_pollers.append(poller)
         
+        if self.single_thread:
+            pollers = [self.global_poller]
+            if not self.local_workers:
+                pollers += self.map_pollers
+            self.multi_poller = ThreadPollMultiInput(pollers)
+        
         # This is used to diffred heavy action whena changing params (setting plots, compute wavelet, ...)
         # this avoid overload on CPU if multiple changes occurs in a short time
         self.mutex_action = Mutex()
@@ -248,22 +258,29 @@ class QTimeFreq(WidgetNode):
         self.initialize_plots()
     
     def _start(self):
-        self.global_poller.start()
+        if self.single_thread:
+            self.multi_poller.start()
+        else:
+            self.global_poller.start()
         self.global_timer.start()
         for worker in self.workers:
             worker.start()
-        if not self.local_workers:
+        if not self.local_workers and not self.single_thread:
             for i in range(self.nb_channel):
                 self.map_pollers[i].start()
         self.conv.start()
     
     def _stop(self):
         self.global_timer.stop()
-        self.global_poller.stop()
-        self.global_poller.wait()
+        if self.single_thread:
+            self.multi_poller.stop()
+            self.multi_poller.wait()
+        else:
+            self.global_poller.stop()
+            self.global_poller.wait()
         for worker in self.workers:
             worker.stop()
-        if not self.local_workers:
+        if not self.local_workers and not self.single_thread:
             for i in range(self.nb_channel):
                 self.map_pollers[i].stop()
                 self.map_pollers[i].wait()
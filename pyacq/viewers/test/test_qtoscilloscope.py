@@ -17,7 +17,7 @@ sample_rate = 10000.
 chunksize = 100
 
 
-def lauch_qoscilloscope(transfermode, axisorder):
+def lauch_qoscilloscope(transfermode, axisorder, use_pyramid=False):
     
     man = create_manager(auto_close_at_exit=False)
     ng = man.create_nodegroup()
@@ -45,7 +45,7 @@ def lauch_qoscilloscope(transfermode, axisorder):
 
     
     viewer = QOscilloscope()
-    viewer.configure(with_user_dialog=True)
+    viewer.configure(with_user_dialog=True, use_pyramid=use_pyramid)
     viewer.input.connect(dev.output)
     viewer.initialize()
     viewer.show()
@@ -86,6 +86,9 @@ def test_qoscilloscope3():
 def test_qoscilloscope4():
     lauch_qoscilloscope(transfermode='plaindata',axisorder=None)
 
+def test_qoscilloscope_pyramid():
+    lauch_qoscilloscope(transfermode='sharedmem', axisorder=[1, 0], use_pyramid=True)
+
 
   
 
@@ -94,4 +97,5 @@ if __name__ == '__main__':
     test_qoscilloscope2()
     test_qoscilloscope3()
     test_qoscilloscope4()
+    test_qoscilloscope_pyramid()
 